@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Async HTTP API for the HR Assistant.
+
+    POST /ask          {"question": "...", "category": null}  -> {"answer": "..."}
+    POST /ask/stream   {"question": "...", "category": null}  -> text/plain, streamed as generated
+    GET  /healthz      liveness + database/pool status
+    GET  /readyz       200 once the assistant is warmed up, 503 before
+    GET  /metrics      Prometheus text format: stage latencies, tokens, cache and pool stats
+
+Retrieval and LLM calls run in a bounded thread pool so they never block the
+event loop. Set LLM_BACKEND=stub to load-test without network access.
+
+Usage:
+    python api.py --host 0.0.0.0 --port 8000
+"""
+
+import os
+import time
+import asyncio
+import logging
+import argparse
+import contextlib
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+# Concurrent questions share one encoder call unless configured otherwise;
+# must be set before main is imported
+os.environ.setdefault("QUERY_BATCH_WAIT_MS", "5")
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+
+from main import get_assistant
+from db_utils import check_database_health
+from telemetry import REGISTRY
+
+# Questions processed at the same time; further requests wait for a slot
+MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "8"))
+# Seconds a request may take, waiting for a slot included
+REQUEST_TIMEOUT = float(os.getenv("API_REQUEST_TIMEOUT", "60"))
+# Seconds /healthz waits for the database check before reporting failure
+HEALTH_TIMEOUT = float(os.getenv("API_HEALTH_TIMEOUT", "5"))
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="assistant")
+# Health checks never queue behind questions
+_health_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="health")
+
+# Warm-up outcome, reported by /readyz
+_warmup = {"done": False, "error": None, "timings": {}}
+
+def _warm_up():
+    try:
+        _warmup["timings"] = get_assistant().warmup()
+        _warmup["done"] = True
+    except Exception as e:
+        logger.exception("Warm-up failed")
+        _warmup["error"] = str(e)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Warm up in the background: the server starts accepting (and /healthz
+    # answers) right away, /readyz flips once the model and database are ready
+    loop = asyncio.get_running_loop()
+    loop.run_in_executor(_executor, _warm_up)
+    yield
+
+app = FastAPI(title="HR Assistant API", lifespan=lifespan)
+
+_slots = asyncio.Semaphore(MAX_CONCURRENCY)
+
+# Marks the end of a streamed answer
+_END = object()
+
+# The assistant is resolved inside the worker: during warm-up get_assistant()
+# blocks until the model and database are ready, which must not stall the loop
+def _answer(question, category):
+    return get_assistant().ask(question, category)
+
+def _answer_stream(question, category):
+    yield from get_assistant().ask_stream(question, category)
+
+class AskRequest(BaseModel):
+    question: str
+    category: Optional[str] = None
+
+class AskResponse(BaseModel):
+    answer: str
+    elapsed_ms: float
+
+async def _acquire_slot(deadline):
+    try:
+        await asyncio.wait_for(_slots.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+
+def _on_done(future, callback):
+    """Run callback() once an executor call has really finished, even if the request gave up on it.
+
+    A timed-out request cannot stop its worker thread, so its slot is only
+    released here; otherwise new requests would queue behind abandoned calls.
+    """
+    def done(future):
+        if not future.cancelled():
+            # Retrieved so the error of an abandoned call is not logged as never retrieved
+            future.exception()
+        callback()
+    future.add_done_callback(done)
+
+def _close_stream(loop, stream, pending=None):
+    """Close an answer stream and release its slot, after the worker running it (if any) returns"""
+    if pending is not None:
+        _on_done(pending, lambda: _close_stream(loop, stream))
+        return
+    _on_done(loop.run_in_executor(_executor, stream.close), _slots.release)
+
+@app.post("/ask", response_model=AskResponse)
+async def ask(request: AskRequest):
+    start = time.monotonic()
+    deadline = start + REQUEST_TIMEOUT
+    await _acquire_slot(deadline)
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor, _answer, request.question, request.category)
+    _on_done(future, _slots.release)
+    try:
+        # Shielded: on timeout the call keeps its slot until the worker returns
+        answer = await asyncio.wait_for(asyncio.shield(future), timeout=max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out while answering")
+    return AskResponse(answer=answer, elapsed_ms=(time.monotonic() - start) * 1000.0)
+
+@app.post("/ask/stream")
+async def ask_stream(request: AskRequest):
+    deadline = time.monotonic() + REQUEST_TIMEOUT
+    loop = asyncio.get_running_loop()
+
+    async def chunks():
+        # The slot is taken inside the generator so it is always released,
+        # even if the client disconnects before the body starts
+        try:
+            await _acquire_slot(deadline)
+        except HTTPException:
+            yield "[Máy chủ đang bận, vui lòng thử lại]"
+            return
+        stream = _answer_stream(request.question, request.category)
+        pending = None
+        try:
+            while True:
+                pending = loop.run_in_executor(_executor, next, stream, _END)
+                chunk = await asyncio.wait_for(asyncio.shield(pending), timeout=max(0.0, deadline - time.monotonic()))
+                pending = None
+                if chunk is _END:
+                    break
+                yield chunk
+        except asyncio.TimeoutError:
+            yield "\n[Hết thời gian chờ]"
+        finally:
+            # The slot is released once the stream is closed, which waits for a running next()
+            _close_stream(loop, stream, pending)
+
+    return StreamingResponse(chunks(), media_type="text/plain; charset=utf-8")
+
+@app.get("/healthz")
+async def healthz():
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(_health_executor, check_database_health), timeout=HEALTH_TIMEOUT)
+    except asyncio.TimeoutError:
+        return JSONResponse(
+            status_code=503,
+            content={"ok": False, "error": f"Database check took longer than {HEALTH_TIMEOUT:.0f}s"},
+        )
+
+@app.get("/readyz")
+async def readyz():
+    status_code = 200 if _warmup["done"] else 503
+    return JSONResponse(status_code=status_code, content=_warmup)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HR Assistant HTTP API")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -1,5 +1,7 @@
 import streamlit as st
 from main import get_assistant
+from telemetry import last_trace
+import itertools
 import os
 
 # Thiết lập giao diện Streamlit
@@ -9,9 +11,30 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource(show_spinner="Đang khởi động trợ lý...")
+def load_assistant():
+    """Khởi tạo và chạy thử assistant một lần cho mỗi tiến trình"""
+    assistant = get_assistant()
+    assistant.warmup()
+    return assistant
+
+def show_debug_panel(trace):
+    """Chi tiết thời gian từng bước của câu trả lời gần nhất"""
+    with st.sidebar.expander("Chi tiết xử lý", expanded=True):
+        if not trace:
+            st.caption("Chưa có câu trả lời nào.")
+            return
+        st.caption(f"Mã truy vết: {trace['trace_id']} · {trace['outcome']}")
+        st.metric("Tổng thời gian", f"{trace['total_ms']:.0f} ms")
+        if trace["stages_ms"]:
+            st.bar_chart({"ms": trace["stages_ms"]})
+        details = {key: value for key, value in trace.items()
+                   if key not in ("trace_id", "name", "outcome", "total_ms", "stages_ms")}
+        st.json(details)
+
 def main():
     # Khởi tạo assistant
-    assistant = get_assistant()
+    assistant = load_assistant()
     
     # Header
     st.title("Trợ lý AI Phòng Nhân sự")
@@ -26,6 +49,7 @@ def main():
         "Chọn danh mục",
         ["Tất cả", "Tuyển dụng", "Onboarding", "Phúc lợi", "Đánh giá", "Quy định"]
     )
+    debug = st.sidebar.checkbox("Hiển thị chi tiết xử lý", value=os.getenv("APP_DEBUG_PANEL", "false").lower() == "true")
     
     # Chat container
     if "messages" not in st.session_state:
@@ -43,14 +67,22 @@ def main():
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Hiển thị đang xử lý
+        # Hiển thị câu trả lời dần dần khi LLM sinh token
         with st.chat_message("assistant"):
+            # "Tất cả" searches the whole collection
+            stream = assistant.ask_stream(prompt, category=None if category == "Tất cả" else category)
+            # Spinner only until the first token arrives
             with st.spinner("Đang suy nghĩ..."):
-                response = assistant.ask(prompt)
-                st.markdown(response)
+                first = next(stream, "")
+            response = st.write_stream(itertools.chain([first], stream))
         
         # Thêm câu trả lời vào lịch sử
         st.session_state.messages.append({"role": "assistant", "content": response})
+        # The stream ran on this script thread, so its trace is this thread's last one
+        st.session_state.last_trace = last_trace()
+    
+    if debug:
+        show_debug_panel(st.session_state.get("last_trace"))
 
 if __name__ == "__main__":
     main()
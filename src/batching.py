@@ -0,0 +1,86 @@
+import time
+import queue
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+class _PendingQuery:
+    __slots__ = ("text", "vector", "error", "done")
+
+    def __init__(self, text):
+        self.text = text
+        self.vector = None
+        self.error = None
+        self.done = threading.Event()
+
+class MicroBatchEmbeddings(Embeddings):
+    """Coalesces concurrent embed_query calls into one embed_documents call.
+
+    Callers from any thread enqueue their question and block; a background
+    worker waits up to max_wait_ms after the first request for more to arrive
+    (or until max_batch_size is reached) and encodes them together. For
+    all-MiniLM-L6-v2 query and document embeddings are computed the same way,
+    so batching does not change the vectors.
+    """
+
+    def __init__(self, embeddings, max_batch_size=32, max_wait_ms=5.0):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.queries = 0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                vectors = self.embeddings.embed_documents([item.text for item in batch])
+                for item, vector in zip(batch, vectors):
+                    item.vector = vector
+            except Exception as e:
+                for item in batch:
+                    item.error = e
+            finally:
+                self.batches += 1
+                self.queries += len(batch)
+                for item in batch:
+                    item.done.set()
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        self._ensure_worker()
+        item = _PendingQuery(text)
+        self._queue.put(item)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.vector
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": self.queries / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,902 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the HR Assistant storage and retrieval paths.
+Database subcommands work on throw-away collections with synthetic vectors, so
+no embedding model or API key is needed, only the PostgreSQL database.
+The corpus, ingest, retrieval and ask subcommands also run without network
+access: they use a synthetic HR corpus, fake embeddings, the stub LLM and,
+with --store memory, an in-process vector store instead of PostgreSQL.
+
+Usage:
+    python benchmark.py copy --rows 20000 --batch-size 1000
+    python benchmark.py index --rows 100000 --index-type hnsw --values 10,20,40,80,160
+    python benchmark.py embeddings --backends onnx,onnx-int8,int8 --chunks 2000
+    python benchmark.py filter --rows 200000
+    python benchmark.py storage --rows 100000 --modes vector,halfvec,binary
+    python benchmark.py corpus --output-dir /tmp/hr-corpus --documents 200
+    python benchmark.py ingest --documents 100 --skip-db
+    python benchmark.py extract --workers 1,2,4,8 --repeat 20
+    python benchmark.py retrieval --store local --sizes 1000,10000,100000
+    python benchmark.py --output results/ask.json ask --store memory --users 1,4,16
+
+Pass --output (before the subcommand) to save the results as JSON for
+comparing releases.
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import psycopg2
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from db_utils import (
+    init_database,
+    get_pgvector_store,
+    get_connection_string,
+    BulkVectorWriter,
+    create_vector_index,
+    create_metadata_index,
+    drop_vector_index,
+    get_storage_report,
+    apply_search_settings,
+    STORAGE_INDEX_NAMES,
+    to_vector_literal,
+    COLLECTION_NAME,
+)
+from dedup import ChunkDeduplicator
+from embedding_models import get_embeddings
+from extract import extract_pdfs
+from ingest import (
+    iter_documents,
+    iter_source_files,
+    is_pdf,
+    iter_document_chunks,
+    get_text_splitter,
+    load_documents,
+    process_documents,
+    CATEGORY_RULES,
+    DATA_PATH,
+)
+from llm import StubChatModel
+from local_store import LocalVectorStore
+from main import HRAssistant, OVERLOADED_MESSAGE
+
+# Categories assigned to synthetic chunks
+CATEGORIES = [category for category, _ in CATEGORY_RULES]
+
+# Typical employee questions used as retrieval queries
+SAMPLE_QUESTIONS = [
+    "Chính sách nghỉ phép của công ty là gì?",
+    "Nhân viên được bao nhiêu ngày phép năm?",
+    "Quy trình tuyển dụng gồm những bước nào?",
+    "Thời gian thử việc kéo dài bao lâu?",
+    "Công ty có những phúc lợi bảo hiểm nào?",
+    "Làm thế nào để đăng ký làm thêm giờ?",
+    "Tiêu chí đánh giá hiệu suất cuối năm là gì?",
+    "Nhân viên mới cần chuẩn bị gì cho ngày onboarding?",
+    "Quy định về trang phục công sở như thế nào?",
+    "Chế độ thai sản được hưởng ra sao?",
+]
+
+# Dimension of all-MiniLM-L6-v2 embeddings
+EMBEDDING_DIM = 384
+
+# Sentence templates of the synthetic HR corpus, per category
+CORPUS_TEMPLATES = {
+    "Tuyển dụng": [
+        "Ứng viên nộp hồ sơ dự tuyển theo mẫu TD-{code} trước ngày {day} hằng tháng.",
+        "Vòng phỏng vấn thứ {n} do trưởng bộ phận và phòng nhân sự cùng thực hiện.",
+        "Thời gian thử việc đối với nhân sự cấp {n} là {days} ngày làm việc.",
+        "Kết quả tuyển dụng được thông báo cho ứng viên trong vòng {n} ngày sau phỏng vấn.",
+    ],
+    "Onboarding": [
+        "Nhân viên mới nhận máy tính và thẻ ra vào trong ngày làm việc đầu tiên.",
+        "Chương trình hội nhập kéo dài {days} ngày, gồm {n} buổi đào tạo văn hoá công ty.",
+        "Người hướng dẫn (buddy) hỗ trợ nhân viên mới trong {n} tuần đầu tiên.",
+        "Nhân viên mới hoàn thành biểu mẫu OB-{code} để đăng ký tài khoản nội bộ.",
+    ],
+    "Phúc lợi": [
+        "Nhân viên chính thức được nghỉ phép năm {days} ngày, cộng thêm {n} ngày mỗi năm thâm niên.",
+        "Bảo hiểm sức khoẻ chi trả {percent}% chi phí khám chữa bệnh nội trú.",
+        "Lương tháng 13 được chi trả trước Tết Nguyên đán theo quyết định PL-{code}.",
+        "Chế độ thai sản áp dụng theo Luật Bảo hiểm xã hội và quy chế phúc lợi của công ty.",
+    ],
+    "Đánh giá": [
+        "Đánh giá hiệu suất được thực hiện {n} lần mỗi năm dựa trên KPI đã thống nhất.",
+        "Nhân viên đạt mức xuất sắc được thưởng thêm {percent}% lương cơ bản.",
+        "Kết quả đánh giá được ghi vào biểu mẫu DG-{code} và lưu trong hồ sơ nhân sự.",
+        "Quản lý trực tiếp trao đổi kết quả đánh giá với nhân viên trong vòng {n} tuần.",
+    ],
+    "Quy định": [
+        "Giờ làm việc bắt đầu lúc {n} giờ sáng, từ thứ Hai đến thứ Sáu.",
+        "Đăng ký làm thêm giờ qua mẫu QD-{code} và được trưởng bộ phận phê duyệt.",
+        "Nhân viên đi muộn quá {n} lần trong tháng sẽ bị nhắc nhở bằng văn bản.",
+        "Trang phục công sở được áp dụng trong các buổi làm việc với khách hàng.",
+    ],
+}
+
+# File name prefix per category, so that ingest categorizes the synthetic files
+CORPUS_FILE_PREFIXES = {
+    "Tuyển dụng": "tuyen-dung",
+    "Onboarding": "onboarding",
+    "Phúc lợi": "phuc-loi",
+    "Đánh giá": "danh-gia",
+    "Quy định": "quy-dinh",
+}
+
+def random_unit_vectors(count, dim=EMBEDDING_DIM, rng=None):
+    """Random L2-normalised float32 vectors"""
+    rng = rng or np.random.default_rng(0)
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def synthetic_batches(rows, batch_size, dim=EMBEDDING_DIM, seed=0):
+    """Yield (texts, vectors, metadatas, ids) batches of synthetic chunks"""
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, batch_size):
+        count = min(batch_size, rows - start)
+        texts = [f"Đoạn tài liệu tổng hợp số {start + i}: quy định nhân sự\tvà phúc lợi." for i in range(count)]
+        metadatas = [
+            {"source": f"synthetic/{(start + i) // 50}.txt", "row": start + i, "category": CATEGORIES[(start + i) // 50 % len(CATEGORIES)]}
+            for i in range(count)
+        ]
+        ids = [str(uuid.uuid4()) for _ in range(count)]
+        yield texts, random_unit_vectors(count, dim, rng).tolist(), metadatas, ids
+
+def synthetic_documents(documents, pages=4, sentences_per_page=25, seed=0):
+    """Yield (file_name, text) of synthetic HR documents; pages are separated by form feeds like pdfminer output"""
+    rng = np.random.default_rng(seed)
+    for number in range(documents):
+        category = CATEGORIES[number % len(CATEGORIES)]
+        templates = CORPUS_TEMPLATES[category]
+        page_texts = []
+        for _ in range(pages):
+            sentences = [
+                templates[rng.integers(len(templates))].format(
+                    code=f"{rng.integers(1, 100):02d}",
+                    day=rng.integers(1, 29),
+                    n=rng.integers(1, 10),
+                    days=rng.integers(5, 61),
+                    percent=rng.integers(5, 101),
+                )
+                for _ in range(sentences_per_page)
+            ]
+            paragraphs = [" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+            page_texts.append("\n\n".join(paragraphs))
+        yield f"{CORPUS_FILE_PREFIXES[category]}-{number:04d}.txt", "\f".join(page_texts)
+
+def generate_corpus(output_dir, documents=50, pages=4, seed=0):
+    """Write a synthetic HR corpus of .txt files into output_dir"""
+    os.makedirs(output_dir, exist_ok=True)
+    total_bytes = 0
+    for file_name, content in synthetic_documents(documents, pages, seed=seed):
+        with open(os.path.join(output_dir, file_name), "w", encoding="utf-8") as f:
+            total_bytes += f.write(content)
+    return {"documents": documents, "pages": documents * pages, "characters": total_bytes}
+
+def count_pages(documents):
+    """Pages in loaded documents: pdfminer and the synthetic corpus separate pages with form feeds"""
+    return sum(document.page_content.rstrip().count("\f") + 1 for document in documents)
+
+def synthetic_chunks(documents, pages=4, seed=0):
+    """Chunk texts and metadata of the synthetic corpus, split like the ingest pipeline"""
+    splitter = get_text_splitter()
+    texts, metadatas = [], []
+    for number, (file_name, content) in enumerate(synthetic_documents(documents, pages, seed=seed)):
+        category = CATEGORIES[number % len(CATEGORIES)]
+        for chunk in splitter.split_text(content):
+            texts.append(chunk)
+            metadatas.append({"source": file_name, "category": category})
+    return texts, metadatas
+
+def temporary_store(prefix, dim=EMBEDDING_DIM):
+    """Create a throw-away collection; callers must delete it"""
+    collection_name = f"bench_{prefix}_{uuid.uuid4().hex[:8]}"
+    return get_pgvector_store(collection_name=collection_name, embedding_function=FakeEmbeddings(size=dim))
+
+def bench_copy(args):
+    """Insert throughput of PGVector.add_embeddings vs BulkVectorWriter"""
+    init_database()
+    results = {}
+
+    for method in ("add_embeddings", "copy"):
+        store = temporary_store(method)
+        try:
+            start = time.perf_counter()
+            if method == "add_embeddings":
+                for texts, vectors, metadatas, ids in synthetic_batches(args.rows, args.batch_size):
+                    store.add_embeddings(texts=texts, embeddings=vectors, metadatas=metadatas, ids=ids)
+            else:
+                with BulkVectorWriter(store.collection_name, defer_indexes=args.defer_indexes) as writer:
+                    for texts, vectors, metadatas, ids in synthetic_batches(args.rows, args.batch_size):
+                        writer.write(texts, vectors, metadatas, ids)
+            elapsed = time.perf_counter() - start
+        finally:
+            store.delete_collection()
+
+        results[method] = {"seconds": elapsed, "rows_per_second": args.rows / elapsed}
+        print(f"{method:>15}: {args.rows} rows in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/s)")
+
+    speedup = results["add_embeddings"]["seconds"] / results["copy"]["seconds"]
+    print(f"COPY speedup: {speedup:.1f}x")
+    results["speedup"] = speedup
+    return results
+
+def percentiles(samples):
+    """p50/p95/p99 of a list of latencies in seconds, reported in milliseconds"""
+    values = np.asarray(samples) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+def get_collection_id(cursor, collection_name):
+    cursor.execute("SELECT uuid FROM langchain_pg_collection WHERE name = %s", (collection_name,))
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError(f"Collection {collection_name} not found")
+    return str(row[0])
+
+def sample_queries(cursor, collection_id, count, noise=0.05, seed=0):
+    """Stored embeddings plus a little noise, as stand-ins for real questions"""
+    cursor.execute(
+        "SELECT embedding::text FROM langchain_pg_embedding WHERE collection_id = %s ORDER BY random() LIMIT %s",
+        (collection_id, count),
+    )
+    vectors = np.array([np.array(row[0].strip("[]").split(","), dtype=np.float32) for row in cursor.fetchall()])
+    rng = np.random.default_rng(seed)
+    vectors += rng.standard_normal(vectors.shape).astype(np.float32) * noise
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def top_k(cursor, collection_id, query, k):
+    """Same ordering as PGVector's cosine similarity search; returns ids and latency"""
+    start = time.perf_counter()
+    cursor.execute(
+        """
+        SELECT custom_id FROM langchain_pg_embedding
+        WHERE collection_id = %s
+        ORDER BY embedding <=> %s::vector
+        LIMIT %s
+        """,
+        (collection_id, to_vector_literal(query), k),
+    )
+    ids = [row[0] for row in cursor.fetchall()]
+    return ids, time.perf_counter() - start
+
+def bench_index(args):
+    """Recall@k and latency of the ANN index for a range of ef_search/probes values.
+
+    The index covers the whole embedding table, so --rebuild on a live
+    database rebuilds the production index too; run it on a copy.
+    """
+    init_database()
+    store = None
+    collection_name = args.collection
+
+    if args.rows:
+        store = temporary_store("index")
+        collection_name = store.collection_name
+        with BulkVectorWriter(collection_name) as writer:
+            for texts, vectors, metadatas, ids in synthetic_batches(args.rows, 5000):
+                writer.write(texts, vectors, metadatas, ids)
+        print(f"Loaded {args.rows} synthetic rows into {collection_name}")
+
+    try:
+        info = create_vector_index(
+            method=args.index_type,
+            m=args.hnsw_m,
+            ef_construction=args.hnsw_ef_construction,
+            lists=args.ivfflat_lists,
+            rebuild=args.rebuild,
+        )
+        print(f"Index {info['name']}: {info['size_bytes'] / 2**20:.1f} MiB, built in {info['build_seconds']:.1f}s")
+
+        conn = psycopg2.connect(get_connection_string())
+        try:
+            with conn.cursor() as cursor:
+                collection_id = get_collection_id(cursor, collection_name)
+                queries = sample_queries(cursor, collection_id, args.queries)
+
+                # Ground truth from an exact sequential scan
+                cursor.execute("SET enable_indexscan = off")
+                exact = [top_k(cursor, collection_id, query, args.k)[0] for query in queries]
+                cursor.execute("SET enable_indexscan = on")
+
+                knob = "ef_search" if args.index_type == "hnsw" else "probes"
+                values = [int(v) for v in args.values.split(",")]
+                report = []
+                print(f"{knob:>10} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+                for value in values:
+                    if knob == "ef_search":
+                        apply_search_settings(cursor, ef_search=value)
+                    else:
+                        apply_search_settings(cursor, probes=value)
+                    latencies = []
+                    hits = 0
+                    for query, truth in zip(queries, exact):
+                        ids, latency = top_k(cursor, collection_id, query, args.k)
+                        latencies.append(latency)
+                        hits += len(set(ids) & set(truth))
+                    row = {knob: value, "recall": hits / (len(queries) * args.k), **percentiles(latencies)}
+                    report.append(row)
+                    print(f"{value:>10} {row['recall']:>10.3f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+        finally:
+            conn.close()
+    finally:
+        if store is not None:
+            store.delete_collection()
+
+    return {"index": info, "results": report}
+
+def load_corpus_texts(limit, data_path=DATA_PATH):
+    """Chunk texts of the documents in data/, split like the ingest pipeline"""
+    splitter = get_text_splitter()
+    texts = []
+    for document in iter_documents(data_path):
+        texts.extend(chunk.page_content for chunk in splitter.split_documents([document]))
+        if len(texts) >= limit:
+            break
+    return texts[:limit]
+
+def _normalized(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def bench_embeddings(args):
+    """Throughput of each embedding backend and its retrieval agreement with fp32 PyTorch"""
+    texts = load_corpus_texts(args.chunks, args.data_path)
+    if not texts:
+        print(f"No documents found in {args.data_path}, using the synthetic corpus")
+        texts, _ = synthetic_chunks(max(1, args.chunks // 15))
+        texts = texts[:args.chunks]
+    rng = np.random.default_rng(0)
+    # Real questions plus the opening words of random chunks
+    queries = SAMPLE_QUESTIONS + [
+        " ".join(texts[i].split()[:12]) for i in rng.choice(len(texts), size=min(args.queries, len(texts)), replace=False)
+    ]
+
+    reference = None
+    report = {}
+    print(f"{'backend':>10} {'chunks/s':>10} {'query p50 ms':>13} {f'top-{args.k} agree':>12} {'cosine':>8}")
+    for backend in ["torch"] + [b for b in args.backends.split(",") if b and b != "torch"]:
+        model = get_embeddings(backend=backend, batch_size=args.batch_size, threads=args.threads)
+        model.embed_documents(texts[:8])
+
+        start = time.perf_counter()
+        documents = _normalized(model.embed_documents(texts))
+        chunks_per_second = len(texts) / (time.perf_counter() - start)
+
+        latencies = []
+        query_vectors = []
+        for query in queries:
+            query_start = time.perf_counter()
+            query_vectors.append(model.embed_query(query))
+            latencies.append(time.perf_counter() - query_start)
+        query_vectors = _normalized(query_vectors)
+
+        top = np.argsort(-(query_vectors @ documents.T), axis=1)[:, :args.k]
+        row = {"chunks_per_second": chunks_per_second, **percentiles(latencies)}
+        if reference is None:
+            reference = (documents, top)
+            row.update(agreement=1.0, cosine=1.0)
+        else:
+            row["agreement"] = float(np.mean([len(set(a) & set(b)) / args.k for a, b in zip(top, reference[1])]))
+            row["cosine"] = float(np.mean(np.sum(documents * reference[0], axis=1)))
+        report[backend] = row
+        print(f"{backend:>10} {chunks_per_second:>10.1f} {row['p50_ms']:>13.2f} {row['agreement']:>12.3f} {row['cosine']:>8.4f}")
+
+    return report
+
+def bench_filter(args):
+    """Category-filtered search inside SQL vs unfiltered search and filtering the results afterwards"""
+    init_database()
+    store = temporary_store("filter")
+    try:
+        with BulkVectorWriter(store.collection_name) as writer:
+            for texts, vectors, metadatas, ids in synthetic_batches(args.rows, 5000):
+                writer.write(texts, vectors, metadatas, ids)
+        create_metadata_index("category")
+        print(f"Loaded {args.rows} synthetic rows across {len(CATEGORIES)} categories")
+
+        conn = psycopg2.connect(get_connection_string())
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("ANALYZE langchain_pg_embedding")
+                collection_id = get_collection_id(cursor, store.collection_name)
+                queries = random_unit_vectors(args.queries, rng=np.random.default_rng(1))
+                categories = [CATEGORIES[i % len(CATEGORIES)] for i in range(args.queries)]
+
+                def run(sql, params):
+                    start = time.perf_counter()
+                    cursor.execute(sql, params)
+                    rows = cursor.fetchall()
+                    return rows, time.perf_counter() - start
+
+                base_sql = (
+                    "SELECT custom_id, cmetadata ->> 'category' FROM langchain_pg_embedding "
+                    "WHERE collection_id = %s {where} ORDER BY embedding <=> %s::vector LIMIT %s"
+                )
+                modes = {"unfiltered": [], "filtered_in_sql": [], "post_filtered": []}
+                post_filter_short = 0
+                for query, category in zip(queries, categories):
+                    literal = to_vector_literal(query)
+                    _, latency = run(base_sql.format(where=""), (collection_id, literal, args.k))
+                    modes["unfiltered"].append(latency)
+
+                    _, latency = run(
+                        base_sql.format(where="AND cmetadata ->> 'category' = %s"),
+                        (collection_id, category, literal, args.k),
+                    )
+                    modes["filtered_in_sql"].append(latency)
+
+                    # Old approach: search everything, then drop other categories
+                    rows, latency = run(base_sql.format(where=""), (collection_id, literal, args.k * args.overfetch))
+                    modes["post_filtered"].append(latency)
+                    if len([row for row in rows if row[1] == category]) < args.k:
+                        post_filter_short += 1
+        finally:
+            conn.close()
+    finally:
+        store.delete_collection()
+
+    report = {mode: percentiles(latencies) for mode, latencies in modes.items()}
+    report["post_filtered"]["queries_short_of_k"] = post_filter_short
+    for mode, row in report.items():
+        print(f"{mode:>16}: p50 {row['p50_ms']:.2f} ms, p95 {row['p95_ms']:.2f} ms, p99 {row['p99_ms']:.2f} ms")
+    print(f"Post-filtering returned fewer than {args.k} results for {post_filter_short}/{args.queries} queries")
+    return report
+
+# Top-k query per storage mode; the expressions match the indexes of create_vector_index(storage=...)
+STORAGE_QUERIES = {
+    "vector": (
+        "SELECT custom_id FROM langchain_pg_embedding WHERE collection_id = %(collection_id)s "
+        "ORDER BY embedding <=> %(query)s::vector LIMIT %(k)s"
+    ),
+    "halfvec": (
+        "SELECT custom_id FROM langchain_pg_embedding WHERE collection_id = %(collection_id)s "
+        "ORDER BY embedding::halfvec({dim}) <=> %(query)s::halfvec({dim}) LIMIT %(k)s"
+    ),
+    "binary": (
+        "SELECT custom_id FROM ("
+        "SELECT custom_id, embedding FROM langchain_pg_embedding WHERE collection_id = %(collection_id)s "
+        "ORDER BY binary_quantize(embedding)::bit({dim}) <~> binary_quantize(%(query)s::vector({dim})) "
+        "LIMIT %(shortlist)s) shortlist "
+        "ORDER BY embedding <=> %(query)s::vector LIMIT %(k)s"
+    ),
+}
+
+def bench_storage(args):
+    """Index size, build time, latency and recall@k of the float32, halfvec and binary storage modes.
+
+    Like the index benchmark, the indexes cover the whole embedding table;
+    run it on a copy of a production database.
+    """
+    init_database()
+    store = None
+    collection_name = args.collection
+    if args.rows:
+        store = temporary_store("storage")
+        collection_name = store.collection_name
+        with BulkVectorWriter(collection_name) as writer:
+            for texts, vectors, metadatas, ids in synthetic_batches(args.rows, 5000):
+                writer.write(texts, vectors, metadatas, ids)
+        print(f"Loaded {args.rows} synthetic rows into {collection_name}")
+
+    modes = [mode for mode in args.modes.split(",") if mode]
+    report = {"modes": {}}
+    conn = psycopg2.connect(get_connection_string())
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE langchain_pg_embedding")
+            collection_id = get_collection_id(cursor, collection_name)
+            queries = sample_queries(cursor, collection_id, args.queries)
+            dim = queries.shape[1]
+
+            # Ground truth from an exact sequential scan over the float32 vectors
+            cursor.execute("SET enable_indexscan = off")
+            exact = [top_k(cursor, collection_id, query, args.k)[0] for query in queries]
+            cursor.execute("SET enable_indexscan = on")
+            apply_search_settings(cursor, ef_search=max(args.ef_search, args.shortlist))
+
+            print(f"{'mode':>8} {'index MiB':>10} {'build s':>8} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+            for mode in modes:
+                info = create_vector_index(
+                    storage=mode, m=args.hnsw_m, ef_construction=args.hnsw_ef_construction, rebuild=args.rebuild
+                )
+                sql = STORAGE_QUERIES[mode].format(dim=dim)
+                latencies = []
+                hits = 0
+                for query, truth in zip(queries, exact):
+                    params = {
+                        "collection_id": collection_id,
+                        "query": to_vector_literal(query),
+                        "k": args.k,
+                        "shortlist": max(args.shortlist, args.k),
+                    }
+                    start = time.perf_counter()
+                    cursor.execute(sql, params)
+                    ids = [row[0] for row in cursor.fetchall()]
+                    latencies.append(time.perf_counter() - start)
+                    hits += len(set(ids) & set(truth))
+                row = {
+                    "index_bytes": info["size_bytes"],
+                    "build_seconds": info["build_seconds"],
+                    "recall": hits / (len(queries) * args.k),
+                    **percentiles(latencies),
+                }
+                report["modes"][mode] = row
+                print(f"{mode:>8} {row['index_bytes'] / 2**20:>10.1f} {row['build_seconds']:>8.1f} {row['recall']:>10.3f} "
+                      f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+
+        if "vector" in report["modes"]:
+            full = report["modes"]["vector"]["index_bytes"]
+            for mode, row in report["modes"].items():
+                row["index_size_ratio"] = full / row["index_bytes"] if row["index_bytes"] else None
+        report["storage"] = get_storage_report()
+    finally:
+        conn.close()
+        if store is not None:
+            store.delete_collection()
+        if args.drop_indexes:
+            for mode in modes:
+                if mode != "vector":
+                    drop_vector_index(STORAGE_INDEX_NAMES[mode])
+    return report
+
+def bench_corpus(args):
+    """Write the synthetic HR corpus to a directory, e.g. to ingest it with ingest.py"""
+    report = generate_corpus(args.output_dir, args.documents, args.pages, seed=args.seed)
+    print(f"Wrote {report['documents']} documents ({report['pages']} pages) to {args.output_dir}")
+    return report
+
+def bench_extract(args):
+    """PDF text extraction pages/s per worker count, and a re-run served from the extraction cache"""
+    data_path = args.data_path or DATA_PATH
+    pdfs = [path for path in iter_source_files(data_path) if is_pdf(path)]
+    if not pdfs:
+        raise SystemExit(f"No PDF files under {data_path}")
+    # Repeating the list gives the pool enough files without shipping a large corpus
+    paths = pdfs * args.repeat
+    report = {"files": len(paths), "pages_per_task": args.pages_per_task, "runs": []}
+
+    print(f"{len(paths)} files ({len(pdfs)} distinct), {args.pages_per_task} pages per task")
+    print(f"{'workers':>8} {'seconds':>8} {'pages':>6} {'pages/s':>8} {'speedup':>8}")
+    baseline = None
+    for workers in sorted(int(value) for value in args.workers.split(",")):
+        stats = {}
+        start = time.perf_counter()
+        for _ in extract_pdfs(paths, workers=workers, use_cache=False, pages_per_task=args.pages_per_task, stats=stats):
+            pass
+        seconds = time.perf_counter() - start
+        rate = stats["pages"] / seconds
+        baseline = baseline or rate
+        run = {"workers": workers, "seconds": seconds, "pages": stats["pages"], "pages_per_second": rate,
+               "speedup": rate / baseline}
+        report["runs"].append(run)
+        print(f"{workers:>8} {seconds:>8.2f} {stats['pages']:>6} {rate:>8.1f} {run['speedup']:>7.2f}x")
+
+    with tempfile.TemporaryDirectory(prefix="hr-extracted-") as cache_dir:
+        for _ in extract_pdfs(pdfs, workers=1, cache_dir=cache_dir):
+            pass
+        stats = {}
+        start = time.perf_counter()
+        for _ in extract_pdfs(paths, workers=1, cache_dir=cache_dir, stats=stats):
+            pass
+        seconds = time.perf_counter() - start
+    report["cached"] = {"seconds": seconds, "pages_per_second": stats["pages"] / seconds, **stats}
+    print(f"  cached {seconds:>8.2f} {stats['pages']:>6} {stats['pages'] / seconds:>8.1f}")
+    return report
+
+def bench_ingest(args):
+    """Throughput of load_documents, chunk splitting, dedup and process_documents on a corpus"""
+    with tempfile.TemporaryDirectory(prefix="hr-corpus-") as tmp:
+        data_path = args.data_path
+        if not data_path:
+            data_path = tmp
+            generate_corpus(data_path, args.documents, args.pages)
+
+        start = time.perf_counter()
+        documents = load_documents(data_path)
+        load_seconds = time.perf_counter() - start
+        pages = count_pages(documents)
+
+        start = time.perf_counter()
+        chunks = sum(1 for _ in iter_document_chunks(documents))
+        split_seconds = time.perf_counter() - start
+
+        deduplicator = ChunkDeduplicator()
+        start = time.perf_counter()
+        for _ in deduplicator.filter(iter_document_chunks(documents)):
+            pass
+        dedup_seconds = time.perf_counter() - start - split_seconds
+
+    report = {
+        "documents": len(documents),
+        "pages": pages,
+        "chunks": chunks,
+        "load": {"seconds": load_seconds, "pages_per_second": pages / load_seconds},
+        "split": {"seconds": split_seconds, "chunks_per_second": chunks / split_seconds},
+        "dedup": {"seconds": max(dedup_seconds, 0.0), **deduplicator.stats()},
+    }
+    print(f"load_documents: {pages} pages in {load_seconds:.2f}s ({pages / load_seconds:,.1f} pages/s)")
+    print(f"         split: {chunks} chunks in {split_seconds:.2f}s ({chunks / split_seconds:,.0f} chunks/s)")
+    print(f"         dedup: {len(deduplicator.matches)} near-duplicates of {chunks} chunks "
+          f"(+{max(dedup_seconds, 0.0):.2f}s over splitting)")
+
+    if not args.skip_db:
+        embeddings = FakeEmbeddings(size=EMBEDDING_DIM) if args.embeddings == "fake" else get_embeddings()
+        collection_name = f"bench_ingest_{uuid.uuid4().hex[:8]}"
+        start = time.perf_counter()
+        try:
+            process_documents(documents, collection_name=collection_name, writer=args.writer, embeddings=embeddings,
+                              dedup=not args.no_dedup)
+            seconds = time.perf_counter() - start
+        finally:
+            temporary = get_pgvector_store(collection_name=collection_name, embedding_function=embeddings)
+            temporary.delete_collection()
+        report["process"] = {
+            "seconds": seconds,
+            "pages_per_second": pages / seconds,
+            "chunks_per_second": chunks / seconds,
+            "embeddings": args.embeddings,
+            "writer": args.writer,
+            "dedup": not args.no_dedup,
+        }
+        print(f"process_documents ({args.embeddings} embeddings, {args.writer}): {seconds:.2f}s "
+              f"({pages / seconds:,.1f} pages/s, {chunks / seconds:,.0f} chunks/s)")
+    return report
+
+def bench_retrieval(args):
+    """Similarity search p50/p95/p99 as the corpus grows, on pgvector or an in-process store"""
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    queries = random_unit_vectors(args.queries, rng=np.random.default_rng(1))
+    report = []
+    loaded = 0
+
+    if args.store in ("memory", "local"):
+        tmp = tempfile.TemporaryDirectory(prefix="hr-vectors-")
+        if args.store == "memory":
+            store = InMemoryVectorStore(embedding=DeterministicFakeEmbedding(size=EMBEDDING_DIM))
+        else:
+            store = LocalVectorStore("bench", FakeEmbeddings(size=EMBEDDING_DIM), path=tmp.name, dtype=args.dtype)
+        for size in sizes:
+            for texts, vectors, metadatas, ids in synthetic_batches(size - loaded, 5000, seed=loaded):
+                if args.store == "memory":
+                    store.add_texts(texts, metadatas=metadatas)
+                else:
+                    store.add_embeddings(texts, vectors, metadatas, ids)
+            loaded = size
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                store.similarity_search_by_vector(query.tolist(), k=args.k)
+                latencies.append(time.perf_counter() - start)
+            report.append({"rows": size, **percentiles(latencies)})
+            print(f"{size:>9} rows: p50 {report[-1]['p50_ms']:.2f} ms, p95 {report[-1]['p95_ms']:.2f} ms, p99 {report[-1]['p99_ms']:.2f} ms")
+        tmp.cleanup()
+        return {"store": args.store, "k": args.k, "results": report}
+
+    init_database()
+    store = temporary_store("retrieval")
+    try:
+        conn = psycopg2.connect(get_connection_string())
+        try:
+            for size in sizes:
+                with BulkVectorWriter(store.collection_name) as writer:
+                    for texts, vectors, metadatas, ids in synthetic_batches(size - loaded, 5000, seed=loaded):
+                        writer.write(texts, vectors, metadatas, ids)
+                loaded = size
+                with conn.cursor() as cursor:
+                    cursor.execute("ANALYZE langchain_pg_embedding")
+                    collection_id = get_collection_id(cursor, store.collection_name)
+                    latencies = [top_k(cursor, collection_id, query, args.k)[1] for query in queries]
+                report.append({"rows": size, **percentiles(latencies)})
+                print(f"{size:>9} rows: p50 {report[-1]['p50_ms']:.2f} ms, p95 {report[-1]['p95_ms']:.2f} ms, p99 {report[-1]['p99_ms']:.2f} ms")
+        finally:
+            conn.close()
+    finally:
+        store.delete_collection()
+    return {"store": args.store, "k": args.k, "results": report}
+
+def bench_ask(args):
+    """End-to-end HRAssistant.ask latency for several numbers of concurrent users, with the stub LLM"""
+    llm = StubChatModel(latency=args.llm_latency, token_delay=args.token_delay)
+    embeddings = DeterministicFakeEmbedding(size=EMBEDDING_DIM) if args.embeddings == "fake" else get_embeddings()
+    tmp = tempfile.TemporaryDirectory(prefix="hr-vectors-")
+    if args.store in ("memory", "local"):
+        texts, metadatas = synthetic_chunks(args.documents)
+        if args.store == "memory":
+            vectordb = InMemoryVectorStore.from_texts(texts, embeddings, metadatas=metadatas)
+        else:
+            vectordb = LocalVectorStore.from_texts(texts, embeddings, metadatas=metadatas, path=tmp.name)
+        assistant = HRAssistant(embeddings=embeddings, vectordb=vectordb, llm=llm)
+        print(f"{args.store} store with {len(texts)} synthetic chunks")
+    else:
+        assistant = HRAssistant(collection_name=args.collection, embeddings=embeddings, llm=llm)
+    assistant.warmup()
+
+    report = []
+    print(f"{'users':>6} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'shared':>7}")
+    for users in sorted(int(value) for value in args.users.split(",")):
+        assistant.answer_cache.clear()
+        coalesced_before = assistant.flights.coalesced
+
+        def user_session(user):
+            latencies = []
+            errors = 0
+            for i in range(args.requests):
+                question = SAMPLE_QUESTIONS[(user + i) % len(SAMPLE_QUESTIONS)]
+                if not args.repeat:
+                    # Distinct questions, so every request goes through retrieval and the LLM
+                    question = f"{question} (#{users}-{user}-{i})"
+                start = time.perf_counter()
+                answer = assistant.ask(question)
+                latencies.append(time.perf_counter() - start)
+                errors += answer.startswith(("Gặp lỗi", OVERLOADED_MESSAGE))
+            return latencies, errors
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            sessions = list(pool.map(user_session, range(users)))
+        elapsed = time.perf_counter() - start
+
+        latencies = [latency for session, _ in sessions for latency in session]
+        row = {
+            "users": users,
+            "requests": len(latencies),
+            "requests_per_second": len(latencies) / elapsed,
+            "errors": sum(errors for _, errors in sessions),
+            # Answered by an identical in-flight question (single-flight coalescing)
+            "coalesced": assistant.flights.coalesced - coalesced_before,
+            **percentiles(latencies),
+        }
+        report.append(row)
+        print(f"{users:>6} {row['requests']:>9} {row['requests_per_second']:>8.1f} {row['p50_ms']:>8.1f} "
+              f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['errors']:>7} {row['coalesced']:>7}")
+    tmp.cleanup()
+
+    return {
+        "store": args.store,
+        "embeddings": args.embeddings,
+        "llm_latency": args.llm_latency,
+        "startup_seconds": assistant.startup_timings,
+        "context": assistant.context_stats(),
+        "admission": assistant.admission.stats(),
+        "results": report,
+    }
+
+def write_report(args, results):
+    """Save results with the run configuration as JSON"""
+    payload = {
+        "command": args.command,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": {key: value for key, value in vars(args).items() if key not in ("func", "output")},
+        "results": results,
+    }
+    directory = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2, default=str)
+    print(f"Results written to {args.output}")
+
+def main():
+    parser = argparse.ArgumentParser(description="HR Assistant benchmarks")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    copy_parser = subparsers.add_parser("copy", help="Compare add_embeddings with the bulk COPY writer")
+    copy_parser.add_argument("--rows", type=int, default=20000, help="Number of synthetic chunks to insert")
+    copy_parser.add_argument("--batch-size", type=int, default=1000, help="Rows per write call")
+    copy_parser.add_argument("--defer-indexes", action="store_true", help="Drop and rebuild secondary indexes around the COPY load")
+    copy_parser.set_defaults(func=bench_copy)
+
+    index_parser = subparsers.add_parser("index", help="Recall vs latency report for the ANN index")
+    index_parser.add_argument("--collection", default=COLLECTION_NAME, help="Collection to query when --rows is 0")
+    index_parser.add_argument("--rows", type=int, default=0, help="Load this many synthetic rows into a temporary collection first")
+    index_parser.add_argument("--queries", type=int, default=200, help="Number of sampled queries")
+    index_parser.add_argument("--k", type=int, default=3, help="Neighbours per query (the assistant uses 3)")
+    index_parser.add_argument("--index-type", choices=["hnsw", "ivfflat"], default="hnsw")
+    index_parser.add_argument("--hnsw-m", type=int, default=16)
+    index_parser.add_argument("--hnsw-ef-construction", type=int, default=64)
+    index_parser.add_argument("--ivfflat-lists", type=int, default=100)
+    index_parser.add_argument("--rebuild", action="store_true", help="Rebuild the index with the given parameters")
+    index_parser.add_argument("--values", default="10,20,40,80,160", help="Comma separated ef_search (hnsw) or probes (ivfflat) values")
+    index_parser.set_defaults(func=bench_index)
+
+    embeddings_parser = subparsers.add_parser("embeddings", help="Embedding backend throughput and agreement with fp32")
+    embeddings_parser.add_argument("--backends", default="onnx,onnx-int8,int8", help="Comma separated backends compared with torch")
+    embeddings_parser.add_argument("--chunks", type=int, default=2000, help="Corpus chunks to embed")
+    embeddings_parser.add_argument("--queries", type=int, default=100, help="Extra queries sampled from the corpus")
+    embeddings_parser.add_argument("--k", type=int, default=3)
+    embeddings_parser.add_argument("--batch-size", type=int, default=32)
+    embeddings_parser.add_argument("--threads", type=int, default=0, help="CPU threads (0 = library default)")
+    embeddings_parser.add_argument("--data-path", default=DATA_PATH, help="Corpus to embed (the synthetic corpus if empty)")
+    embeddings_parser.set_defaults(func=bench_embeddings)
+
+    filter_parser = subparsers.add_parser("filter", help="Category-filtered vs unfiltered retrieval latency")
+    filter_parser.add_argument("--rows", type=int, default=200000, help="Synthetic chunks to load")
+    filter_parser.add_argument("--queries", type=int, default=200)
+    filter_parser.add_argument("--k", type=int, default=3)
+    filter_parser.add_argument("--overfetch", type=int, default=4, help="Post-filter baseline fetches k * overfetch rows")
+    filter_parser.set_defaults(func=bench_filter)
+
+    storage_parser = subparsers.add_parser("storage", help="Size, latency and recall of the float32/halfvec/binary storage modes")
+    storage_parser.add_argument("--collection", default=COLLECTION_NAME, help="Collection to query when --rows is 0")
+    storage_parser.add_argument("--rows", type=int, default=0, help="Load this many synthetic rows into a temporary collection first")
+    storage_parser.add_argument("--modes", default="vector,halfvec,binary", help="Comma separated storage modes")
+    storage_parser.add_argument("--queries", type=int, default=200)
+    storage_parser.add_argument("--k", type=int, default=3)
+    storage_parser.add_argument("--shortlist", type=int, default=40, help="Binary mode: Hamming candidates re-ranked exactly")
+    storage_parser.add_argument("--ef-search", type=int, default=40, help="hnsw.ef_search (raised to --shortlist if lower)")
+    storage_parser.add_argument("--hnsw-m", type=int, default=16)
+    storage_parser.add_argument("--hnsw-ef-construction", type=int, default=64)
+    storage_parser.add_argument("--rebuild", action="store_true", help="Rebuild existing indexes with the given parameters")
+    storage_parser.add_argument("--drop-indexes", action="store_true", help="Drop the halfvec/binary indexes afterwards")
+    storage_parser.set_defaults(func=bench_storage)
+
+    corpus_parser = subparsers.add_parser("corpus", help="Generate a synthetic HR corpus of .txt files")
+    corpus_parser.add_argument("--output-dir", required=True)
+    corpus_parser.add_argument("--documents", type=int, default=50)
+    corpus_parser.add_argument("--pages", type=int, default=4, help="Pages per document")
+    corpus_parser.add_argument("--seed", type=int, default=0)
+    corpus_parser.set_defaults(func=bench_corpus)
+
+    extract_parser = subparsers.add_parser("extract", help="PDF extraction pages/s per worker count")
+    extract_parser.add_argument("--data-path", help="Directory with PDF files (default: data/)")
+    extract_parser.add_argument("--workers", default="1,2,4", help="Comma separated worker counts")
+    extract_parser.add_argument("--repeat", type=int, default=10, help="Extract each PDF this many times per run")
+    extract_parser.add_argument("--pages-per-task", type=int, default=8)
+    extract_parser.set_defaults(func=bench_extract)
+
+    ingest_parser = subparsers.add_parser("ingest", help="load_documents / process_documents throughput (pages/s, chunks/s)")
+    ingest_parser.add_argument("--data-path", help="Corpus directory (default: a generated synthetic corpus)")
+    ingest_parser.add_argument("--documents", type=int, default=50, help="Synthetic documents to generate")
+    ingest_parser.add_argument("--pages", type=int, default=4, help="Pages per synthetic document")
+    ingest_parser.add_argument("--embeddings", choices=["fake", "model"], default="fake", help="fake needs no model download")
+    ingest_parser.add_argument("--writer", choices=["orm", "copy"], default="copy")
+    ingest_parser.add_argument("--skip-db", action="store_true", help="Only measure loading, splitting and dedup")
+    ingest_parser.add_argument("--no-dedup", action="store_true", help="Embed near-duplicate chunks in process_documents")
+    ingest_parser.set_defaults(func=bench_ingest)
+
+    retrieval_parser = subparsers.add_parser("retrieval", help="Search latency percentiles at several corpus sizes")
+    retrieval_parser.add_argument("--store", choices=["pgvector", "memory", "local"], default="pgvector")
+    retrieval_parser.add_argument("--dtype", choices=["float32", "float16"], default="float32", help="Matrix type for --store local")
+    retrieval_parser.add_argument("--sizes", default="1000,10000,100000", help="Comma separated corpus sizes (chunks)")
+    retrieval_parser.add_argument("--queries", type=int, default=200)
+    retrieval_parser.add_argument("--k", type=int, default=3)
+    retrieval_parser.set_defaults(func=bench_retrieval)
+
+    ask_parser = subparsers.add_parser("ask", help="End-to-end ask latency under concurrent users (stub LLM)")
+    ask_parser.add_argument("--store", choices=["pgvector", "memory", "local"], default="memory")
+    ask_parser.add_argument("--collection", default=COLLECTION_NAME, help="Collection to query with --store pgvector")
+    ask_parser.add_argument("--documents", type=int, default=200, help="Synthetic documents for --store memory/local")
+    ask_parser.add_argument("--embeddings", choices=["fake", "model"], default="fake")
+    ask_parser.add_argument("--users", default="1,4,16", help="Comma separated numbers of concurrent users")
+    ask_parser.add_argument("--requests", type=int, default=20, help="Questions asked by each user")
+    ask_parser.add_argument("--repeat", action="store_true", help="Repeat the sample questions verbatim (answer cache hits)")
+    ask_parser.add_argument("--llm-latency", type=float, default=0.2, help="Stub time to first token (s)")
+    ask_parser.add_argument("--token-delay", type=float, default=0.01, help="Stub delay between tokens (s)")
+    ask_parser.set_defaults(func=bench_ask)
+
+    args = parser.parse_args()
+    results = args.func(args)
+    if args.output:
+        write_report(args, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Returned by TTLCache.get on a miss, so that falsy values can be cached
+MISSING = object()
+# Collection version not observed yet (None is a real version: collections ingested without one)
+_UNSEEN = object()
+
+def normalize_question(question):
+    """Chuẩn hoá câu hỏi để so khớp chính xác (NFC, chữ thường, bỏ khoảng trắng/dấu câu thừa)"""
+    text = unicodedata.normalize("NFC", question).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?!.…")
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (self.ttl and item[1] < time.monotonic()):
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+class SemanticCache:
+    """Answers keyed by question embedding; a lookup hits when cosine similarity >= threshold.
+
+    Vectors live in one preallocated matrix so a lookup is a single
+    matrix-vector product. The oldest entry is overwritten when full;
+    expired entries are skipped before picking the best match.
+    """
+
+    def __init__(self, maxsize=512, threshold=0.95, ttl=3600):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._entries = [None] * maxsize
+        self._expires = np.zeros(maxsize)
+        self._count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, vector):
+        vector = self._normalize(vector)
+        with self._lock:
+            if self._count == 0:
+                self.misses += 1
+                return MISSING
+            scores = self._vectors[:self._count] @ vector
+            if self.ttl:
+                scores[self._expires[:self._count] < time.monotonic()] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+            return self._entries[best]
+
+    def set(self, vector, value):
+        vector = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            self._vectors[self._next] = vector
+            self._entries[self._next] = value
+            self._expires[self._next] = time.monotonic() + self.ttl
+            self._next = (self._next + 1) % self.maxsize
+            self._count = min(self._count + 1, self.maxsize)
+
+    def clear(self):
+        with self._lock:
+            self._entries = [None] * self.maxsize
+            self._count = 0
+            self._next = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": self._count,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "threshold": self.threshold,
+            }
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding model and caches query embeddings; documents are not cached.
+
+    Keyed on normalize_question(text) like the exact answer tier, so
+    questions differing only in case, spacing or trailing punctuation
+    share one embedding.
+    """
+
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = normalize_question(text)
+        vector = self.cache.get(key)
+        if vector is MISSING:
+            vector = self.embeddings.embed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+class AnswerCache:
+    """Exact-match cache on the normalized question, backed by a semantic near-duplicate cache.
+
+    Answers are scoped (e.g. by category filter): a question only matches
+    answers cached under the same scope. Both tiers are cleared when the
+    collection version changes, i.e. after an ingest.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, semantic_maxsize=512, semantic_threshold=0.95):
+        self.exact = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.semantic_maxsize = semantic_maxsize
+        self.semantic_threshold = semantic_threshold
+        self.ttl = ttl
+        # One semantic cache per scope, created on first use
+        self.semantic = {}
+        self.version = _UNSEEN
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def check_version(self, version):
+        """Clear every entry if the collection changed since the answers were cached"""
+        with self._lock:
+            if version == self.version:
+                return False
+            changed = self.version is not _UNSEEN
+            self.version = version
+        if changed:
+            self.clear()
+            self.invalidations += 1
+        return changed
+
+    @staticmethod
+    def make_key(question, scope=None):
+        """Exact-tier key: scope plus normalized question"""
+        return f"{scope or ''}\x1f{normalize_question(question)}"
+
+    def _semantic_for(self, scope):
+        with self._lock:
+            cache = self.semantic.get(scope)
+            if cache is None:
+                cache = SemanticCache(maxsize=self.semantic_maxsize, threshold=self.semantic_threshold, ttl=self.ttl)
+                self.semantic[scope] = cache
+            return cache
+
+    def get_exact(self, key):
+        return self.exact.get(key)
+
+    def get_semantic(self, vector, scope=None):
+        # A threshold above 1 disables the semantic tier
+        if self.semantic_threshold > 1:
+            return MISSING
+        return self._semantic_for(scope).get(vector)
+
+    def set(self, key, vector, answer, scope=None):
+        self.exact.set(key, answer)
+        if vector is not None and self.semantic_threshold <= 1:
+            self._semantic_for(scope).set(vector, answer)
+
+    def clear(self):
+        self.exact.clear()
+        with self._lock:
+            for cache in self.semantic.values():
+                cache.clear()
+
+    def semantic_stats(self):
+        """Semantic-tier counters summed over all scopes"""
+        with self._lock:
+            caches = list(self.semantic.values())
+        stats = [cache.stats() for cache in caches]
+        hits = sum(s["hits"] for s in stats)
+        misses = sum(s["misses"] for s in stats)
+        return {
+            "size": sum(s["size"] for s in stats),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "threshold": self.semantic_threshold,
+            "scopes": len(stats),
+        }
+
+    def stats(self):
+        return {
+            "exact": self.exact.stats(),
+            "semantic": self.semantic_stats(),
+            "invalidations": self.invalidations,
+            "version": None if self.version is _UNSEEN else self.version,
+        }
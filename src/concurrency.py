@@ -0,0 +1,203 @@
+import os
+import time
+import random
+import logging
+import threading
+import contextlib
+
+from dotenv import load_dotenv
+
+from telemetry import LLM_QUEUE_SECONDS, LLM_CALLS, LLM_REJECTED, LLM_RETRIES, COALESCED
+
+# Tải biến môi trường
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# LLM calls running at the same time (0 = unlimited)
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "4"))
+# Calls allowed to wait for a slot; further calls are refused
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+# Seconds a call may wait for a slot before it is refused
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# Retries after a rate-limit (HTTP 429) error, with jittered exponential backoff
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+
+class OverloadedError(Exception):
+    """An LLM call could not get a slot: the queue is full or the wait timed out"""
+
+class Abandoned(Exception):
+    """The leader of a shared call stopped before finishing (e.g. a closed stream)"""
+
+class AdmissionLimiter:
+    """Bounded admission for LLM calls: at most max_inflight run, at most max_queue wait.
+
+    Under load callers wait for a slot instead of all hitting the provider at
+    once and failing with rate-limit errors; only a full queue or a wait
+    longer than timeout is refused with OverloadedError.
+    """
+
+    def __init__(self, max_inflight=LLM_MAX_INFLIGHT, max_queue=LLM_MAX_QUEUE, timeout=LLM_QUEUE_TIMEOUT):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    def _publish(self):
+        LLM_CALLS.set(self.running, state="running")
+        LLM_CALLS.set(self.waiting, state="queued")
+
+    def _acquire(self):
+        with self._cond:
+            if self.max_inflight <= 0 or (self.running < self.max_inflight and not self.waiting):
+                self.running += 1
+                self.admitted += 1
+                self._publish()
+                return
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                LLM_REJECTED.inc(reason="queue_full")
+                raise OverloadedError(f"LLM queue is full ({self.waiting} waiting)")
+            self.waiting += 1
+            self._publish()
+            deadline = time.monotonic() + self.timeout
+            try:
+                while self.running >= self.max_inflight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        LLM_REJECTED.inc(reason="timeout")
+                        # Pass on a wake-up this waiter may have consumed
+                        self._cond.notify()
+                        raise OverloadedError(f"No LLM slot within {self.timeout:.0f}s")
+                    self._cond.wait(remaining)
+                self.running += 1
+                self.admitted += 1
+            finally:
+                self.waiting -= 1
+                self._publish()
+
+    def _release(self):
+        with self._cond:
+            self.running -= 1
+            self._publish()
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Hold an LLM slot for the block; yields the seconds spent waiting for it"""
+        start = time.perf_counter()
+        self._acquire()
+        waited = time.perf_counter() - start
+        LLM_QUEUE_SECONDS.observe(waited)
+        try:
+            yield waited
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "running": self.running,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "max_inflight": self.max_inflight,
+                "max_queue": self.max_queue,
+            }
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution and its result (or error)"""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Return (flight, leader); the leader must call finish(), followers call wait()"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                COALESCED.inc()
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def finish(self, key, flight, result=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.result = result
+        flight.error = error
+        flight.done.set()
+
+    @staticmethod
+    def wait(flight):
+        """Result of the leader's call; raises its error, or Abandoned if the leader gave up"""
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers with this key; returns (result, shared)"""
+        while True:
+            flight, leader = self.begin(key)
+            if not leader:
+                try:
+                    return self.wait(flight), True
+                except Abandoned:
+                    continue
+            try:
+                result = fn()
+            except BaseException as e:
+                self.finish(key, flight, error=e)
+                raise
+            self.finish(key, flight, result=result)
+            return result, False
+
+def is_rate_limited(error):
+    """True for the HTTP 429 / quota errors raised by the LLM clients"""
+    name = type(error).__name__
+    message = str(error)
+    return (
+        name in ("ResourceExhausted", "RateLimitError", "TooManyRequests")
+        or "429" in message
+        or "ResourceExhausted" in message
+        or "rate limit" in message.lower()
+    )
+
+def call_with_retry(fn, retries=LLM_RATE_LIMIT_RETRIES, base_delay=LLM_RETRY_BASE_DELAY, on_retry=None):
+    """Call fn(), retrying rate-limit errors after base_delay * 2**attempt seconds (±50% jitter).
+
+    on_retry(delay) is called before each backoff sleep.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= retries or not is_rate_limited(e):
+                raise
+            delay = base_delay * 2 ** attempt * (0.5 + random.random())
+            attempt += 1
+            LLM_RETRIES.inc()
+            logger.warning(f"LLM rate limited, retry {attempt}/{retries} in {delay:.1f}s: {str(e)}")
+            if on_retry:
+                on_retry(delay)
+            time.sleep(delay)
@@ -0,0 +1,117 @@
+import os
+import re
+import unicodedata
+
+from dotenv import load_dotenv
+
+# Tải biến môi trường
+load_dotenv()
+
+# Approximate token budget for the retrieved context in the prompt; 0 (default) keeps the
+# whole RETRIEVAL_K chunks, a budget (e.g. 350) turns packing on
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+# Characters per token used by estimate_tokens; Vietnamese with diacritics runs about 3
+CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "3.0"))
+# Word-set Jaccard similarity above which a sentence counts as a near duplicate
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+# Sentences shorter than this (in words) are only dropped as near duplicates, never for being
+# contained in a longer one: "Điều 5." inside another sentence is still a heading worth keeping
+MIN_CONTAINED_WORDS = 4
+# Weight of the retrieval rank relative to lexical overlap with the question
+RANK_WEIGHT = 0.5
+
+# Words too common to help lexical matching in Vietnamese HR questions
+STOPWORDS = {
+    "là", "gì", "của", "và", "có", "không", "được", "cho", "các", "những", "một", "này", "khi",
+    "thì", "với", "như", "thế", "nào", "bao", "nhiêu", "ở", "đâu", "tôi", "em", "anh", "chị",
+    "công", "ty", "về", "trong", "để", "làm", "sao", "ai", "hãy", "vui", "lòng", "nhé", "ạ",
+}
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+def estimate_tokens(text):
+    """Approximate token count; good enough to budget prompts without loading a tokenizer"""
+    return int(len(text) / CHARS_PER_TOKEN + 0.5)
+
+def _normalize(text):
+    text = unicodedata.normalize("NFC", text).lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+def terms(text):
+    """Informative words of a text (lower case, stopwords removed)"""
+    return [word for word in re.findall(r"\w+", _normalize(text)) if word not in STOPWORDS]
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in _SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+def _is_redundant(normalized, words, kept):
+    """True if a sentence repeats (or is contained in) one already kept"""
+    for kept_normalized, kept_words in kept:
+        if len(words) >= MIN_CONTAINED_WORDS and normalized in kept_normalized:
+            return True
+        union = words | kept_words
+        if union and len(words & kept_words) / len(union) >= NEAR_DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+def pack_context(docs, question, token_budget=CONTEXT_TOKEN_BUDGET, baseline_k=3):
+    """Assemble the prompt context from retrieved chunks within a token budget.
+
+    Chunks are split into sentences; sentences repeated by chunk overlap or
+    near-duplicated across documents are dropped, and the rest are picked by
+    overlap with the question (ties go to better-ranked chunks) until the
+    budget is spent. Picked sentences keep their original order.
+
+    Returns (context, stats). baseline_k is the number of whole chunks the
+    unpacked prompt used, to report the tokens saved.
+    """
+    question_terms = set(terms(question))
+    kept = []
+    candidates = []
+    duplicates = 0
+    total_sentences = 0
+    for rank, doc in enumerate(docs):
+        for position, sentence in enumerate(split_sentences(doc.page_content)):
+            total_sentences += 1
+            normalized = _normalize(sentence)
+            words = set(re.findall(r"\w+", normalized))
+            if _is_redundant(normalized, words, kept):
+                duplicates += 1
+                continue
+            kept.append((normalized, words))
+            overlap = len(question_terms & words) / len(question_terms) if question_terms else 0.0
+            score = overlap + RANK_WEIGHT / (1 + rank)
+            candidates.append((score, rank, position, sentence))
+
+    selected = []
+    used = 0
+    for score, rank, position, sentence in sorted(candidates, key=lambda c: (-c[0], c[1], c[2])):
+        tokens = estimate_tokens(sentence)
+        if used + tokens > token_budget:
+            if selected:
+                continue
+            # A single sentence longer than the budget is cut rather than dropped
+            sentence = sentence[:int(token_budget * CHARS_PER_TOKEN)]
+            tokens = estimate_tokens(sentence)
+        selected.append((rank, position, sentence))
+        used += tokens
+
+    # Back to reading order, one paragraph per source chunk
+    paragraphs = {}
+    for rank, position, sentence in sorted(selected):
+        paragraphs.setdefault(rank, []).append(sentence)
+    context = "\n\n".join(" ".join(sentences) for sentences in paragraphs.values())
+
+    baseline_tokens = estimate_tokens("\n\n".join(doc.page_content for doc in docs[:baseline_k]))
+    packed_tokens = estimate_tokens(context)
+    stats = {
+        "candidates": len(docs),
+        "sentences": total_sentences,
+        "duplicates_dropped": duplicates,
+        "sentences_kept": len(selected),
+        "candidate_tokens": estimate_tokens("\n\n".join(doc.page_content for doc in docs)),
+        "baseline_tokens": baseline_tokens,
+        "packed_tokens": packed_tokens,
+        "tokens_saved": max(baseline_tokens - packed_tokens, 0),
+    }
+    return context, stats
@@ -1,10 +1,24 @@
 import os
+import io
+import json
+import time
+import uuid
+import threading
+import collections
 import psycopg2
 import getpass
+import re
+import numpy as np
+from typing import Any, Optional
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
 from langchain_community.vectorstores.pgvector import PGVector
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from context import terms
+from telemetry import REGISTRY, POOL_CONNECTIONS, POOL_WAIT_SECONDS, record_stage, trace_stage, current_trace
 import logging
 
 # Load environment variables
@@ -27,28 +41,253 @@ DEFAULT_CONNECTION_STRING = f"postgresql://{getpass.getuser()}@localhost:5433/hr
 # Default collection name for documents
 COLLECTION_NAME = "hr_documents"
 
+# Dimension of the stored embeddings (all-MiniLM-L6-v2)
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
+
+# ANN index over langchain_pg_embedding.embedding: "hnsw" or "ivfflat"
+VECTOR_INDEX_NAME = "ix_langchain_pg_embedding_embedding"
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+
+# Query-time knobs, applied to every connection used for retrieval
+HNSW_EF_SEARCH = os.getenv("HNSW_EF_SEARCH")
+IVFFLAT_PROBES = os.getenv("IVFFLAT_PROBES")
+# pgvector's default hnsw.ef_search: an HNSW scan returns at most this many rows
+HNSW_DEFAULT_EF_SEARCH = 40
+# Category filters are applied after the HNSW scan of the shared table, so a selective
+# filter can leave fewer than k rows out of ef_search. Opt-in (needs pgvector >= 0.8):
+# "relaxed_order" or "strict_order" keeps scanning until enough rows pass the filter.
+# Only set (SET LOCAL) for filtered retrieval; unfiltered queries are unchanged.
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN", "off")
+ITERATIVE_SCAN_MODES = ("off", "relaxed_order", "strict_order")
+
+# What the ANN index stores and searches: "vector" (float32), "halfvec" (float16, 2x smaller index)
+# or "binary" (1 bit per dimension, 32x smaller index, shortlist re-ranked with the float32 vectors).
+# The table always keeps the float32 column; compact modes are expression indexes over it.
+STORAGE_MODE = os.getenv("STORAGE_MODE", "vector")
+# Binary mode: candidates taken by Hamming distance before exact re-ranking
+BINARY_SHORTLIST = int(os.getenv("BINARY_SHORTLIST", "40"))
+
+# Indexed expression and operator class per storage mode ({dim} is the embedding size)
+_STORAGE_EXPRESSIONS = {
+    "vector": ("embedding", "vector_cosine_ops"),
+    "halfvec": ("(embedding::halfvec({dim}))", "halfvec_cosine_ops"),
+    "binary": ("(binary_quantize(embedding)::bit({dim}))", "bit_hamming_ops"),
+}
+STORAGE_INDEX_NAMES = {
+    "vector": VECTOR_INDEX_NAME,
+    "halfvec": "ix_langchain_pg_embedding_embedding_half",
+    "binary": "ix_langchain_pg_embedding_embedding_bin",
+}
+
+# Where embeddings live: "pgvector" (PostgreSQL) or "local" (memory-mapped files, see local_store.py)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pgvector")
+
+# Retriever used by HRAssistant: "vector" (PGVector similarity) or "hybrid" (vector + full-text)
+RETRIEVER_MODE = os.getenv("RETRIEVER", "vector")
+
+# Hybrid retrieval: candidates taken from each arm before fusion, and the RRF constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+
+# Full-text configuration; "simple" keeps Vietnamese syllables, codes and numbers as-is
+TEXT_SEARCH_CONFIG = os.getenv("TEXT_SEARCH_CONFIG", "simple")
+
+# Shared connection pool settings
+POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("POSTGRES_POOL_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("POSTGRES_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("POSTGRES_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.getenv("POSTGRES_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+STATEMENT_TIMEOUT_MS = int(os.getenv("POSTGRES_STATEMENT_TIMEOUT_MS", "30000"))
+
 # Get database connection string from environment or use default
 def get_connection_string():
     return os.getenv("POSTGRES_CONNECTION_STRING", DEFAULT_CONNECTION_STRING)
 
+def get_search_settings(ef_search=None, probes=None):
+    """Return the pgvector query settings from arguments or config"""
+    settings = {}
+    ef_search = ef_search or HNSW_EF_SEARCH
+    probes = probes or IVFFLAT_PROBES
+    if ef_search:
+        settings["hnsw.ef_search"] = int(ef_search)
+    if probes:
+        settings["ivfflat.probes"] = int(probes)
+    return settings
+
+def validate_search_config():
+    """Reject invalid query settings before any connection is made"""
+    if HNSW_ITERATIVE_SCAN not in ITERATIVE_SCAN_MODES:
+        raise ValueError(f"Invalid HNSW_ITERATIVE_SCAN: {HNSW_ITERATIVE_SCAN} (expected one of {', '.join(ITERATIVE_SCAN_MODES)})")
+
+def iterative_scan_enabled():
+    return HNSW_ITERATIVE_SCAN != "off"
+
+def get_connect_options():
+    """libpq options applied to every pooled connection: statement timeout and pgvector query knobs"""
+    settings = get_search_settings()
+    if STATEMENT_TIMEOUT_MS:
+        settings["statement_timeout"] = STATEMENT_TIMEOUT_MS
+    return " ".join(f"-c {name}={value}" for name, value in settings.items())
+
+def apply_search_settings(cursor, ef_search=None, probes=None):
+    """Set the pgvector query knobs on an open psycopg2 cursor for the current session"""
+    for name, value in get_search_settings(ef_search, probes).items():
+        cursor.execute(f"SET {name} = {value}")
+
+def apply_local_search_settings(conn, ef_search=None, probes=None, filtered=False):
+    """SET LOCAL the pgvector query knobs for the current transaction of a SQLAlchemy connection.
+
+    filtered adds hnsw.iterative_scan when HNSW_ITERATIVE_SCAN enables it.
+    """
+    for name, value in get_search_settings(ef_search, probes).items():
+        conn.execute(text(f"SET LOCAL {name} = {value}"))
+    if filtered and iterative_scan_enabled():
+        conn.execute(text(f"SET LOCAL hnsw.iterative_scan = {HNSW_ITERATIVE_SCAN}"))
+
+class _PoolMetrics:
+    """Checkout wait times of the shared pool"""
+
+    def __init__(self, window=1024):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self.errors = 0
+        self._recent = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, wait, timed_out=False, failed=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            if failed:
+                self.errors += 1
+                return
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent.append(wait)
+
+    def snapshot(self):
+        with self._lock:
+            recent = np.asarray(self._recent) * 1000.0 if self._recent else np.zeros(1)
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "wait_total_s": self.total_wait,
+                "wait_max_ms": self.max_wait * 1000.0,
+                "wait_p50_ms": float(np.percentile(recent, 50)),
+                "wait_p95_ms": float(np.percentile(recent, 95)),
+            }
+
+_pool_metrics = _PoolMetrics()
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            _pool_metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        except Exception:
+            # Connect failures (server down, auth) are not pool exhaustion
+            _pool_metrics.record(time.perf_counter() - start, failed=True)
+            raise
+        wait = time.perf_counter() - start
+        _pool_metrics.record(wait)
+        POOL_WAIT_SECONDS.observe(wait)
+        record_stage("db_pool_wait", wait)
+        return connection
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Return the process-wide pooled engine shared by all helpers and the vector store"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                validate_search_config()
+                _engine = create_engine(
+                    get_connection_string(),
+                    poolclass=_TimedQueuePool,
+                    pool_size=POOL_SIZE,
+                    max_overflow=POOL_MAX_OVERFLOW,
+                    pool_timeout=POOL_TIMEOUT,
+                    pool_recycle=POOL_RECYCLE,
+                    pool_pre_ping=POOL_PRE_PING,
+                    connect_args={"options": get_connect_options()},
+                )
+    return _engine
+
+def _collect_pool_metrics():
+    """Refresh the pool gauges exported on /metrics"""
+    if _engine is None:
+        return
+    pool = _engine.pool
+    POOL_CONNECTIONS.set(pool.size(), state="size")
+    POOL_CONNECTIONS.set(pool.checkedout(), state="checked_out")
+    POOL_CONNECTIONS.set(pool.checkedin(), state="checked_in")
+    POOL_CONNECTIONS.set(pool.overflow(), state="overflow")
+
+REGISTRY.add_collector(_collect_pool_metrics)
+
+def get_pool_metrics():
+    """Pool occupancy and checkout wait statistics"""
+    pool = get_engine().pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        **_pool_metrics.snapshot(),
+    }
+
+def check_database_health():
+    """Run a trivial query through the pool; returns status, latency and pool metrics"""
+    if VECTOR_STORE == "local":
+        return {"ok": True, "error": None, "latency_ms": 0.0, "store": "local"}
+    start = time.perf_counter()
+    try:
+        with get_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+        ok = True
+        error = None
+    except Exception as e:
+        ok = False
+        error = str(e)
+    return {
+        "ok": ok,
+        "error": error,
+        "latency_ms": (time.perf_counter() - start) * 1000.0,
+        "pool": get_pool_metrics(),
+    }
+
+_database_initialized = False
+
 # Initialize database and create pgvector extension if needed
 def init_database():
-    """Initialize PostgreSQL database with pgvector extension"""
-    connection_string = get_connection_string()
+    """Initialize PostgreSQL database with pgvector extension (once per process)"""
+    global _database_initialized
+    if _database_initialized or VECTOR_STORE == "local":
+        return True
     
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(connection_string)
-        conn.autocommit = True
-        cursor = conn.cursor()
-        
         # Create pgvector extension if it doesn't exist
-        cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-        
-        # Close connection
-        cursor.close()
-        conn.close()
+        with get_engine().begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
         
+        _database_initialized = True
         logger.info("Successfully initialized database with pgvector extension")
         return True
     except Exception as e:
@@ -59,33 +298,316 @@ def init_database():
 def get_pgvector_store(collection_name="hr_documents", embedding_function=None):
     """Get a PGVector store with the specified collection name and embedding function"""
     if embedding_function is None:
-        embedding_function = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+        # Imported lazily: the model is only loaded when no embedding function is given
+        from embedding_models import get_embeddings
+        embedding_function = get_embeddings()
     
     connection_string = get_connection_string()
     
     try:
-        # Create PGVector store
+        # Create PGVector store on the shared pool; init_database already created the extension
         store = PGVector(
             collection_name=collection_name,
             connection_string=connection_string,
             embedding_function=embedding_function,
+            connection=get_engine(),
+            create_extension=False,
         )
         return store
     except Exception as e:
         logger.error(f"Error creating PGVector store: {str(e)}")
         raise
 
+def get_vector_store(collection_name=COLLECTION_NAME, embedding_function=None):
+    """Vector store for a collection, on the backend selected by VECTOR_STORE"""
+    if VECTOR_STORE == "local":
+        from local_store import LocalVectorStore
+        if embedding_function is None:
+            from embedding_models import get_embeddings
+            embedding_function = get_embeddings()
+        return LocalVectorStore(collection_name=collection_name, embedding_function=embedding_function)
+    return get_pgvector_store(collection_name=collection_name, embedding_function=embedding_function)
+
+# Expression shared by the GIN index and the hybrid query, so the index is used
+_TSVECTOR_SQL = f"to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(e.document, ''))"
+
+def create_text_search_index():
+    """GIN index over chunk text for the lexical arm of hybrid retrieval"""
+    if VECTOR_STORE == "local":
+        return True
+    try:
+        with get_engine().begin() as conn:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_document_tsv "
+                f"ON langchain_pg_embedding USING gin ({_TSVECTOR_SQL.replace('e.document', 'document')})"
+            ))
+        return True
+    except Exception as e:
+        logger.error(f"Error creating text search index: {str(e)}")
+        return False
+
+def to_lexical_query(question):
+    """Turn a question into an OR tsquery of its informative terms, or None"""
+    # Deduplicate, keeping order
+    words = list(dict.fromkeys(terms(question)))
+    return " | ".join(words) if words else None
+
+def _metadata_filter_sql(filter, params):
+    """Equality filters on metadata keys, in the same form as the metadata indexes"""
+    clauses = []
+    for i, (key, value) in enumerate((filter or {}).items()):
+        if not re.fullmatch(r"\w+", key):
+            raise ValueError(f"Invalid metadata key: {key}")
+        clauses.append(f"AND e.cmetadata ->> '{key}' = :filter_{i}")
+        params[f"filter_{i}"] = str(value)
+    return " ".join(clauses)
+
+_HYBRID_SQL = """
+WITH collection AS (
+    SELECT uuid FROM langchain_pg_collection WHERE name = :collection_name
+),
+vector_hits AS (
+    SELECT uuid, row_number() OVER (ORDER BY distance) AS rank
+    FROM (
+        SELECT e.uuid, e.embedding <=> CAST(:embedding AS vector) AS distance
+        FROM langchain_pg_embedding e
+        WHERE e.collection_id = (SELECT uuid FROM collection) {filter}
+        ORDER BY distance
+        LIMIT :candidates
+    ) v
+),
+text_hits AS (
+    SELECT uuid, row_number() OVER (ORDER BY score DESC) AS rank
+    FROM (
+        SELECT e.uuid, ts_rank_cd({tsvector}, q.query) AS score
+        FROM langchain_pg_embedding e, to_tsquery('{config}', CAST(:tsquery AS text)) q
+        WHERE e.collection_id = (SELECT uuid FROM collection) {filter}
+          AND {tsvector} @@ q.query
+        ORDER BY score DESC
+        LIMIT :candidates
+    ) t
+),
+fused AS (
+    SELECT uuid, sum(1.0 / (:rrf_k + rank)) AS score
+    FROM (SELECT uuid, rank FROM vector_hits UNION ALL SELECT uuid, rank FROM text_hits) hits
+    GROUP BY uuid
+)
+SELECT e.document, e.cmetadata, e.custom_id, f.score, vh.rank AS vector_rank, th.rank AS text_rank
+FROM fused f
+JOIN langchain_pg_embedding e ON e.uuid = f.uuid
+LEFT JOIN vector_hits vh ON vh.uuid = f.uuid
+LEFT JOIN text_hits th ON th.uuid = f.uuid
+ORDER BY f.score DESC
+LIMIT :k
+"""
+
+class HybridRetriever(BaseRetriever):
+    """Vector and full-text search fused with reciprocal rank fusion, in a single SQL round trip.
+
+    Drop-in replacement for vectordb.as_retriever(): each arm returns up to
+    `candidates` chunks and the fused top `k` are returned as Documents.
+    Timings of the last query are kept in last_timings.
+    """
+
+    embeddings: Any
+    collection_name: str = COLLECTION_NAME
+    k: int = 3
+    candidates: int = HYBRID_CANDIDATES
+    rrf_k: int = HYBRID_RRF_K
+    filter: Optional[dict] = None
+    last_timings: Optional[dict] = None
+
+    def _build_query(self, query):
+        params = {
+            "collection_name": self.collection_name,
+            "tsquery": to_lexical_query(query),
+            "candidates": self.candidates,
+            "rrf_k": self.rrf_k,
+            "k": self.k,
+        }
+        sql = _HYBRID_SQL.format(
+            filter=_metadata_filter_sql(self.filter, params),
+            tsvector=_TSVECTOR_SQL,
+            config=TEXT_SEARCH_CONFIG,
+        )
+        return sql, params
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        start = time.perf_counter()
+        with trace_stage("retrieval.embed"):
+            embedding = self.embeddings.embed_query(query)
+        embedded = time.perf_counter()
+
+        sql, params = self._build_query(query)
+        params["embedding"] = to_vector_literal(embedding)
+        with trace_stage("retrieval.search"):
+            with get_engine().begin() as conn:
+                if self.filter:
+                    apply_local_search_settings(conn, filtered=True)
+                rows = conn.execute(text(sql), params).fetchall()
+        searched = time.perf_counter()
+
+        documents = []
+        for row in rows:
+            metadata = dict(row.cmetadata or {})
+            metadata.update(
+                id=row.custom_id,
+                hybrid_score=float(row.score),
+                vector_rank=row.vector_rank,
+                text_rank=row.text_rank,
+            )
+            documents.append(Document(page_content=row.document, metadata=metadata))
+
+        self.last_timings = {
+            "embed_ms": (embedded - start) * 1000.0,
+            "search_ms": (searched - embedded) * 1000.0,
+            "total_ms": (time.perf_counter() - start) * 1000.0,
+            "vector_hits": sum(1 for row in rows if row.vector_rank is not None),
+            "text_hits": sum(1 for row in rows if row.text_rank is not None),
+        }
+        trace = current_trace()
+        if trace is not None:
+            trace.set(vector_hits=self.last_timings["vector_hits"], text_hits=self.last_timings["text_hits"])
+        return documents
+
+def get_hybrid_retriever(collection_name=COLLECTION_NAME, embedding_function=None, k=3,
+                         candidates=HYBRID_CANDIDATES, filter=None):
+    """Hybrid (vector + full-text) retriever over a collection, usable wherever as_retriever() is"""
+    if embedding_function is None:
+        from embedding_models import get_embeddings
+        embedding_function = get_embeddings()
+    return HybridRetriever(
+        embeddings=embedding_function,
+        collection_name=collection_name,
+        k=k,
+        candidates=candidates,
+        filter=filter,
+    )
+
+_VECTOR_SQL = """
+SELECT e.document, e.cmetadata, e.custom_id, e.embedding <=> CAST(:embedding AS vector({dim})) AS distance
+FROM langchain_pg_embedding e
+WHERE e.collection_id = (SELECT uuid FROM langchain_pg_collection WHERE name = :collection_name) {filter}
+ORDER BY distance
+LIMIT :k
+"""
+
+_HALFVEC_SQL = """
+SELECT e.document, e.cmetadata, e.custom_id,
+       e.embedding::halfvec({dim}) <=> CAST(:embedding AS halfvec({dim})) AS distance
+FROM langchain_pg_embedding e
+WHERE e.collection_id = (SELECT uuid FROM langchain_pg_collection WHERE name = :collection_name) {filter}
+ORDER BY distance
+LIMIT :k
+"""
+
+# Hamming-distance shortlist on the binary index, re-ranked by exact cosine distance
+_BINARY_SQL = """
+WITH shortlist AS (
+    SELECT e.uuid
+    FROM langchain_pg_embedding e
+    WHERE e.collection_id = (SELECT uuid FROM langchain_pg_collection WHERE name = :collection_name) {filter}
+    ORDER BY binary_quantize(e.embedding)::bit({dim}) <~> binary_quantize(CAST(:embedding AS vector({dim})))
+    LIMIT :shortlist
+)
+SELECT e.document, e.cmetadata, e.custom_id, e.embedding <=> CAST(:embedding AS vector({dim})) AS distance
+FROM shortlist s
+JOIN langchain_pg_embedding e ON e.uuid = s.uuid
+ORDER BY distance
+LIMIT :k
+"""
+
+class QuantizedRetriever(BaseRetriever):
+    """Similarity search through the float32, halfvec or binary index (see STORAGE_MODE).
+
+    The queries use the same expressions as the indexes built by
+    create_vector_index(storage=...), so the planner picks them. Results
+    come back in cosine-distance order like PGVector's, even when a
+    filtered query runs a relaxed-order iterative scan. The "vector" mode
+    is used for filtered queries, which PGVector cannot run with SET LOCAL.
+    """
+
+    embeddings: Any
+    collection_name: str = COLLECTION_NAME
+    mode: str = "binary"
+    k: int = 3
+    shortlist: int = BINARY_SHORTLIST
+    filter: Optional[dict] = None
+    last_timings: Optional[dict] = None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        start = time.perf_counter()
+        with trace_stage("retrieval.embed"):
+            embedding = self.embeddings.embed_query(query)
+        embedded = time.perf_counter()
+
+        params = {
+            "collection_name": self.collection_name,
+            "embedding": to_vector_literal(embedding),
+            "k": self.k,
+            "shortlist": max(self.shortlist, self.k),
+        }
+        template = {"binary": _BINARY_SQL, "halfvec": _HALFVEC_SQL}.get(self.mode, _VECTOR_SQL)
+        sql = template.format(dim=len(embedding), filter=_metadata_filter_sql(self.filter, params))
+        with trace_stage("retrieval.search"):
+            with get_engine().begin() as conn:
+                ef_search = None
+                if self.mode == "binary":
+                    # An HNSW scan stops after ef_search rows, so a larger shortlist needs a larger ef_search
+                    ef_search = max(int(HNSW_EF_SEARCH or HNSW_DEFAULT_EF_SEARCH), params["shortlist"])
+                apply_local_search_settings(conn, ef_search=ef_search, filtered=bool(self.filter))
+                rows = conn.execute(text(sql), params).fetchall()
+        # relaxed_order iterative scans may return rows slightly out of order
+        rows = sorted(rows, key=lambda row: row.distance)
+        searched = time.perf_counter()
+
+        documents = []
+        for row in rows:
+            metadata = dict(row.cmetadata or {})
+            metadata.update(id=row.custom_id, distance=float(row.distance))
+            documents.append(Document(page_content=row.document, metadata=metadata))
+        self.last_timings = {
+            "embed_ms": (embedded - start) * 1000.0,
+            "search_ms": (searched - embedded) * 1000.0,
+            "total_ms": (searched - start) * 1000.0,
+        }
+        return documents
+
+def get_quantized_retriever(collection_name=COLLECTION_NAME, embedding_function=None, k=3,
+                            mode=STORAGE_MODE, shortlist=BINARY_SHORTLIST, filter=None):
+    """Retriever searching the float32, halfvec or binary index, usable wherever as_retriever() is"""
+    if mode not in ("vector", "halfvec", "binary"):
+        raise ValueError(f"Storage mode {mode} has no quantized retriever")
+    if embedding_function is None:
+        from embedding_models import get_embeddings
+        embedding_function = get_embeddings()
+    return QuantizedRetriever(
+        embeddings=embedding_function,
+        collection_name=collection_name,
+        mode=mode,
+        k=k,
+        shortlist=shortlist,
+        filter=filter,
+    )
+
 # Function to check if a collection exists
 def collection_exists(collection_name="hr_documents"):
     """Check if a collection exists in the database"""
-    connection_string = get_connection_string()
-    engine = create_engine(connection_string)
-    
+    if VECTOR_STORE == "local":
+        import local_store
+        return local_store.collection_exists(collection_name)
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text(
-                f"SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'langchain_pg_embedding_{collection_name}')"
-            ))
+        with get_engine().connect() as conn:
+            # PGVector keeps every collection as a row of langchain_pg_collection
+            table_exists = conn.execute(text(
+                "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'langchain_pg_collection')"
+            )).scalar()
+            if not table_exists:
+                return False
+            result = conn.execute(
+                text("SELECT EXISTS (SELECT 1 FROM langchain_pg_collection WHERE name = :name)"),
+                {"name": collection_name},
+            )
             return result.scalar()
     except Exception as e:
         logger.error(f"Error checking if collection exists: {str(e)}")
@@ -94,15 +616,506 @@ def collection_exists(collection_name="hr_documents"):
 # Delete a collection if it exists
 def delete_collection(collection_name="hr_documents"):
     """Delete a collection if it exists"""
-    connection_string = get_connection_string()
-    engine = create_engine(connection_string)
+    if VECTOR_STORE == "local":
+        import local_store
+        return local_store.delete_collection(collection_name)
+    try:
+        with get_engine().begin() as conn:
+            if conn.execute(text("SELECT to_regclass('langchain_pg_collection')")).scalar() is None:
+                return True
+            # PGVector keeps every collection in the shared tables: its chunks
+            # are the embedding rows referencing the collection row
+            conn.execute(
+                text(
+                    "DELETE FROM langchain_pg_embedding WHERE collection_id IN "
+                    "(SELECT uuid FROM langchain_pg_collection WHERE name = :name)"
+                ),
+                {"name": collection_name},
+            )
+            conn.execute(text("DELETE FROM langchain_pg_collection WHERE name = :name"), {"name": collection_name})
+        logger.info(f"Collection {collection_name} deleted successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Error deleting collection: {str(e)}")
+        return False
+
+def list_collections():
+    """Names of all collections"""
+    if VECTOR_STORE == "local":
+        import local_store
+        return local_store.list_collections()
+    try:
+        with get_engine().connect() as conn:
+            if conn.execute(text("SELECT to_regclass('langchain_pg_collection')")).scalar() is None:
+                return []
+            return [row[0] for row in conn.execute(text("SELECT name FROM langchain_pg_collection ORDER BY name"))]
+    except Exception as e:
+        logger.error(f"Error listing collections: {str(e)}")
+        return []
+
+def count_collection_rows(collection_name=COLLECTION_NAME):
+    """Number of chunks stored in a collection"""
+    if VECTOR_STORE == "local":
+        import local_store
+        return local_store.count_rows(collection_name)
+    try:
+        with get_engine().connect() as conn:
+            return conn.execute(
+                text(
+                    "SELECT count(*) FROM langchain_pg_embedding e "
+                    "JOIN langchain_pg_collection c ON e.collection_id = c.uuid WHERE c.name = :name"
+                ),
+                {"name": collection_name},
+            ).scalar()
+    except Exception as e:
+        logger.error(f"Error counting collection rows: {str(e)}")
+        return None
+
+# Collection aliases: readers open the collection an alias points to, so a
+# rebuilt collection can replace the live one in a single UPDATE (see reindex.py)
+ALIAS_TABLE = "hr_collection_alias"
+
+class AliasResolutionError(Exception):
+    """The alias table could not be read, so the collection behind a name is unknown"""
+
+# Attempts to read an alias before giving up (transient connection errors)
+ALIAS_RESOLVE_ATTEMPTS = 3
+
+def resolve_collection(name=COLLECTION_NAME, attempts=ALIAS_RESOLVE_ATTEMPTS):
+    """Collection an alias currently points to; a name without an alias is returned unchanged.
+
+    The bare name is only returned when there is no alias table or no alias
+    row for it. If the alias cannot be read, AliasResolutionError is raised:
+    falling back to the name would make PGVector create and serve a new
+    empty collection while the data sits in a versioned one.
+    """
+    for attempt in range(attempts):
+        try:
+            if VECTOR_STORE == "local":
+                import local_store
+                return local_store.resolve_alias(name) or name
+            with get_engine().connect() as conn:
+                if conn.execute(text(f"SELECT to_regclass('{ALIAS_TABLE}')")).scalar() is None:
+                    return name
+                target = conn.execute(
+                    text(f"SELECT collection FROM {ALIAS_TABLE} WHERE alias = :alias"), {"alias": name}
+                ).scalar()
+                return target or name
+        except Exception as e:
+            logger.warning(f"Error resolving collection alias {name} (attempt {attempt + 1}/{attempts}): {str(e)}")
+            error = e
+            if attempt + 1 < attempts:
+                time.sleep(0.2 * (attempt + 1))
+    raise AliasResolutionError(f"Could not resolve collection alias {name}") from error
+
+def set_collection_alias(alias, collection_name):
+    """Atomically point alias at collection_name; returns the previous target (or None)"""
+    if VECTOR_STORE == "local":
+        import local_store
+        return local_store.set_alias(alias, collection_name)
+    with get_engine().begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {ALIAS_TABLE} ("
+            "alias text PRIMARY KEY, collection text NOT NULL, updated_at timestamptz NOT NULL DEFAULT now())"
+        ))
+        # Row lock: concurrent flips of the same alias are serialized
+        previous = conn.execute(
+            text(f"SELECT collection FROM {ALIAS_TABLE} WHERE alias = :alias FOR UPDATE"), {"alias": alias}
+        ).scalar()
+        conn.execute(
+            text(
+                f"INSERT INTO {ALIAS_TABLE} (alias, collection) VALUES (:alias, :collection) "
+                "ON CONFLICT (alias) DO UPDATE SET collection = EXCLUDED.collection, updated_at = now()"
+            ),
+            {"alias": alias, "collection": collection_name},
+        )
+    logger.info(f"Alias {alias} now points to {collection_name} (was {previous})")
+    return previous
+
+def update_chunk_metadata(collection_name, metadatas):
+    """Merge keys into the metadata of stored chunks, given as {chunk_id: metadata}"""
+    if not metadatas:
+        return 0
+    if VECTOR_STORE == "local":
+        import local_store
+        return local_store.update_metadata(collection_name, metadatas)
+    try:
+        with get_engine().begin() as conn:
+            updated = 0
+            for chunk_id, metadata in metadatas.items():
+                result = conn.execute(
+                    text(
+                        "UPDATE langchain_pg_embedding e "
+                        "SET cmetadata = (COALESCE(e.cmetadata::jsonb, '{}'::jsonb) || CAST(:metadata AS jsonb))::json "
+                        "FROM langchain_pg_collection c "
+                        "WHERE e.collection_id = c.uuid AND c.name = :name AND e.custom_id = :id"
+                    ),
+                    {"name": collection_name, "id": chunk_id, "metadata": json.dumps(metadata, ensure_ascii=False)},
+                )
+                updated += result.rowcount
+        return updated
+    except Exception as e:
+        logger.error(f"Error updating chunk metadata: {str(e)}")
+        return 0
+
+def compact_collection(collection_name=COLLECTION_NAME):
+    """Drop the rows replaced or deleted by earlier writes once they pile up; returns the rows dropped.
+
+    Only the local store needs this: PostgreSQL reclaims dead rows with autovacuum.
+    """
+    if VECTOR_STORE != "local":
+        return 0
+    import local_store
+    return local_store.compact(collection_name)
+
+# Collection version: bumped by every ingest so readers can drop cached answers
+def get_collection_version(collection_name=COLLECTION_NAME, default=None):
+    """Return the version recorded in the collection metadata, or None.
+
+    default is returned when the version cannot be read, so callers can
+    tell a database error from an unversioned collection.
+    """
+    if VECTOR_STORE == "local":
+        import local_store
+        return local_store.get_collection_version(collection_name)
+    try:
+        with get_engine().connect() as conn:
+            result = conn.execute(
+                text("SELECT cmetadata::jsonb ->> 'version' FROM langchain_pg_collection WHERE name = :name"),
+                {"name": collection_name},
+            )
+            return result.scalar()
+    except Exception as e:
+        logger.error(f"Error reading collection version: {str(e)}")
+        return default
+
+def bump_collection_version(collection_name=COLLECTION_NAME):
+    """Record a new version for the collection after its contents changed"""
+    if VECTOR_STORE == "local":
+        import local_store
+        return local_store.bump_collection_version(collection_name)
+    version = uuid.uuid4().hex
     
     try:
-        with engine.connect() as conn:
-            conn.execute(text(f"DROP TABLE IF EXISTS langchain_pg_embedding_{collection_name}"))
+        with get_engine().connect() as conn:
+            conn.execute(
+                text(
+                    "UPDATE langchain_pg_collection "
+                    "SET cmetadata = jsonb_set(COALESCE(cmetadata::jsonb, '{}'::jsonb), '{version}', to_jsonb(CAST(:version AS text)))::json "
+                    "WHERE name = :name"
+                ),
+                {"name": collection_name, "version": version},
+            )
             conn.commit()
-            logger.info(f"Collection {collection_name} deleted successfully")
-            return True
+            logger.info(f"Collection {collection_name} is now at version {version}")
+            return version
     except Exception as e:
-        logger.error(f"Error deleting collection: {str(e)}")
+        logger.error(f"Error bumping collection version: {str(e)}")
+        return None
+
+# Rows written per transaction by the bulk COPY writer
+COPY_COMMIT_ROWS = int(os.getenv("COPY_COMMIT_ROWS", "50000"))
+
+# Columns filled by the bulk writer, in COPY order
+_COPY_COLUMNS = "uuid, collection_id, embedding, document, cmetadata, custom_id"
+
+def to_vector_literal(embedding):
+    """Format an embedding as a pgvector text literal"""
+    return "[" + ",".join(str(float(x)) for x in embedding) + "]"
+
+def _copy_escape(value):
+    """Escape a value for PostgreSQL COPY text format"""
+    if value is None:
+        return "\\N"
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+class _CopyStream(io.RawIOBase):
+    """Read-only file object that encodes COPY rows lazily, so a load never builds one big buffer"""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self._buffer) < len(target):
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line.encode("utf-8")
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+class BulkVectorWriter:
+    """Stream embeddings into langchain_pg_embedding with COPY instead of per-row ORM inserts.
+
+    Rows are committed every commit_rows rows (or on commit()/close()). With
+    defer_indexes=True, secondary indexes on the embedding table are dropped on
+    open and rebuilt on close; the table is shared by all collections, so only
+    do this for offline loads.
+
+        with BulkVectorWriter("hr_documents", defer_indexes=True) as writer:
+            writer.write(texts, embeddings, metadatas, ids)
+    """
+
+    def __init__(self, collection_name=COLLECTION_NAME, defer_indexes=False, commit_rows=COPY_COMMIT_ROWS):
+        self.collection_name = collection_name
+        self.defer_indexes = defer_indexes
+        self.commit_rows = commit_rows
+        self.rows_written = 0
+        self._pending_rows = 0
+        self._deferred_indexes = []
+        self._conn = None
+        self._collection_id = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
+
+    def open(self):
+        # Dedicated connection: a bulk load must not hold a pooled connection
+        # or be cut off by the pool's statement timeout
+        self._conn = psycopg2.connect(get_connection_string())
+        with self._conn.cursor() as cursor:
+            cursor.execute("SELECT uuid FROM langchain_pg_collection WHERE name = %s", (self.collection_name,))
+            row = cursor.fetchone()
+        if row is None:
+            self._conn.close()
+            self._conn = None
+            raise ValueError(f"Collection {self.collection_name} not found")
+        self._collection_id = str(row[0])
+
+        if self.defer_indexes:
+            self._drop_secondary_indexes()
+
+    def _drop_secondary_indexes(self):
+        with self._conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT c.relname, pg_get_indexdef(i.indexrelid)
+                FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE i.indrelid = 'langchain_pg_embedding'::regclass
+                  AND NOT i.indisprimary AND NOT i.indisunique
+                """
+            )
+            self._deferred_indexes = cursor.fetchall()
+            for name, definition in self._deferred_indexes:
+                # Logged so the index can be recreated by hand if the load dies
+                logger.info(f"Deferring index {name}: {definition}")
+                cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+        self._conn.commit()
+
+    def _restore_indexes(self):
+        with self._conn.cursor() as cursor:
+            for name, definition in self._deferred_indexes:
+                start = time.perf_counter()
+                cursor.execute(definition)
+                self._conn.commit()
+                logger.info(f"Rebuilt index {name} in {time.perf_counter() - start:.1f}s")
+        self._deferred_indexes = []
+
+    def _rows(self, texts, embeddings, metadatas, ids):
+        for text_value, embedding, metadata, custom_id in zip(texts, embeddings, metadatas, ids):
+            yield "\t".join((
+                str(uuid.uuid4()),
+                self._collection_id,
+                to_vector_literal(embedding),
+                _copy_escape(text_value),
+                _copy_escape(json.dumps(metadata, ensure_ascii=False)),
+                _copy_escape(custom_id),
+            )) + "\n"
+
+    def write(self, texts, embeddings, metadatas=None, ids=None):
+        """COPY one batch of rows; returns the custom ids written"""
+        texts = list(texts)
+        if metadatas is None:
+            metadatas = [{} for _ in texts]
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in texts]
+
+        stream = io.BufferedReader(_CopyStream(self._rows(texts, embeddings, metadatas, ids)), buffer_size=1 << 16)
+        with self._conn.cursor() as cursor:
+            cursor.copy_expert(f"COPY langchain_pg_embedding ({_COPY_COLUMNS}) FROM STDIN", stream, size=1 << 16)
+
+        self.rows_written += len(texts)
+        self._pending_rows += len(texts)
+        if self._pending_rows >= self.commit_rows:
+            self.commit()
+        return ids
+
+    def commit(self):
+        self._conn.commit()
+        self._pending_rows = 0
+
+    def close(self, commit=True):
+        if self._conn is None:
+            return
+        try:
+            if commit:
+                self.commit()
+            else:
+                self._conn.rollback()
+        finally:
+            try:
+                # Indexes are rebuilt even after a failed load
+                if self._deferred_indexes:
+                    self._restore_indexes()
+            finally:
+                self._conn.close()
+                self._conn = None
+
+def _ensure_embedding_dimensions(cursor):
+    """ANN indexes need a fixed-size column; PGVector creates an untyped vector column"""
+    cursor.execute(
+        """
+        SELECT atttypmod FROM pg_attribute
+        WHERE attrelid = 'langchain_pg_embedding'::regclass AND attname = 'embedding'
+        """
+    )
+    dim = cursor.fetchone()[0]
+    if dim > 0:
+        return dim
+    cursor.execute("SELECT vector_dims(embedding) FROM langchain_pg_embedding LIMIT 1")
+    row = cursor.fetchone()
+    dim = row[0] if row else EMBEDDING_DIM
+    logger.info(f"Fixing langchain_pg_embedding.embedding to vector({dim})")
+    cursor.execute(f"ALTER TABLE langchain_pg_embedding ALTER COLUMN embedding TYPE vector({dim})")
+    return dim
+
+def get_vector_index_info(index_name=VECTOR_INDEX_NAME):
+    """Return name, definition and size of the ANN index, or None if it does not exist"""
+    with get_engine().connect() as conn:
+        row = conn.execute(
+            text(
+                "SELECT indexname, indexdef, pg_relation_size(quote_ident(indexname)::regclass) "
+                "FROM pg_indexes WHERE indexname = :name"
+            ),
+            {"name": index_name},
+        ).fetchone()
+    if row is None:
+        return None
+    return {"name": row[0], "definition": row[1], "size_bytes": row[2]}
+
+def create_vector_index(method=VECTOR_INDEX_TYPE, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION,
+                        lists=IVFFLAT_LISTS, rebuild=False, concurrently=False,
+                        index_name=None, maintenance_work_mem=None, storage="vector"):
+    """Create (or rebuild) the HNSW/IVFFlat index used by similarity search.
+
+    storage selects what is indexed (see STORAGE_MODE); each storage mode
+    has its own index. Returns the index info with the build time in
+    seconds; an existing index is left alone unless rebuild=True.
+    """
+    if method not in ("hnsw", "ivfflat"):
+        raise ValueError(f"Unknown index type: {method}")
+    if storage not in _STORAGE_EXPRESSIONS:
+        raise ValueError(f"Unknown storage mode: {storage}")
+    index_name = index_name or STORAGE_INDEX_NAMES[storage]
+
+    existing = get_vector_index_info(index_name)
+    if existing and not rebuild:
+        logger.info(f"Index {index_name} already exists ({existing['size_bytes'] / 2**20:.1f} MiB)")
+        return dict(existing, build_seconds=0.0)
+
+    if method == "hnsw":
+        options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    else:
+        options = f"lists = {int(lists)}"
+
+    # Dedicated connection: index builds outlive the pool's statement timeout,
+    # and CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    conn = psycopg2.connect(get_connection_string())
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            dim = _ensure_embedding_dimensions(cursor)
+            expression, opclass = _STORAGE_EXPRESSIONS[storage]
+            if maintenance_work_mem:
+                cursor.execute("SET maintenance_work_mem = %s", (maintenance_work_mem,))
+            if existing:
+                cursor.execute(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {index_name}")
+
+            start = time.perf_counter()
+            cursor.execute(
+                f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}{index_name} "
+                f"ON langchain_pg_embedding USING {method} ({expression.format(dim=dim)} {opclass}) WITH ({options})"
+            )
+            build_seconds = time.perf_counter() - start
+    finally:
+        conn.close()
+
+    info = get_vector_index_info(index_name)
+    info["build_seconds"] = build_seconds
+    logger.info(f"Built {method} index {index_name} in {build_seconds:.1f}s ({info['size_bytes'] / 2**20:.1f} MiB)")
+    return info
+
+def drop_vector_index(index_name=VECTOR_INDEX_NAME):
+    """Drop the ANN index; similarity search falls back to a sequential scan"""
+    try:
+        with get_engine().begin() as conn:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+        logger.info(f"Index {index_name} dropped")
+        return True
+    except Exception as e:
+        logger.error(f"Error dropping index: {str(e)}")
+        return False
+
+def migrate_storage_mode(mode=STORAGE_MODE, drop_full_index=False, **index_options):
+    """Build the index for a storage mode over every existing collection.
+
+    halfvec and binary are expression indexes over the full float32
+    embedding column, not halfvec/bit columns: the table keeps every
+    vector (binary mode re-ranks with them), so the heap and disk usage do
+    not shrink and no table rewrite is needed. New rows are indexed on
+    insert by both writers. With drop_full_index the float32 ANN index is
+    removed afterwards, which is where the memory is saved. Returns the
+    storage report, with the built index info under "index".
+    """
+    info = create_vector_index(storage=mode, **index_options)
+    if drop_full_index and mode != "vector":
+        drop_vector_index(STORAGE_INDEX_NAMES["vector"])
+    logger.info(f"Storage mode {mode} ready ({info['size_bytes'] / 2**20:.1f} MiB index)")
+    report = get_storage_report()
+    report["index"] = info
+    return report
+
+def get_storage_report():
+    """Size of the embedding table and of each storage mode's index (None if not built)"""
+    with get_engine().connect() as conn:
+        table = conn.execute(text(
+            "SELECT pg_table_size('langchain_pg_embedding'), "
+            "(SELECT count(*) FROM langchain_pg_embedding)"
+        )).fetchone()
+    report = {"table_bytes": table[0], "rows": table[1], "indexes": {}}
+    for mode, index_name in STORAGE_INDEX_NAMES.items():
+        info = get_vector_index_info(index_name)
+        report["indexes"][mode] = info["size_bytes"] if info else None
+    return report
+
+def create_metadata_index(key):
+    """Index a metadata field so filtered similarity search can narrow rows before ranking"""
+    if VECTOR_STORE == "local":
+        return True
+    index_name = f"ix_langchain_pg_embedding_meta_{key}"
+    try:
+        with get_engine().begin() as conn:
+            # Matches the cmetadata ->> 'key' = value predicate PGVector emits for filters
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {index_name} "
+                f"ON langchain_pg_embedding (collection_id, (cmetadata ->> '{key}'))"
+            ))
+        return True
+    except Exception as e:
+        logger.error(f"Error creating metadata index on {key}: {str(e)}")
         return False
@@ -0,0 +1,164 @@
+import os
+import re
+import zlib
+import base64
+import unicodedata
+from collections import namedtuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Tải biến môi trường
+load_dotenv()
+
+# Near-duplicate chunks are not embedded; the kept copy lists every origin in its metadata
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# Estimated Jaccard similarity of word shingles at which two chunks count as duplicates
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+# MinHash signature length and LSH bands (rows per band = NUM_PERM / BANDS)
+DEDUP_NUM_PERM = 64
+DEDUP_BANDS = 16
+# Words per shingle
+SHINGLE_SIZE = 3
+
+# Largest prime below 2**32: (a * x + b) stays below 2**64 for 32-bit shingle hashes
+_PRIME = 4294967291
+# Fixed seed: signatures are stored in the ingest manifest and compared across runs
+_SEED = 1
+
+# A skipped chunk: where it came from and the stored chunk it duplicates
+Match = namedtuple("Match", ["source", "index", "kept_id", "similarity"])
+
+def dedup_settings(enabled=DEDUP_ENABLED):
+    """Settings stored in the manifest; changing them re-embeds everything"""
+    if not enabled:
+        return None
+    return {
+        "threshold": DEDUP_THRESHOLD,
+        "num_perm": DEDUP_NUM_PERM,
+        "shingle_size": SHINGLE_SIZE,
+        # Chunks are only compared within a category, so category filters still find every copy
+        "scope": "category",
+    }
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Word n-grams of the normalized text (the whole text if shorter than n words)"""
+    words = re.findall(r"\w+", unicodedata.normalize("NFC", text).lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+class MinHasher:
+    """MinHash signatures from universal hashes of the crc32 of each shingle"""
+
+    def __init__(self, num_perm=DEDUP_NUM_PERM, shingle_size=SHINGLE_SIZE, seed=_SEED):
+        rng = np.random.default_rng(seed)
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text, self.shingle_size)),
+            dtype=np.uint64,
+        )
+        return ((hashes[:, None] * self.a + self.b) % _PRIME).min(axis=0).astype(np.uint32)
+
+def encode_signature(signature):
+    return base64.b64encode(signature.tobytes()).decode("ascii")
+
+def decode_signature(value):
+    return np.frombuffer(base64.b64decode(value), dtype=np.uint32)
+
+class DedupIndex:
+    """LSH index of kept chunks: signatures sharing any band are compared in full"""
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS):
+        self.threshold = threshold
+        self.rows = num_perm // bands
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = {}
+
+    def _keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(len(self.buckets))]
+
+    def add(self, chunk_id, signature):
+        self.signatures[chunk_id] = signature
+        for bucket, key in zip(self.buckets, self._keys(signature)):
+            bucket.setdefault(key, []).append(chunk_id)
+
+    def find(self, signature):
+        """(chunk_id, similarity) of the most similar kept chunk above the threshold, or None"""
+        candidates = set()
+        for bucket, key in zip(self.buckets, self._keys(signature)):
+            candidates.update(bucket.get(key, ()))
+        best = None
+        for chunk_id in candidates:
+            similarity = float(np.mean(self.signatures[chunk_id] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (chunk_id, similarity)
+        return best
+
+    def __len__(self):
+        return len(self.signatures)
+
+class ChunkDeduplicator:
+    """Pipeline stage between splitting and embedding that drops near-duplicate chunks.
+
+    The first copy of a chunk is kept; later copies are recorded in
+    matches and never reach the embedder. Only signatures and positions are
+    remembered, not texts. Chunks are only compared with chunks of the same
+    category (one LSH index each): the kept copy carries a single category,
+    and a copy from another category would be invisible to that category's
+    filter. The indexes may be seeded with chunks stored by earlier runs.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS):
+        self.hasher = MinHasher(num_perm)
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        # One index per category
+        self.indexes = {}
+        # (signature, source, index) of every chunk kept by this run
+        self.kept = {}
+        self.matches = []
+        self.seen = 0
+
+    def _index_for(self, scope):
+        index = self.indexes.get(scope)
+        if index is None:
+            index = self.indexes[scope] = DedupIndex(self.threshold, self.num_perm, self.bands)
+        return index
+
+    def seed(self, chunk_id, signature, scope=None):
+        self._index_for(scope).add(chunk_id, signature)
+
+    def filter(self, chunks):
+        for chunk in chunks:
+            self.seen += 1
+            signature = self.hasher.signature(chunk.text)
+            index = self._index_for(chunk.metadata.get("category"))
+            match = index.find(signature)
+            if match is not None:
+                self.matches.append(Match(chunk.source, chunk.index, match[0], match[1]))
+                continue
+            index.add(chunk.id, signature)
+            self.kept[chunk.id] = (signature, chunk.source, chunk.index)
+            yield chunk
+
+    def origins(self):
+        """Sources of each kept chunk that has duplicates in this run: {kept_id: [source, ...]}"""
+        origins = {}
+        for match in self.matches:
+            sources = origins.setdefault(match.kept_id, [self.kept[match.kept_id][1]] if match.kept_id in self.kept else [])
+            if match.source not in sources:
+                sources.append(match.source)
+        return origins
+
+    def stats(self):
+        return {
+            "chunks": self.seen,
+            "kept": self.seen - len(self.matches),
+            "duplicates": len(self.matches),
+        }
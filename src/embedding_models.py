@@ -0,0 +1,88 @@
+import os
+import logging
+import threading
+
+from dotenv import load_dotenv
+
+# Tải biến môi trường
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Embedding model shared by ingest, retrieval and the database helpers
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+# Inference backend:
+#   torch      - full-precision PyTorch (default)
+#   onnx       - ONNX Runtime export of the same model
+#   onnx-int8  - ONNX Runtime with the dynamically quantized int8 export shipped with the model
+#   int8       - PyTorch with Linear layers dynamically quantized to int8
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8", "int8")
+
+# Texts per forward pass and CPU threads used by the backend (0 = library default)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+# Quantized ONNX file inside the model repository; quint8_avx2 runs on any x86-64 CPU
+EMBEDDING_ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+
+_models = {}
+_models_lock = threading.Lock()
+
+def _onnx_model_kwargs(threads, file_name=None):
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    if file_name:
+        model_kwargs["file_name"] = file_name
+    if threads:
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = threads
+        model_kwargs["session_options"] = session_options
+    return model_kwargs
+
+def _build_embeddings(backend, batch_size, threads):
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    model_kwargs = {"device": "cpu"}
+    if backend == "onnx":
+        model_kwargs.update(backend="onnx", model_kwargs=_onnx_model_kwargs(threads))
+    elif backend == "onnx-int8":
+        model_kwargs.update(backend="onnx", model_kwargs=_onnx_model_kwargs(threads, EMBEDDING_ONNX_INT8_FILE))
+    elif threads:
+        import torch
+
+        torch.set_num_threads(threads)
+
+    # Imported here so modules that only pass embeddings around load without the model stack
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": batch_size},
+    )
+
+    if backend == "int8":
+        import torch
+
+        # Weights of every Linear layer become int8; activations are quantized on the fly
+        torch.quantization.quantize_dynamic(embeddings._client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    return embeddings
+
+def get_embeddings(backend=None, batch_size=None, threads=None):
+    """Trả về mô hình embedding dùng chung (mỗi cấu hình chỉ nạp một lần cho mỗi tiến trình)"""
+    backend = backend or EMBEDDING_BACKEND
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    threads = EMBEDDING_THREADS if threads is None else threads
+    key = (backend, batch_size, threads)
+
+    if key not in _models:
+        with _models_lock:
+            if key not in _models:
+                logger.info(f"Loading embedding model {EMBEDDING_MODEL} (backend={backend}, batch_size={batch_size}, threads={threads or 'default'})")
+                _models[key] = _build_embeddings(backend, batch_size, threads)
+    return _models[key]
@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfminer
+from dotenv import load_dotenv
+from pdfminer.high_level import extract_text
+from pdfminer.pdfpage import PDFPage
+
+# Tải biến môi trường
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Processes extracting PDF text (0 = one per CPU, 1 = in the calling process)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0"))
+# Pages per extraction task: long PDFs are split so one file can use every worker
+EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "8"))
+# Extracted text per file, keyed by content hash and extractor version
+EXTRACT_CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", os.path.join(BASE_DIR, "cache", "extracted"))
+# Bump the suffix when the extraction itself changes, so cached text is not reused
+EXTRACTOR_VERSION = f"pdfminer-{pdfminer.__version__}-1"
+
+def file_hash(path):
+    """Tính SHA-256 nội dung file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_worker_count(workers=EXTRACT_WORKERS):
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+def get_cache_path(sha256, cache_dir=EXTRACT_CACHE_DIR):
+    return os.path.join(cache_dir, f"{sha256}-{EXTRACTOR_VERSION}.json")
+
+def read_cache(sha256, cache_dir=EXTRACT_CACHE_DIR):
+    """Cached {"pages", "text"} of a file, or None"""
+    path = get_cache_path(sha256, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable extraction cache {path}: {str(e)}")
+        return None
+
+def write_cache(sha256, entry, cache_dir=EXTRACT_CACHE_DIR):
+    """Ghi cache một cách nguyên tử (ghi file tạm rồi đổi tên)"""
+    path = get_cache_path(sha256, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def count_pdf_pages(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in PDFPage.get_pages(f))
+
+def extract_pages(path, first, last):
+    """Text of pages [first, last), each followed by a form feed like a whole-file extract_text"""
+    return extract_text(path, page_numbers=range(first, last))
+
+def page_ranges(pages, pages_per_task=EXTRACT_PAGES_PER_TASK):
+    return [(first, min(first + pages_per_task, pages)) for first in range(0, pages, pages_per_task)]
+
+def extract_pdfs(paths, workers=EXTRACT_WORKERS, hashes=None, use_cache=True, cache_dir=EXTRACT_CACHE_DIR,
+                 pages_per_task=EXTRACT_PAGES_PER_TASK, stats=None):
+    """Yield (path, text, pages) for each PDF, in the order given.
+
+    Uncached files are split into page ranges that run in a process pool
+    (spawned, so workers do not inherit the caller's threads). Only about
+    two tasks per worker are submitted ahead of the consumer, which keeps
+    memory bounded for large directories. hashes may map paths to known
+    SHA-256 digests; stats, if given, collects pages/files/cache hits.
+    """
+    hashes = hashes or {}
+    stats = stats if stats is not None else {}
+    for key in ("files", "pages", "cached_files", "tasks"):
+        stats.setdefault(key, 0)
+    workers = get_worker_count(workers)
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    # (path, sha256, cached entry or list of futures, pages)
+    window = deque()
+    in_flight = 0
+    remaining = iter(paths)
+
+    def submit(path):
+        sha256 = hashes.get(path) or file_hash(path)
+        entry = read_cache(sha256, cache_dir) if use_cache else None
+        if entry is not None:
+            stats["cached_files"] += 1
+            return (path, sha256, entry, entry["pages"]), 0
+        pages = count_pdf_pages(path)
+        ranges = page_ranges(pages, pages_per_task) or [(0, 0)]
+        stats["tasks"] += len(ranges)
+        if executor is None:
+            return (path, sha256, [extract_pages(path, first, last) for first, last in ranges], pages), 0
+        futures = [executor.submit(extract_pages, path, first, last) for first, last in ranges]
+        return (path, sha256, futures, pages), len(futures)
+
+    try:
+        while True:
+            while in_flight < workers * 2 and len(window) < workers * 2:
+                path = next(remaining, None)
+                if path is None:
+                    break
+                item, tasks = submit(path)
+                window.append(item)
+                in_flight += tasks
+            if not window:
+                return
+            path, sha256, parts, pages = window.popleft()
+            if isinstance(parts, dict):
+                text = parts["text"]
+            else:
+                if executor is not None:
+                    in_flight -= len(parts)
+                    parts = [future.result() for future in parts]
+                text = "".join(parts)
+                if use_cache:
+                    write_cache(sha256, {"pages": pages, "text": text}, cache_dir)
+            stats["files"] += 1
+            stats["pages"] += pages
+            yield path, text, pages
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
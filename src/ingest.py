@@ -1,36 +1,589 @@
 import os
+import sys
+import json
+import uuid
+import queue
+import hashlib
 import argparse
-from langchain_community.document_loaders import DirectoryLoader, TextLoader, PDFMinerLoader
+import threading
+from collections import namedtuple
+from langchain_community.document_loaders import TextLoader, PDFMinerLoader
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from dotenv import load_dotenv
 
 # Import the custom database utilities
-from db_utils import init_database, get_pgvector_store, delete_collection, collection_exists
+from db_utils import (
+    init_database,
+    get_vector_store,
+    delete_collection,
+    collection_exists,
+    bump_collection_version,
+    create_metadata_index,
+    create_text_search_index,
+    update_chunk_metadata,
+    compact_collection,
+    resolve_collection,
+    AliasResolutionError,
+    BulkVectorWriter,
+    RETRIEVER_MODE,
+    VECTOR_STORE,
+)
+from embedding_models import get_embeddings
+from extract import extract_pdfs, file_hash, EXTRACT_WORKERS
+from dedup import ChunkDeduplicator, DEDUP_ENABLED, dedup_settings, encode_signature, decode_signature
 
 # Tải biến môi trường
 load_dotenv()
 
 # Cấu hình đường dẫn
-DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+DATA_PATH = os.path.join(BASE_DIR, "data")
+
+# Manifests of already ingested files, one per collection
+MANIFEST_DIR = os.path.join(BASE_DIR, "cache", "manifests")
+
+# Progress of an interrupted ingest run, one per collection
+CHECKPOINT_DIR = os.path.join(BASE_DIR, "cache", "checkpoints")
 
 # Default collection name for documents
 COLLECTION_NAME = "hr_documents"
 
-def load_documents():
+# Chunking parameters (part of the manifest so changing them forces a re-embed)
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+# Pipeline settings: chunks per embedding/insert batch and embedded batches
+# allowed to wait for the database writer
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "2"))
+
+# How batches are written: "orm" (PGVector.add_embeddings) or "copy" (bulk COPY)
+WRITER = os.getenv("INGEST_WRITER", "orm")
+
+# A chunk flowing through the ingest pipeline
+Chunk = namedtuple("Chunk", ["id", "text", "metadata", "source", "index"])
+
+# Marks the end of the write queue
+_DONE = object()
+
+# Category rules: the first category whose keyword appears in the file's path
+# (relative to data/, lower-cased) is stored in the chunk metadata
+CATEGORY_RULES = [
+    ("Tuyển dụng", ("tuyen-dung", "tuyen_dung", "tuyển dụng", "recruit", "hiring")),
+    ("Onboarding", ("onboarding", "hoi-nhap", "hội nhập")),
+    ("Phúc lợi", ("phuc-loi", "phuc_loi", "phúc lợi", "benefit", "bao-hiem", "bảo hiểm", "insurance")),
+    ("Đánh giá", ("danh-gia", "danh_gia", "đánh giá", "review", "performance", "kpi")),
+    ("Quy định", ("quy-dinh", "quy_dinh", "quy định", "noi-quy", "nội quy", "regulation", "policies", "policy")),
+]
+DEFAULT_CATEGORY = "Khác"
+
+# Loader class per file extension
+LOADER_CLASSES = {
+    ".pdf": PDFMinerLoader,
+    ".txt": TextLoader,
+}
+
+def load_documents(data_path=DATA_PATH, workers=EXTRACT_WORKERS):
     """Tải tất cả tài liệu từ thư mục data"""
-    loaders = {
-        "pdf": DirectoryLoader(f"{DATA_PATH}", glob="**/*.pdf", loader_cls=PDFMinerLoader),
-        "txt": DirectoryLoader(f"{DATA_PATH}", glob="**/*.txt", loader_cls=TextLoader),
-    }
-    
+    print("Loading documents...")
     documents = []
-    for loader_type, loader in loaders.items():
-        print(f"Loading {loader_type} documents...")
-        documents.extend(loader.load())
+    for _, file_documents in iter_loaded_files(list(iter_source_files(data_path)), workers=workers):
+        documents.extend(file_documents)
     
     return documents
 
+def iter_documents(data_path=DATA_PATH, workers=EXTRACT_WORKERS):
+    """Tải lần lượt từng file, chỉ giữ vài file trong bộ nhớ tại một thời điểm"""
+    for _, file_documents in iter_loaded_files(iter_source_files(data_path), workers=workers):
+        yield from file_documents
+
+def categorize(path, data_path=DATA_PATH):
+    """Xác định danh mục của tài liệu từ tên thư mục/tên file"""
+    rel_path = os.path.relpath(path, data_path) if os.path.isabs(path) else path
+    rel_path = rel_path.lower()
+    for category, keywords in CATEGORY_RULES:
+        if any(keyword in rel_path for keyword in keywords):
+            return category
+    return DEFAULT_CATEGORY
+
+def get_text_splitter():
+    """Tạo text splitter dùng chung cho mọi chế độ ingest"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+    )
+
+def iter_source_files(data_path=DATA_PATH):
+    """Liệt kê các file tài liệu được hỗ trợ trong thư mục data (theo thứ tự ổn định)"""
+    for root, dirs, files in os.walk(data_path):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in LOADER_CLASSES:
+                yield os.path.join(root, name)
+
+def load_file(path):
+    """Tải một file tài liệu với loader tương ứng"""
+    loader_cls = LOADER_CLASSES[os.path.splitext(path)[1].lower()]
+    return loader_cls(path).load()
+
+def is_pdf(path):
+    return os.path.splitext(path)[1].lower() == ".pdf"
+
+def iter_loaded_files(paths, workers=EXTRACT_WORKERS, hashes=None):
+    """Yield (path, documents) in order.
+
+    PDFs are extracted ahead of the consumer by extract_pdfs (process pool,
+    cached by content hash), giving the same single document per file as
+    PDFMinerLoader; other files go through their loader.
+    """
+    paths = list(paths)
+    pdfs = extract_pdfs([path for path in paths if is_pdf(path)], workers=workers, hashes=hashes)
+    try:
+        for path in paths:
+            if is_pdf(path):
+                _, text, _ = next(pdfs)
+                yield path, [Document(page_content=text, metadata={"source": path})]
+            else:
+                yield path, load_file(path)
+    finally:
+        pdfs.close()
+
+def chunk_ids_for(rel_path, content_hash, count):
+    """Sinh ID cố định cho các chunk của một file (cùng nội dung -> cùng ID)"""
+    return [str(uuid.uuid5(uuid.NAMESPACE_URL, f"{rel_path}:{content_hash}:{i}")) for i in range(count)]
+
+def get_manifest_path(collection_name=COLLECTION_NAME):
+    return os.path.join(MANIFEST_DIR, f"{collection_name}.json")
+
+def empty_manifest(dedup=DEDUP_ENABLED):
+    return {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "dedup": dedup_settings(dedup),
+        "files": {},
+    }
+
+def load_manifest(collection_name=COLLECTION_NAME):
+    """Đọc manifest của collection, trả về manifest rỗng nếu chưa có"""
+    path = get_manifest_path(collection_name)
+    if not os.path.exists(path):
+        return empty_manifest()
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, collection_name=COLLECTION_NAME):
+    """Ghi manifest một cách nguyên tử (ghi file tạm rồi đổi tên)"""
+    path = get_manifest_path(collection_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def reset_manifest(collection_name=COLLECTION_NAME):
+    """Xoá manifest khi collection được tạo lại"""
+    path = get_manifest_path(collection_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+def plan_incremental(manifest, data_path=DATA_PATH, force=False, dedup=DEDUP_ENABLED):
+    """So sánh thư mục data với manifest.
+
+    Returns (changed, removed, unchanged_count) where changed is a list of
+    (rel_path, path, sha256, stat) tuples for new or modified files and
+    removed is a list of rel_paths that no longer exist. With force=True
+    every file is reported as changed.
+    """
+    entries = manifest["files"]
+    reembed_all = (
+        force
+        or manifest.get("chunk_size") != CHUNK_SIZE
+        or manifest.get("chunk_overlap") != CHUNK_OVERLAP
+        or manifest.get("dedup") != dedup_settings(dedup)
+    )
+
+    changed = []
+    seen = set()
+    unchanged_count = 0
+    for path in iter_source_files(data_path):
+        rel_path = os.path.relpath(path, data_path)
+        seen.add(rel_path)
+        stat = os.stat(path)
+        entry = entries.get(rel_path)
+
+        # Cheap check first: same size and mtime means the file was not touched
+        if (
+            entry is not None
+            and not reembed_all
+            and entry.get("size") == stat.st_size
+            and entry.get("mtime") == stat.st_mtime
+        ):
+            unchanged_count += 1
+            continue
+
+        sha256 = file_hash(path)
+        if entry is not None and not reembed_all and entry.get("sha256") == sha256:
+            # Touched but identical content: only refresh the stat fields
+            entry["size"] = stat.st_size
+            entry["mtime"] = stat.st_mtime
+            unchanged_count += 1
+            continue
+
+        changed.append((rel_path, path, sha256, stat))
+
+    removed = [rel_path for rel_path in entries if rel_path not in seen]
+    return changed, removed, unchanged_count
+
+def chunk_owners(manifest):
+    """File of every chunk id recorded in the manifest"""
+    return {
+        chunk_id: rel_path
+        for rel_path, entry in manifest["files"].items()
+        for chunk_id in entry.get("chunk_ids", [])
+    }
+
+def expand_for_duplicates(manifest, changed, removed, data_path=DATA_PATH):
+    """Add unchanged files whose skipped duplicates point at chunks about to be replaced.
+
+    Those files were deduplicated against a copy that is going away, so they
+    are processed again and either keep their own copy or match another one.
+    """
+    owners = chunk_owners(manifest)
+    affected = set(removed) | {rel_path for rel_path, _, _, _ in changed}
+    changed = list(changed)
+    while True:
+        added = [
+            rel_path for rel_path, entry in manifest["files"].items()
+            if rel_path not in affected
+            and any(owners.get(kept_id) in affected for kept_id in entry.get("duplicates", {}).values())
+        ]
+        if not added:
+            return changed
+        for rel_path in added:
+            path = os.path.join(data_path, rel_path)
+            changed.append((rel_path, path, manifest["files"][rel_path]["sha256"], os.stat(path)))
+            affected.add(rel_path)
+
+def seed_deduplicator(deduplicator, manifest, skip):
+    """Index the chunks already stored for files outside this run"""
+    for rel_path, entry in manifest["files"].items():
+        if rel_path in skip:
+            continue
+        chunk_ids = entry.get("chunk_ids", [])
+        category = categorize(rel_path)
+        for index, signature in entry.get("signatures", {}).items():
+            deduplicator.seed(chunk_ids[int(index)], decode_signature(signature), category)
+
+def collect_origins(manifest, chunk_ids):
+    """Files holding a copy of each given stored chunk, itself first: {chunk_id: [rel_path, ...]}"""
+    owners = chunk_owners(manifest)
+    origins = {chunk_id: [owners[chunk_id]] for chunk_id in chunk_ids if chunk_id in owners}
+    for rel_path, entry in manifest["files"].items():
+        for kept_id in entry.get("duplicates", {}).values():
+            sources = origins.get(kept_id)
+            if sources is not None and rel_path not in sources:
+                sources.append(rel_path)
+    return origins
+
+def get_checkpoint_path(collection_name=COLLECTION_NAME):
+    return os.path.join(CHECKPOINT_DIR, f"{collection_name}.json")
+
+def load_checkpoint(collection_name=COLLECTION_NAME):
+    """Đọc checkpoint của lần ingest bị gián đoạn (nếu có)"""
+    path = get_checkpoint_path(collection_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_checkpoint(checkpoint, collection_name=COLLECTION_NAME):
+    path = get_checkpoint_path(collection_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def reset_checkpoint(collection_name=COLLECTION_NAME):
+    path = get_checkpoint_path(collection_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+def plan_signature(changed, removed, dedup=DEDUP_ENABLED):
+    """Dấu vân tay của một kế hoạch ingest, dùng để nhận biết checkpoint còn hợp lệ"""
+    payload = {
+        "changed": [(rel_path, sha256) for rel_path, _, sha256, _ in changed],
+        "removed": sorted(removed),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "dedup": dedup_settings(dedup),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+def iter_batches(items, batch_size):
+    """Gom một iterable thành các batch có kích thước cố định"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_document_chunks(documents, text_splitter=None):
+    """Chia nhỏ từng tài liệu khi cần, không giữ toàn bộ danh sách chunk trong bộ nhớ"""
+    text_splitter = text_splitter or get_text_splitter()
+    for document in documents:
+        source = document.metadata.get("source", "")
+        category = document.metadata.get("category") or categorize(source)
+        for index, chunk in enumerate(text_splitter.split_documents([document])):
+            chunk.metadata["category"] = category
+            yield Chunk(str(uuid.uuid4()), chunk.page_content, chunk.metadata, source, index)
+
+def iter_file_chunks(changed, chunk_counts, text_splitter=None, data_path=DATA_PATH, workers=EXTRACT_WORKERS):
+    """Tải và chia nhỏ từng file một; ghi số chunk của mỗi file vào chunk_counts"""
+    text_splitter = text_splitter or get_text_splitter()
+    loaded = iter_loaded_files(
+        [path for _, path, _, _ in changed],
+        workers=workers,
+        hashes={path: sha256 for _, path, sha256, _ in changed},
+    )
+    for (rel_path, path, sha256, _), (_, documents) in zip(changed, loaded):
+        chunks = text_splitter.split_documents(documents)
+        ids = chunk_ids_for(rel_path, sha256, len(chunks))
+        chunk_counts[rel_path] = len(chunks)
+        category = categorize(rel_path)
+        for index, (chunk_id, chunk) in enumerate(zip(ids, chunks)):
+            chunk.metadata["category"] = category
+            yield Chunk(chunk_id, chunk.page_content, chunk.metadata, rel_path, index)
+
+def store_label():
+    """Name of the vector store written to, for the ingest summary"""
+    return "local" if VECTOR_STORE == "local" else "PostgreSQL"
+
+def open_batch_writer(vectordb, collection_name=COLLECTION_NAME, writer=WRITER, defer_indexes=False):
+    """Trả về (write, close) cho backend ghi đã chọn; mỗi lần write là một transaction"""
+    if VECTOR_STORE == "local":
+        # The local store appends to its files directly; there is no separate bulk path
+        writer = "orm"
+    if writer == "copy":
+        bulk = BulkVectorWriter(collection_name, defer_indexes=defer_indexes)
+        bulk.open()
+
+        def write(texts, vectors, metadatas, ids):
+            bulk.write(texts, vectors, metadatas, ids)
+            bulk.commit()
+
+        return write, bulk.close
+
+    if writer != "orm":
+        raise ValueError(f"Unknown writer: {writer}")
+
+    def write(texts, vectors, metadatas, ids):
+        vectordb.add_embeddings(texts=texts, embeddings=vectors, metadatas=metadatas, ids=ids)
+
+    return write, lambda commit=True: None
+
+def run_pipeline(chunks, embeddings, write_batch, batch_size=BATCH_SIZE, queue_depth=QUEUE_DEPTH,
+                 skip_batches=0, on_commit=None):
+    """Embed chunks theo batch trong khi một luồng nền ghi các batch trước vào DB.
+
+    At most queue_depth embedded batches wait for the writer, so memory stays
+    bounded by batch_size * (queue_depth + 2) chunks. The first skip_batches
+    batches are assumed committed by an earlier run and are not embedded.
+    on_commit(batch_index, batch) runs on the writer thread after each write.
+    """
+    write_queue = queue.Queue(maxsize=max(1, queue_depth))
+    errors = []
+    stats = {"batches": 0, "chunks": 0, "skipped_batches": 0}
+
+    def write_loop():
+        while True:
+            item = write_queue.get()
+            if item is _DONE:
+                return
+            if errors:
+                # Keep draining so the producer never blocks on a dead writer
+                continue
+            batch_index, batch, vectors = item
+            try:
+                write_batch(batch_index, batch, vectors)
+                if on_commit:
+                    on_commit(batch_index, batch)
+                stats["batches"] += 1
+                stats["chunks"] += len(batch)
+            except Exception as e:
+                errors.append(e)
+
+    writer = threading.Thread(target=write_loop, name="ingest-writer", daemon=True)
+    writer.start()
+    try:
+        for batch_index, batch in enumerate(iter_batches(chunks, batch_size)):
+            if errors:
+                break
+            if batch_index < skip_batches:
+                stats["skipped_batches"] += 1
+                continue
+            vectors = embeddings.embed_documents([chunk.text for chunk in batch])
+            write_queue.put((batch_index, batch, vectors))
+    finally:
+        write_queue.put(_DONE)
+        writer.join()
+
+    if errors:
+        raise errors[0]
+    return stats
+
+def ingest_files(collection_name=COLLECTION_NAME, data_path=DATA_PATH, incremental=True,
+                 batch_size=BATCH_SIZE, queue_depth=QUEUE_DEPTH, writer=WRITER, defer_indexes=False,
+                 dedup=DEDUP_ENABLED, extract_workers=EXTRACT_WORKERS):
+    """Ingest thư mục data qua pipeline theo batch, có thể tiếp tục sau khi bị gián đoạn.
+
+    In incremental mode only new or modified files are embedded; otherwise every
+    file is re-embedded, replacing the chunks recorded in the manifest. Removed
+    files always have their chunks deleted. With dedup, near-duplicate chunks
+    are skipped and the stored copy lists every file holding it in its
+    "origins" metadata.
+    """
+    init_database()
+
+    manifest = load_manifest(collection_name)
+    if manifest["files"] and not collection_exists(collection_name):
+        print(f"Collection '{collection_name}' not found, rebuilding manifest from scratch")
+        manifest = empty_manifest(dedup)
+
+    changed, removed, unchanged_count = plan_incremental(manifest, data_path, force=not incremental, dedup=dedup)
+    if dedup and (changed or removed):
+        changed = expand_for_duplicates(manifest, changed, removed, data_path)
+    print(f"Ingest plan: {len(changed)} new/modified, {len(removed)} removed, {unchanged_count} unchanged")
+
+    if not changed and not removed:
+        # Persist refreshed stat fields so the next run stays on the fast path
+        save_manifest(manifest, collection_name)
+        return None
+
+    # Only load the embedding model when something actually needs embedding
+    embeddings = get_embeddings()
+    vectordb = get_vector_store(collection_name=collection_name, embedding_function=embeddings)
+
+    signature = plan_signature(changed, removed, dedup)
+    checkpoint = load_checkpoint(collection_name)
+    if checkpoint is not None and checkpoint.get("signature") != signature:
+        # The data changed since the interrupted run: drop what it wrote and start over
+        stale_ids = []
+        for rel_path, entry in checkpoint.get("files", {}).items():
+            if manifest["files"].get(rel_path, {}).get("sha256") != entry["sha256"]:
+                stale_ids.extend(chunk_ids_for(rel_path, entry["sha256"], entry["chunks"]))
+        if stale_ids:
+            vectordb.delete(ids=stale_ids)
+        print(f"Discarded stale checkpoint ({len(stale_ids)} chunks)")
+        checkpoint = None
+
+    resuming = checkpoint is not None
+    if resuming:
+        print(f"Resuming after {checkpoint['committed_batches']} committed batches")
+    else:
+        # Drop chunks of removed files and of the previous version of changed files
+        old_ids = []
+        for rel_path in removed:
+            old_ids.extend(manifest["files"][rel_path].get("chunk_ids", []))
+        for rel_path, _, _, _ in changed:
+            old_ids.extend(manifest["files"].get(rel_path, {}).get("chunk_ids", []))
+        if old_ids:
+            vectordb.delete(ids=old_ids)
+            print(f"Deleted {len(old_ids)} outdated chunks")
+        checkpoint = {"signature": signature, "committed_batches": 0, "files": {}}
+        save_checkpoint(checkpoint, collection_name)
+
+    skip_batches = checkpoint["committed_batches"]
+
+    write, close_writer = open_batch_writer(vectordb, collection_name, writer=writer, defer_indexes=defer_indexes)
+
+    def write_batch(batch_index, batch, vectors):
+        ids = [chunk.id for chunk in batch]
+        if resuming and batch_index == skip_batches:
+            # This batch may have been committed right before the interruption
+            vectordb.delete(ids=ids)
+        write([chunk.text for chunk in batch], vectors, [chunk.metadata for chunk in batch], ids)
+
+    sha_by_path = {rel_path: sha256 for rel_path, _, sha256, _ in changed}
+
+    def on_commit(batch_index, batch):
+        for chunk in batch:
+            entry = checkpoint["files"].setdefault(chunk.source, {"sha256": sha_by_path[chunk.source], "chunks": 0})
+            entry["chunks"] = max(entry["chunks"], chunk.index + 1)
+        checkpoint["committed_batches"] = batch_index + 1
+        save_checkpoint(checkpoint, collection_name)
+        print(f"Committed batch {batch_index + 1} ({len(batch)} chunks)")
+
+    chunk_counts = {}
+    chunks = iter_file_chunks(changed, chunk_counts, data_path=data_path, workers=extract_workers)
+    deduplicator = None
+    if dedup:
+        # Replayed from the start on resume, so skipped batches line up with the checkpoint
+        deduplicator = ChunkDeduplicator()
+        seed_deduplicator(deduplicator, manifest, set(removed) | set(sha_by_path))
+        chunks = deduplicator.filter(chunks)
+    try:
+        stats = run_pipeline(
+            chunks,
+            embeddings,
+            write_batch,
+            batch_size=batch_size,
+            queue_depth=queue_depth,
+            skip_batches=skip_batches,
+            on_commit=on_commit,
+        )
+    finally:
+        close_writer()
+
+    # Stored chunks whose list of duplicates changes in this run
+    patched_ids = set()
+    for rel_path in list(removed) + list(sha_by_path):
+        patched_ids.update(manifest["files"].get(rel_path, {}).get("duplicates", {}).values())
+
+    # Only now does the manifest reflect the new state of the collection
+    for rel_path in removed:
+        del manifest["files"][rel_path]
+    for rel_path, _, sha256, stat in changed:
+        manifest["files"][rel_path] = {
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "chunk_ids": chunk_ids_for(rel_path, sha256, chunk_counts.get(rel_path, 0)),
+        }
+    if deduplicator is not None:
+        for signature, rel_path, index in deduplicator.kept.values():
+            manifest["files"][rel_path].setdefault("signatures", {})[str(index)] = encode_signature(signature)
+        for match in deduplicator.matches:
+            manifest["files"][match.source].setdefault("duplicates", {})[str(match.index)] = match.kept_id
+            patched_ids.add(match.kept_id)
+    manifest["chunk_size"] = CHUNK_SIZE
+    manifest["chunk_overlap"] = CHUNK_OVERLAP
+    manifest["dedup"] = dedup_settings(dedup)
+    if patched_ids:
+        update_chunk_metadata(collection_name, {
+            chunk_id: {"origins": sources} for chunk_id, sources in collect_origins(manifest, patched_ids).items()
+        })
+    save_manifest(manifest, collection_name)
+    reset_checkpoint(collection_name)
+    compacted = compact_collection(collection_name)
+    if compacted:
+        print(f"Compacted collection '{collection_name}': dropped {compacted} replaced/deleted rows")
+    create_metadata_index("category")
+    if RETRIEVER_MODE == "hybrid":
+        create_text_search_index()
+    # Tells running assistants to drop answers cached from the previous contents
+    bump_collection_version(collection_name)
+
+    total_chunks = sum(chunk_counts.values())
+    print(f"Ingested {total_chunks} document chunks ({stats['chunks']} written this run) into {store_label()} collection '{collection_name}'")
+    if deduplicator is not None:
+        print(f"Skipped {len(deduplicator.matches)} near-duplicate chunks of {deduplicator.seen}")
+    return vectordb
+
 # def process_documents(documents):
 #     """Chia nhỏ tài liệu và tạo embeddings"""
 #     text_splitter = RecursiveCharacterTextSplitter(
@@ -55,7 +608,9 @@ def load_documents():
     
 #     return vectordb
 
-def process_documents(documents, collection_name=COLLECTION_NAME, recreate=False):
+def process_documents(documents, collection_name=COLLECTION_NAME, recreate=False,
+                      batch_size=BATCH_SIZE, queue_depth=QUEUE_DEPTH, writer=WRITER, defer_indexes=False,
+                      embeddings=None, dedup=DEDUP_ENABLED):
     """Chia nhỏ tài liệu và tạo embeddings vào PostgreSQL với pgvector"""
     # Initialize the database first
     init_database()
@@ -64,32 +619,95 @@ def process_documents(documents, collection_name=COLLECTION_NAME, recreate=False
     if collection_exists(collection_name) and recreate:
         print(f"Deleting existing collection {collection_name}...")
         delete_collection(collection_name)
+        reset_manifest(collection_name)
+        reset_checkpoint(collection_name)
     
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=50,
-    )
-    chunks = text_splitter.split_documents(documents)
+    # Mô hình embedding dùng chung (backend theo EMBEDDING_BACKEND)
+    embeddings = embeddings or get_embeddings()
     
-    # Sử dụng HuggingFaceEmbeddings 
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    # Vector store (PGVector or local files, see VECTOR_STORE)
+    vectordb = get_vector_store(collection_name=collection_name, embedding_function=embeddings)
     
-    # Get PGVector store
-    vectordb = get_pgvector_store(collection_name=collection_name, embedding_function=embeddings)
+    write, close_writer = open_batch_writer(vectordb, collection_name, writer=writer, defer_indexes=defer_indexes)
     
-    # Add documents to the store
-    vectordb.add_documents(documents=chunks)
+    def write_batch(batch_index, batch, vectors):
+        write(
+            [chunk.text for chunk in batch],
+            vectors,
+            [chunk.metadata for chunk in batch],
+            [chunk.id for chunk in batch],
+        )
     
-    print(f"Ingested {len(chunks)} document chunks into PostgreSQL collection '{collection_name}'")
+    # documents may be a generator: chunks are split, embedded and stored batch by batch
+    chunks = iter_document_chunks(documents)
+    deduplicator = ChunkDeduplicator() if dedup else None
+    if deduplicator is not None:
+        chunks = deduplicator.filter(chunks)
+    try:
+        stats = run_pipeline(
+            chunks,
+            embeddings,
+            write_batch,
+            batch_size=batch_size,
+            queue_depth=queue_depth,
+        )
+    finally:
+        close_writer()
+    
+    if deduplicator is not None:
+        update_chunk_metadata(collection_name, {
+            chunk_id: {"origins": sources} for chunk_id, sources in deduplicator.origins().items()
+        })
+    compact_collection(collection_name)
+    
+    create_metadata_index("category")
+    if RETRIEVER_MODE == "hybrid":
+        create_text_search_index()
+    bump_collection_version(collection_name)
+    print(f"Ingested {stats['chunks']} document chunks into {store_label()} collection '{collection_name}'")
+    if deduplicator is not None:
+        print(f"Skipped {len(deduplicator.matches)} near-duplicate chunks of {deduplicator.seen}")
     
     return vectordb
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Ingest documents into PostgreSQL vector database")
     parser.add_argument("--collection", type=str, default=COLLECTION_NAME, help="Collection name to store documents")
-    parser.add_argument("--recreate", action="store_true", help="Recreate collection if exists")
+    parser.add_argument("--recreate", action="store_true", help="Recreate collection if exists; refused for aliases (reindex.py rebuilds without downtime)")
+    parser.add_argument("--incremental", action="store_true", help="Only re-embed new/modified files and drop chunks of removed files")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Number of chunks embedded and written per batch")
+    parser.add_argument("--queue-depth", type=int, default=QUEUE_DEPTH, help="Embedded batches allowed to wait for the database writer")
+    parser.add_argument("--writer", choices=["orm", "copy"], default=WRITER, help="Insert through PGVector (orm) or bulk COPY (copy)")
+    parser.add_argument("--extract-workers", type=int, default=EXTRACT_WORKERS, help="Processes extracting PDF text (0 = one per CPU)")
+    parser.add_argument("--no-dedup", action="store_true", help="Embed near-duplicate chunks instead of skipping them")
+    parser.add_argument("--defer-indexes", action="store_true", help="With --writer copy, drop secondary indexes during the load and rebuild them afterwards")
     args = parser.parse_args()
     
-    documents = load_documents()
-    print(f"Loaded {len(documents)} documents")
-    process_documents(documents, collection_name=args.collection, recreate=args.recreate)
+    # Incremental updates go to the collection the assistant is serving from
+    try:
+        collection_name = resolve_collection(args.collection)
+    except AliasResolutionError as e:
+        sys.exit(str(e))
+    if collection_name != args.collection:
+        if args.recreate:
+            # Deleting the collection behind the alias would take the assistant down until the ingest ends
+            sys.exit(f"{args.collection} is an alias of {collection_name}: rebuild it with reindex.py instead of --recreate")
+        print(f"Alias {args.collection} -> {collection_name}")
+    
+    if args.recreate:
+        if collection_exists(collection_name):
+            print(f"Deleting existing collection {collection_name}...")
+            delete_collection(collection_name)
+        reset_manifest(collection_name)
+        reset_checkpoint(collection_name)
+    
+    ingest_files(
+        collection_name=collection_name,
+        incremental=args.incremental,
+        batch_size=args.batch_size,
+        queue_depth=args.queue_depth,
+        writer=args.writer,
+        defer_indexes=args.defer_indexes,
+        dedup=DEDUP_ENABLED and not args.no_dedup,
+        extract_workers=args.extract_workers,
+    )
@@ -0,0 +1,229 @@
+import os
+import time
+import threading
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Tải biến môi trường
+load_dotenv()
+
+# Which LLM answers questions: "gemini" (default), "llamacpp" (local GGUF model, offline)
+# or "stub" (offline, deterministic)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+
+# Stub timing: delay before the first token and between tokens, in seconds
+STUB_LLM_LATENCY = float(os.getenv("STUB_LLM_LATENCY", "0.2"))
+STUB_LLM_TOKEN_DELAY = float(os.getenv("STUB_LLM_TOKEN_DELAY", "0.01"))
+
+class StubChatModel(BaseChatModel):
+    """Offline stand-in for the LLM used for load tests.
+
+    Answers with the first words of the retrieved context, after a fixed
+    time-to-first-token and per-token delay, so results are deterministic and
+    timings look like a real model without any network access.
+    """
+
+    latency: float = STUB_LLM_LATENCY
+    token_delay: float = STUB_LLM_TOKEN_DELAY
+    max_words: int = 40
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _answer_words(self, messages):
+        prompt = messages[-1].content
+        context = prompt.split("Tài liệu tham khảo:", 1)[-1].split("Câu hỏi:", 1)[0]
+        return ["[stub]"] + context.split()[:self.max_words]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._answer_words(messages)
+        time.sleep(self.latency + self.token_delay * (len(words) - 1))
+        message = AIMessage(content=" ".join(words))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for i, word in enumerate(self._answer_words(messages)):
+            if i:
+                time.sleep(self.token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else f" {word}"))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+# Local GGUF model (e.g. Mistral 7B Instruct) served in-process by llama-cpp-python
+LLAMA_MODEL_PATH = os.getenv("LLAMA_MODEL_PATH", "models/mistral-7b-instruct-v0.2.Q4_K_M.gguf")
+LLAMA_N_CTX = int(os.getenv("LLAMA_N_CTX", "4096"))
+# Threads for generation; physical cores usually beat hyper-threads (default: llama.cpp's choice)
+LLAMA_N_THREADS = int(os.getenv("LLAMA_N_THREADS", "0")) or None
+# Prompt tokens evaluated per forward pass
+LLAMA_N_BATCH = int(os.getenv("LLAMA_N_BATCH", "512"))
+LLAMA_N_GPU_LAYERS = int(os.getenv("LLAMA_N_GPU_LAYERS", "0"))
+LLAMA_MAX_TOKENS = int(os.getenv("LLAMA_MAX_TOKENS", "512"))
+LLAMA_TEMPERATURE = float(os.getenv("LLAMA_TEMPERATURE", "0.1"))
+# Instruction format wrapped around the prompt; the default matches Mistral Instruct
+LLAMA_PROMPT_FORMAT = os.getenv("LLAMA_PROMPT_FORMAT", "[INST] {prompt} [/INST]")
+
+# Loaded models, one per configuration; a 7B model must not be loaded twice in a process.
+# Each is stored with the lock serializing its use: every chat model over it shares one context
+_llama_clients = {}
+_llama_clients_lock = threading.Lock()
+
+def get_llama_client(model_path=None, n_ctx=None, n_threads=None, n_batch=None, n_gpu_layers=None):
+    """Load a GGUF model once per process and return the shared llama_cpp.Llama"""
+    config = (
+        model_path or LLAMA_MODEL_PATH,
+        n_ctx or LLAMA_N_CTX,
+        n_threads or LLAMA_N_THREADS,
+        n_batch or LLAMA_N_BATCH,
+        LLAMA_N_GPU_LAYERS if n_gpu_layers is None else n_gpu_layers,
+    )
+    with _llama_clients_lock:
+        entry = _llama_clients.get(config)
+        if entry is None:
+            # Imported lazily: only this backend needs llama-cpp-python
+            from llama_cpp import Llama
+
+            path, n_ctx, n_threads, n_batch, n_gpu_layers = config
+            client = Llama(
+                model_path=path,
+                n_ctx=n_ctx,
+                n_threads=n_threads,
+                n_batch=n_batch,
+                n_gpu_layers=n_gpu_layers,
+                verbose=False,
+            )
+            entry = _llama_clients[config] = (client, threading.Lock())
+        return entry[0]
+
+def get_llama_lock(client):
+    """Lock shared by every user of a Llama context (one sequence at a time)"""
+    with _llama_clients_lock:
+        for loaded, lock in _llama_clients.values():
+            if loaded is client:
+                return lock
+        # A client built outside get_llama_client is registered so later users share its lock too
+        lock = threading.Lock()
+        _llama_clients[("external", id(client))] = (client, lock)
+        return lock
+
+class LlamaCppChatModel(BaseChatModel):
+    """Chat model over an in-process llama.cpp model.
+
+    llama.cpp keeps the KV cache of the last evaluated tokens and reuses the
+    longest common prefix with the next prompt. Every prompt starts with the
+    same instructions from the template, so after prime_prefix() (or the
+    first request) only the retrieved context and the question are
+    evaluated. No LlamaRAMCache is set: snapshotting the whole KV state after
+    each request costs more than it saves here. Calls are serialized with a
+    lock shared by every model over the same context, since one Llama
+    context serves one sequence at a time.
+    """
+
+    client: Any = None
+    max_tokens: int = LLAMA_MAX_TOKENS
+    temperature: float = LLAMA_TEMPERATURE
+    prompt_format: str = LLAMA_PROMPT_FORMAT
+    lock: Any = None
+    prefix_tokens: Optional[int] = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.client is None:
+            self.client = get_llama_client()
+        if self.lock is None:
+            self.lock = get_llama_lock(self.client)
+
+    @property
+    def _llm_type(self):
+        return "llamacpp"
+
+    def _prompt(self, messages):
+        return self.prompt_format.format(prompt="\n\n".join(message.content for message in messages))
+
+    def prime_prefix(self, prefix):
+        """Evaluate the fixed start of the prompt once so the first request reuses it too"""
+        text = self.prompt_format.split("{prompt}", 1)[0] + prefix
+        tokens = self.client.tokenize(text.encode("utf-8"))
+        with self.lock:
+            self.client.reset()
+            self.client.eval(tokens)
+        self.prefix_tokens = len(tokens)
+        return self.prefix_tokens
+
+    def _completion(self, messages, stop, stream):
+        return self.client.create_completion(
+            self._prompt(messages),
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stop=stop or [],
+            stream=stream,
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        with self.lock:
+            result = self._completion(messages, stop, stream=False)
+        message = AIMessage(content=result["choices"][0]["text"].strip())
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"usage": result.get("usage")})
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        with self.lock:
+            for part in self._completion(messages, stop, stream=True):
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=part["choices"][0]["text"]))
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+
+def _build_gemini():
+    # Imported lazily so the stub backend works without the Gemini client installed
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    # Sử dụng Gemini 1.0 Pro (miễn phí có giới hạn)
+    # llm = ChatGoogleGenerativeAI(
+    #     model="gemini-1.0-pro",  # Mô hình miễn phí
+    #     temperature=0.1,
+    #     max_output_tokens=512,
+    #     google_api_key=os.getenv("GOOGLE_API_KEY")
+    # )
+
+    # # HOẶC
+
+    # # Sử dụng Gemini 1.5 Flash (miễn phí có giới hạn, hiệu suất tốt hơn)
+    # llm = ChatGoogleGenerativeAI(
+    #     model="gemini-1.5-flash",  # Mô hình miễn phí, hiệu suất tốt hơn
+    #     temperature=0.1,
+    #     max_output_tokens=512,
+    #     google_api_key=os.getenv("GOOGLE_API_KEY")
+    # )
+
+    # Gemini 1.5 Pro - Không Miễn Phí
+    # Không, gemini-1.5-pro không miễn phí. Đây là mô hình cao cấp của Google với chi phí như sau:
+    # Đầu vào: $7.00 cho 1 triệu token
+    # Đầu ra: $21.00 cho 1 triệu token
+    # Tuy nhiên, Google thường cung cấp hạn ngạch miễn phí ban đầu khi bạn đăng ký mới (thường là $300 tín dụng Google Cloud trong 90 ngày), có thể dùng để thử nghiệm Gemini.
+
+    # Use Google Gemini model
+    return ChatGoogleGenerativeAI(
+        model="gemini-1.5-pro",  # Using Gemini 1.5 Pro model
+        temperature=0.1,  # Lower temperature for more focused responses
+        max_output_tokens=512,   # Maximum tokens to generate
+        google_api_key=os.getenv("GOOGLE_API_KEY")  # Using the provided API key
+    )
+
+_BUILDERS = {
+    "gemini": _build_gemini,
+    "llamacpp": LlamaCppChatModel,
+    "stub": StubChatModel,
+}
+
+def get_llm(backend=None):
+    """Tạo LLM theo backend đã cấu hình"""
+    backend = backend or LLM_BACKEND
+    if backend not in _BUILDERS:
+        raise ValueError(f"Unknown LLM backend: {backend}")
+    return _BUILDERS[backend]()
@@ -0,0 +1,518 @@
+import os
+import json
+import mmap
+import uuid
+import shutil
+import logging
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# Tải biến môi trường
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# One directory per collection under this path (VECTOR_STORE=local)
+LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH", os.path.join(BASE_DIR, "cache", "vectors"))
+# Storage type of the embedding matrix: float32, or float16 for half the size
+LOCAL_STORE_DTYPE = os.getenv("LOCAL_STORE_DTYPE", "float32")
+
+# Files of a collection: row i of the matrix is line i of the records file
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.bin"
+RECORDS_FILE = "records.jsonl"
+OFFSETS_FILE = "offsets.u64"
+DELETED_FILE = "deleted.i64"
+# Collection aliases of the store directory ({alias: collection}), see reindex.py
+ALIASES_FILE = "aliases.json"
+
+# float16 matrices are scored this many rows at a time, converted to float32
+SEARCH_BLOCK_ROWS = 65536
+
+# Upserts and metadata patches tombstone the previous row; ingest compacts a
+# collection once this fraction of its rows is dead
+LOCAL_STORE_COMPACT_RATIO = float(os.getenv("LOCAL_STORE_COMPACT_RATIO", "0.2"))
+
+def get_store_path(collection_name, path=None):
+    return os.path.join(path or LOCAL_STORE_PATH, collection_name)
+
+def _generation_file(name, generation):
+    """Name of a data file in a generation; each compaction writes a new generation"""
+    return f"{generation}.{name}" if generation else name
+
+def _meta_stamp(directory):
+    """Identity of meta.json, which is replaced (new inode) on every write"""
+    try:
+        stat = os.stat(os.path.join(directory, META_FILE))
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns)
+
+def _read_meta(directory):
+    path = os.path.join(directory, META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_meta(directory, meta):
+    """Ghi meta.json một cách nguyên tử (ghi file tạm rồi đổi tên)"""
+    path = os.path.join(directory, META_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, path)
+
+def collection_exists(collection_name, path=None):
+    return os.path.exists(os.path.join(get_store_path(collection_name, path), META_FILE))
+
+def delete_collection(collection_name, path=None):
+    shutil.rmtree(get_store_path(collection_name, path), ignore_errors=True)
+    logger.info(f"Local collection {collection_name} deleted")
+    return True
+
+def get_collection_version(collection_name, path=None):
+    meta = _read_meta(get_store_path(collection_name, path))
+    return meta.get("version") if meta else None
+
+def bump_collection_version(collection_name, path=None):
+    directory = get_store_path(collection_name, path)
+    meta = _read_meta(directory)
+    if meta is None:
+        return None
+    meta["version"] = uuid.uuid4().hex
+    _write_meta(directory, meta)
+    return meta["version"]
+
+def list_collections(path=None):
+    root = path or LOCAL_STORE_PATH
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, META_FILE)))
+
+def count_rows(collection_name, path=None):
+    return len(LocalVectorStore(collection_name, path=path))
+
+def _read_aliases(path=None):
+    aliases_path = os.path.join(path or LOCAL_STORE_PATH, ALIASES_FILE)
+    if not os.path.exists(aliases_path):
+        return {}
+    with open(aliases_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def resolve_alias(alias, path=None):
+    return _read_aliases(path).get(alias)
+
+def set_alias(alias, collection_name, path=None):
+    """Point alias at a collection (atomic file replace); returns the previous target"""
+    root = path or LOCAL_STORE_PATH
+    os.makedirs(root, exist_ok=True)
+    aliases = _read_aliases(path)
+    previous = aliases.get(alias)
+    aliases[alias] = collection_name
+    aliases_path = os.path.join(root, ALIASES_FILE)
+    tmp_path = f"{aliases_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(aliases, f, ensure_ascii=False)
+    os.replace(tmp_path, aliases_path)
+    return previous
+
+def update_metadata(collection_name, metadatas, path=None):
+    return LocalVectorStore(collection_name, path=path).update_metadata(metadatas)
+
+def compact(collection_name, path=None, min_ratio=LOCAL_STORE_COMPACT_RATIO):
+    """Compact a collection if at least min_ratio of its rows are dead; returns the rows dropped"""
+    store = LocalVectorStore(collection_name, path=path)
+    rows, live = store.row_counts()
+    if not rows or (rows - live) / rows < min_ratio:
+        return 0
+    return store.compact()
+
+def _read_record(records, offset):
+    offset = int(offset)
+    return json.loads(records[offset:records.find(b"\n", offset) + 1])
+
+def _normalized(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class LocalVectorStore(VectorStore):
+    """In-process vector store over a memory-mapped embedding matrix.
+
+    Embeddings are appended, L2-normalized, to a raw float32/float16 matrix
+    file that is memory-mapped for search, so opening a collection reads no
+    data and a query is one matrix-vector product. Text and metadata are
+    appended as JSON lines with a byte-offset index; only the top-k records
+    are read per query. Deletes are tombstones (row numbers), and adding an
+    id that already exists replaces the earlier row; compact() rewrites the
+    live rows into a new generation of files. Scores are cosine distances,
+    like PGVector. Meant for single-node deployments of a few
+    thousand to a few hundred thousand chunks, with one writing process.
+    """
+
+    def __init__(self, collection_name="hr_documents", embedding_function=None, path=None, dtype=None):
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.directory = get_store_path(collection_name, path)
+        self._meta_stamp = _meta_stamp(self.directory)
+        self._meta = _read_meta(self.directory)
+        self.dtype = np.dtype(self._meta["dtype"] if self._meta else (dtype or LOCAL_STORE_DTYPE))
+        self._lock = threading.Lock()
+        # (matrix, offsets, live mask, records) as of _stamp, replaced whenever the files grow;
+        # the maps keep the files of a compacted generation readable until released
+        self._state = None
+        self._stamp = None
+        # Ids and metadata per row, read incrementally on first use (filters, deletes, upserts)
+        self._ids = []
+        self._metadatas = []
+        self._records_read = 0
+        self._latest_row = {}
+        self._filter_masks = {}
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def _generation(self):
+        return self._meta.get("generation", 0) if self._meta else 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, _generation_file(name, self._generation()))
+
+    def _size(self, name):
+        try:
+            return os.path.getsize(self._path(name))
+        except OSError:
+            return 0
+
+    def _rows(self, dim):
+        """Rows fully written to both the matrix and the offset index"""
+        return min(self._size(VECTORS_FILE) // (dim * self.dtype.itemsize), self._size(OFFSETS_FILE) // 8)
+
+    def _refresh_meta_locked(self):
+        """Re-read meta.json if it was rewritten; a new generation renumbers every row"""
+        stamp = _meta_stamp(self.directory)
+        if stamp == self._meta_stamp:
+            return
+        meta = _read_meta(self.directory)
+        if meta is None or meta.get("generation", 0) != self._generation():
+            self._state = self._stamp = None
+            self._ids, self._metadatas, self._records_read, self._latest_row = [], [], 0, {}
+        self._meta = meta
+        self._meta_stamp = stamp
+
+    def _live_mask(self, rows):
+        live = np.ones(rows, dtype=bool)
+        if self._size(DELETED_FILE):
+            deleted = np.fromfile(self._path(DELETED_FILE), dtype=np.int64)
+            live[deleted[deleted < rows]] = False
+        return live
+
+    def _snapshot(self, retry=True):
+        """Current (matrix, offsets, live) view, remapped only if another write or a compaction happened"""
+        if _meta_stamp(self.directory) != self._meta_stamp:
+            with self._lock:
+                self._refresh_meta_locked()
+        if self._meta is None:
+            return None
+        stamp = tuple(self._size(name) for name in (VECTORS_FILE, OFFSETS_FILE, DELETED_FILE))
+        state = self._state
+        if state is not None and stamp == self._stamp:
+            return state
+        with self._lock:
+            dim = self._meta["dim"]
+            try:
+                rows = self._rows(dim)
+                if rows:
+                    matrix = np.memmap(self._path(VECTORS_FILE), dtype=self.dtype, mode="r", shape=(rows, dim))
+                    offsets = np.memmap(self._path(OFFSETS_FILE), dtype=np.uint64, mode="r", shape=(rows,))
+                    with open(self._path(RECORDS_FILE), "rb") as f:
+                        records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    matrix = np.zeros((0, dim), dtype=self.dtype)
+                    offsets = np.zeros(0, dtype=np.uint64)
+                    records = b""
+                live = self._live_mask(rows)
+            except FileNotFoundError:
+                if not retry:
+                    raise
+                # Compacted between reading meta.json and opening the files: follow the new generation
+                self._meta_stamp = None
+                state = None
+            else:
+                self._state = state = (matrix, offsets, live, records)
+                self._stamp = stamp
+                self._filter_masks = {}
+        return state if state is not None else self._snapshot(retry=False)
+
+    def _sync_records_locked(self):
+        """Read ids and metadata of rows appended since the last call"""
+        path = self._path(RECORDS_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            f.seek(self._records_read)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Partially written record; picked up on a later call
+                    break
+                record = json.loads(line)
+                self._latest_row[record["id"]] = len(self._ids)
+                self._ids.append(record["id"])
+                self._metadatas.append(record["metadata"])
+                self._records_read += len(line)
+
+    def _repair_locked(self, dim):
+        """Cut files back to the last complete row after an interrupted write; returns the row count"""
+        rows = self._rows(dim)
+        records_end = 0
+        if rows:
+            with open(self._path(OFFSETS_FILE), "rb") as f:
+                f.seek((rows - 1) * 8)
+                last = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            with open(self._path(RECORDS_FILE), "rb") as f:
+                f.seek(last)
+                records_end = last + len(f.readline())
+        for name, size in ((RECORDS_FILE, records_end), (OFFSETS_FILE, rows * 8),
+                           (VECTORS_FILE, rows * dim * self.dtype.itemsize)):
+            if self._size(name) > size:
+                with open(self._path(name), "r+b") as f:
+                    f.truncate(size)
+        if self._records_read > records_end:
+            self._ids, self._metadatas, self._records_read, self._latest_row = [], [], 0, {}
+        return rows
+
+    def _tombstone_locked(self, rows):
+        if rows:
+            with open(self._path(DELETED_FILE), "ab") as f:
+                f.write(np.asarray(rows, dtype=np.int64).tobytes())
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None, **kwargs):
+        """Append pre-computed embeddings; same signature as PGVector.add_embeddings"""
+        texts = list(texts)
+        vectors = _normalized(embeddings)
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        if not texts:
+            return ids
+
+        with self._lock:
+            self._refresh_meta_locked()
+            if self._meta is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._meta = {"dim": int(vectors.shape[1]), "dtype": self.dtype.name, "version": None}
+                _write_meta(self.directory, self._meta)
+                self._meta_stamp = _meta_stamp(self.directory)
+            dim = self._meta["dim"]
+            if vectors.shape[1] != dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection ({dim})")
+
+            first_row = self._repair_locked(dim)
+            self._sync_records_locked()
+            replaced = [self._latest_row[i] for i in ids if i in self._latest_row]
+
+            # Records and offsets first, vectors last: a row becomes visible
+            # to readers only once its vector is complete
+            with open(self._path(RECORDS_FILE), "ab") as f:
+                position = f.tell()
+                offsets = []
+                for text, metadata, doc_id in zip(texts, metadatas, ids):
+                    line = json.dumps({"id": doc_id, "text": text, "metadata": metadata}, ensure_ascii=False).encode("utf-8") + b"\n"
+                    offsets.append(position)
+                    position += f.write(line)
+            with open(self._path(OFFSETS_FILE), "ab") as f:
+                f.write(np.asarray(offsets, dtype=np.uint64).tobytes())
+            with open(self._path(VECTORS_FILE), "ab") as f:
+                f.write(vectors.astype(self.dtype).tobytes())
+            self._tombstone_locked(replaced)
+            self._sync_records_locked()
+            logger.debug(f"Appended rows {first_row}-{first_row + len(texts) - 1} to {self.collection_name}")
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas, ids)
+
+    def update_metadata(self, metadatas):
+        """Merge new metadata keys into existing rows ({id: metadata}); each row is re-appended with its vector"""
+        state = self._snapshot()
+        if state is None:
+            return 0
+        matrix, offsets, _, records = state
+        with self._lock:
+            self._sync_records_locked()
+            rows = [(doc_id, self._latest_row[doc_id]) for doc_id in metadatas if doc_id in self._latest_row]
+        rows = [(doc_id, row) for doc_id, row in rows if row < len(offsets)]
+        if not rows:
+            return 0
+        texts, vectors, merged, ids = [], [], [], []
+        for doc_id, row in rows:
+            record = _read_record(records, offsets[row])
+            texts.append(record["text"])
+            vectors.append(np.asarray(matrix[row], dtype=np.float32))
+            merged.append({**record["metadata"], **metadatas[doc_id]})
+            ids.append(doc_id)
+        self.add_embeddings(texts, np.stack(vectors), merged, ids)
+        return len(ids)
+
+    def delete(self, ids=None, **kwargs):
+        """Tombstone the rows of the given ids"""
+        if not ids:
+            return False
+        with self._lock:
+            self._refresh_meta_locked()
+            self._sync_records_locked()
+            rows = [self._latest_row.pop(doc_id) for doc_id in ids if doc_id in self._latest_row]
+            self._tombstone_locked(rows)
+        return True
+
+    def row_counts(self):
+        """(rows stored, rows live); the difference is what compact() would drop"""
+        state = self._snapshot()
+        if state is None:
+            return 0, 0
+        return len(state[2]), int(state[2].sum())
+
+    def compact(self):
+        """Rewrite the live rows into a new generation of files; returns the rows dropped.
+
+        The new files are complete before meta.json points at them, so
+        readers switch atomically on their next query (in this or another
+        process); memory maps of the old files stay valid until released.
+        """
+        with self._lock:
+            self._refresh_meta_locked()
+            if self._meta is None:
+                return 0
+            dim = self._meta["dim"]
+            rows = self._repair_locked(dim)
+            keep = np.flatnonzero(self._live_mask(rows))
+            dropped = rows - len(keep)
+            if not dropped:
+                return 0
+
+            generation = self._generation() + 1
+            old_paths = [self._path(name) for name in (VECTORS_FILE, OFFSETS_FILE, RECORDS_FILE, DELETED_FILE)]
+
+            def new_path(name):
+                return os.path.join(self.directory, _generation_file(name, generation))
+
+            matrix = np.memmap(self._path(VECTORS_FILE), dtype=self.dtype, mode="r", shape=(rows, dim)) if rows else None
+            offsets = np.fromfile(self._path(OFFSETS_FILE), dtype=np.uint64, count=rows)
+            new_offsets = np.empty(len(keep), dtype=np.uint64)
+            with open(self._path(RECORDS_FILE), "rb") as src, open(new_path(RECORDS_FILE), "wb") as dst:
+                for position, row in enumerate(keep):
+                    src.seek(int(offsets[row]))
+                    new_offsets[position] = dst.tell()
+                    dst.write(src.readline())
+            with open(new_path(OFFSETS_FILE), "wb") as f:
+                f.write(new_offsets.tobytes())
+            with open(new_path(VECTORS_FILE), "wb") as f:
+                for start in range(0, len(keep), SEARCH_BLOCK_ROWS):
+                    f.write(np.asarray(matrix[keep[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+            if os.path.exists(new_path(DELETED_FILE)):
+                # Left over from an interrupted compaction
+                os.remove(new_path(DELETED_FILE))
+            del matrix
+
+            # The switch: readers follow meta.json to the new generation
+            self._meta = {**self._meta, "generation": generation}
+            _write_meta(self.directory, self._meta)
+            self._meta_stamp = _meta_stamp(self.directory)
+            self._state = self._stamp = None
+            self._ids, self._metadatas, self._records_read, self._latest_row = [], [], 0, {}
+            self._filter_masks = {}
+            for path in old_paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        logger.info(f"Compacted {self.collection_name}: dropped {dropped} of {rows} rows")
+        return dropped
+
+    def delete_collection(self):
+        delete_collection(self.collection_name, os.path.dirname(self.directory))
+        with self._lock:
+            self._meta = self._meta_stamp = None
+            self._state = self._stamp = None
+            self._ids, self._metadatas, self._records_read, self._latest_row = [], [], 0, {}
+
+    def _filter_mask(self, filter, rows):
+        """Rows whose metadata equals every key/value of the filter"""
+        key = tuple(sorted((k, json.dumps(v, ensure_ascii=False)) for k, v in filter.items()))
+        mask = self._filter_masks.get(key)
+        if mask is None or len(mask) != rows:
+            with self._lock:
+                self._sync_records_locked()
+                metadatas = self._metadatas[:rows]
+            mask = np.fromiter(
+                (all(metadata.get(k) == v for k, v in filter.items()) for metadata in metadatas),
+                dtype=bool,
+                count=len(metadatas),
+            )
+            if len(mask) < rows:
+                mask = np.concatenate([mask, np.zeros(rows - len(mask), dtype=bool)])
+            self._filter_masks[key] = mask
+        return mask
+
+    def _scores(self, matrix, query):
+        if matrix.dtype == np.float32:
+            return matrix @ query
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), SEARCH_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        return scores
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        state = self._snapshot()
+        if state is None or len(state[0]) == 0:
+            return []
+        matrix, offsets, live, records = state
+        scores = self._scores(matrix, _normalized(embedding))
+        mask = live & self._filter_mask(filter, len(live)) if filter else live
+        candidates = int(mask.sum())
+        if candidates == 0:
+            return []
+        scores = np.where(mask, scores, -np.inf)
+        k = min(k, candidates)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for row in top:
+            record = _read_record(records, offsets[row])
+            metadata = dict(record["metadata"])
+            results.append((Document(page_content=record["text"], metadata=metadata), 1.0 - float(scores[row])))
+        return results
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine distances
+        return lambda distance: 1.0 - distance
+
+    def __len__(self):
+        state = self._snapshot()
+        return int(state[2].sum()) if state is not None else 0
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, collection_name="hr_documents", path=None, **kwargs):
+        store = cls(collection_name=collection_name, embedding_function=embedding, path=path, dtype=kwargs.get("dtype"))
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -1,31 +1,153 @@
 import os
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import RetrievalQA
+import time
+import logging
+import itertools
+import threading
+import contextlib
 from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
 
 # Import PostgreSQL utilities
-from db_utils import get_pgvector_store, init_database, COLLECTION_NAME
+from db_utils import (
+    get_vector_store,
+    get_hybrid_retriever,
+    get_quantized_retriever,
+    init_database,
+    collection_exists,
+    get_collection_version,
+    resolve_collection,
+    iterative_scan_enabled,
+    AliasResolutionError,
+    COLLECTION_NAME,
+    RETRIEVER_MODE,
+    VECTOR_STORE,
+    STORAGE_MODE,
+)
+from cache import TTLCache, AnswerCache, CachedEmbeddings, MISSING
+from batching import MicroBatchEmbeddings
+from llm import get_llm
+from embedding_models import get_embeddings
+from context import pack_context, estimate_tokens, CONTEXT_TOKEN_BUDGET
+from telemetry import Trace, REGISTRY, CACHE_HIT_RATE, CACHE_SIZE, trace_stage, current_trace
+from concurrency import AdmissionLimiter, SingleFlight, OverloadedError, Abandoned, call_with_retry
 
 # Tải biến môi trường
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Cache settings
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+# Minimum cosine similarity for a near-duplicate question to reuse an answer (> 1 disables)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# How often the collection version is polled to invalidate cached answers
+CACHE_VERSION_CHECK_SECONDS = float(os.getenv("CACHE_VERSION_CHECK_SECONDS", "10"))
+
+# Chunks retrieved per question
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "3"))
+# With context packing on, a wider candidate set is retrieved and trimmed to CONTEXT_TOKEN_BUDGET
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "8"))
+
+# Micro-batching of concurrent query embeddings (0 disables); the HTTP API turns it on
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "0"))
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "32"))
+
+# Shown when admission control refuses a question
+OVERLOADED_MESSAGE = "Hệ thống đang quá tải, vui lòng thử lại sau ít phút."
+
 class HRAssistant:
-    def __init__(self, collection_name="hr_documents"):
+    def __init__(self, collection_name="hr_documents", embeddings=None, vectordb=None, llm=None):
+        """embeddings, vectordb and llm replace the configured components (benchmarks, offline runs).
+
+        A vector store passed in is not tied to the database, so the
+        database is not initialized and cached answers are never invalidated.
+        Otherwise collection_name may be an alias (see reindex.py): the
+        collection it points to is re-resolved while serving, and a flipped
+        alias switches the assistant to the new collection.
+        """
+        self.alias = collection_name
+        self.collection_name = collection_name
+        self.external_store = vectordb is not None
+        self.ready = False
+        # Seconds spent in each startup phase, filled by the constructor and warmup()
+        self.startup_timings = {}
+        
         # Initialize database to ensure pgvector extension is available
-        init_database()
+        if not self.external_store:
+            with self._timed("init_database"):
+                init_database()
+                self.collection_name = resolve_collection(collection_name)
+        
+        # Setup embeddings; query embeddings are cached since users repeat questions
+        self.embedding_cache = TTLCache(maxsize=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL)
+        with self._timed("load_embedding_model"):
+            base_embeddings = embeddings if embeddings is not None else get_embeddings()
+        if QUERY_BATCH_WAIT_MS > 0:
+            # Concurrent cache misses are encoded together in one model call
+            base_embeddings = MicroBatchEmbeddings(
+                base_embeddings,
+                max_batch_size=QUERY_BATCH_SIZE,
+                max_wait_ms=QUERY_BATCH_WAIT_MS,
+            )
+        self.embeddings = CachedEmbeddings(base_embeddings, self.embedding_cache)
+        
+        # Answer cache (exact + semantic), invalidated when the collection changes
+        self.answer_cache = AnswerCache(
+            maxsize=ANSWER_CACHE_SIZE,
+            ttl=ANSWER_CACHE_TTL,
+            semantic_maxsize=SEMANTIC_CACHE_SIZE,
+            semantic_threshold=SEMANTIC_CACHE_THRESHOLD,
+        )
+        self._version_checked_at = 0.0
+        self._version_lock = threading.Lock()
         
-        # Setup embeddings
-        self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+        # Input tokens saved by context packing
+        self.last_context_stats = None
+        self.context_totals = {"prompts": 0, "baseline_tokens": 0, "packed_tokens": 0, "tokens_saved": 0, "duplicates_dropped": 0}
+        self._context_lock = threading.Lock()
         
-        # Get PGVector store for retrieval
-        self.vectordb = get_pgvector_store(collection_name=collection_name, embedding_function=self.embeddings)
+        # Identical questions in flight share one retrieval + LLM call; LLM calls are bounded
+        self.flights = SingleFlight()
+        self.admission = AdmissionLimiter()
+        
+        # Vector store for retrieval (PGVector or local files, see VECTOR_STORE)
+        with self._timed("vector_store"):
+            self.vectordb = vectordb if vectordb is not None else get_vector_store(collection_name=self.collection_name, embedding_function=self.embeddings)
         
         # Setup QA chain
-        self.setup_qa_chain()
+        with self._timed("qa_chain"):
+            self.setup_qa_chain(llm)
+    
+    @contextlib.contextmanager
+    def _timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[phase] = time.perf_counter() - start
+            logger.info(f"Startup phase {phase}: {self.startup_timings[phase]:.2f}s")
+    
+    def warmup(self):
+        """Chạy thử mô hình embedding và truy vấn vector để câu hỏi đầu tiên không phải chờ khởi động"""
+        with self._timed("warmup_encode"):
+            # embed_documents bypasses the query cache, so the model really runs
+            vector = self.embeddings.embed_documents(["Chính sách nghỉ phép của công ty là gì?"])[0]
+        with self._timed("warmup_vector_query"):
+            self.vectordb.similarity_search_by_vector(vector, k=1)
+        if hasattr(self.llm, "prime_prefix"):
+            with self._timed("warmup_llm_prefix"):
+                # Local models keep the fixed instructions of the template in their KV cache
+                self.llm.prime_prefix(self.qa_prompt.template.split("{context}", 1)[0])
+        with self._timed("warmup_cache_version"):
+            self.refresh_cache_version(force=True)
+        self.ready = True
+        return self.startup_timings
         
-    def setup_qa_chain(self):
+    def setup_qa_chain(self, llm=None):
         # Tạo prompt template
         template = """Bạn là trợ lý AI của phòng nhân sự. Nhiệm vụ của bạn là trả lời
         các câu hỏi liên quan đến chính sách nhân sự, quy trình tuyển dụng, đào tạo, 
@@ -40,72 +162,305 @@ class HRAssistant:
 
         Câu hỏi: {question}
         """
-        QA_PROMPT = PromptTemplate(
+        self.qa_prompt = PromptTemplate(
             template=template, 
             input_variables=["context", "question"]
         )
         
-        # Sử dụng Gemini 1.0 Pro (miễn phí có giới hạn)
-        # llm = ChatGoogleGenerativeAI(
-        #     model="gemini-1.0-pro",  # Mô hình miễn phí
-        #     temperature=0.1,
-        #     max_output_tokens=512,
-        #     google_api_key=os.getenv("GOOGLE_API_KEY")
-        # )
-
-        # # HOẶC
-
-        # # Sử dụng Gemini 1.5 Flash (miễn phí có giới hạn, hiệu suất tốt hơn)
-        # llm = ChatGoogleGenerativeAI(
-        #     model="gemini-1.5-flash",  # Mô hình miễn phí, hiệu suất tốt hơn
-        #     temperature=0.1,
-        #     max_output_tokens=512,
-        #     google_api_key=os.getenv("GOOGLE_API_KEY")
-        # )
-
-        # Gemini 1.5 Pro - Không Miễn Phí
-        # Không, gemini-1.5-pro không miễn phí. Đây là mô hình cao cấp của Google với chi phí như sau:
-        # Đầu vào: $7.00 cho 1 triệu token
-        # Đầu ra: $21.00 cho 1 triệu token
-        # Tuy nhiên, Google thường cung cấp hạn ngạch miễn phí ban đầu khi bạn đăng ký mới (thường là $300 tín dụng Google Cloud trong 90 ngày), có thể dùng để thử nghiệm Gemini.
-
-        # Use Google Gemini model
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-pro",  # Using Gemini 1.5 Pro model
-            temperature=0.1,  # Lower temperature for more focused responses
-            max_output_tokens=512,   # Maximum tokens to generate
-            google_api_key=os.getenv("GOOGLE_API_KEY")  # Using the provided API key
-        )
+        # LLM backend is chosen by LLM_BACKEND (see llm.py)
+        self.llm = llm if llm is not None else get_llm()
         
-        # Use standard RetrievalQA chain with local LLM
-        self.qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",  # Simple document concatenation
-            retriever=self.vectordb.as_retriever(search_kwargs={"k": 3}),  # Reduced context
-            chain_type_kwargs={"prompt": QA_PROMPT},
-            return_source_documents=False,  # Don't include source docs in output
-            verbose=False
-        )
+        # Retrieval and prompt assembly are explicit ("stuff" style concatenation)
+        # so that ask() and ask_stream() share them and the LLM call can be streamed
+        # RETRIEVER=hybrid adds full-text matching, fused with the vector ranking in SQL
+        self.retriever = self.get_retriever()
    
+    def get_retriever(self, category=None):
+        """Retriever cho một danh mục; bộ lọc được áp dụng ngay trong truy vấn SQL.
+
+        The filter is checked on the rows the HNSW scan returns; with HNSW_ITERATIVE_SCAN
+        enabled, filtered queries go through SQL that sets hnsw.iterative_scan so
+        selective categories still get k rows.
+        """
+        if not category and getattr(self, "retriever", None) is not None:
+            return self.retriever
+        search_filter = {"category": category} if category else None
+        k = RETRIEVAL_CANDIDATES if CONTEXT_TOKEN_BUDGET > 0 else RETRIEVAL_K
+        if VECTOR_STORE == "pgvector" and not self.external_store:
+            if RETRIEVER_MODE == "hybrid":
+                return get_hybrid_retriever(
+                    self.collection_name, embedding_function=self.embeddings, k=k, filter=search_filter
+                )
+            if STORAGE_MODE in ("halfvec", "binary"):
+                # Searches the compact index instead of the float32 one
+                return get_quantized_retriever(
+                    self.collection_name, embedding_function=self.embeddings, k=k, mode=STORAGE_MODE, filter=search_filter
+                )
+            if search_filter and iterative_scan_enabled():
+                # PGVector's own session cannot take SET LOCAL hnsw.iterative_scan
+                return get_quantized_retriever(
+                    self.collection_name, embedding_function=self.embeddings, k=k, mode="vector", filter=search_filter
+                )
+        search_kwargs = {"k": k}
+        if search_filter:
+            search_kwargs["filter"] = search_filter
+        return self.vectordb.as_retriever(search_kwargs=search_kwargs)  # Reduced context
+    
+    def build_prompt(self, question, category=None):
+        """Tìm tài liệu liên quan và ghép vào prompt"""
+        with trace_stage("retrieval"):
+            docs = self.get_retriever(category).invoke(question)
+        with trace_stage("prompt_assembly"):
+            if CONTEXT_TOKEN_BUDGET > 0:
+                context, stats = pack_context(docs, question, CONTEXT_TOKEN_BUDGET, baseline_k=RETRIEVAL_K)
+                self._record_context_stats(stats)
+            else:
+                context, stats = "\n\n".join(doc.page_content for doc in docs), None
+            prompt = self.qa_prompt.format(context=context, question=question)
+        trace = current_trace()
+        if trace is not None:
+            trace.set(retrieved_chunks=len(docs), context_tokens=estimate_tokens(context))
+            if stats:
+                trace.set(context_tokens_saved=stats["tokens_saved"], duplicates_dropped=stats["duplicates_dropped"])
+        return prompt
+    
+    def _record_context_stats(self, stats):
+        with self._context_lock:
+            self.last_context_stats = stats
+            totals = self.context_totals
+            totals["prompts"] += 1
+            totals["baseline_tokens"] += stats["baseline_tokens"]
+            totals["packed_tokens"] += stats["packed_tokens"]
+            totals["tokens_saved"] += stats["tokens_saved"]
+            totals["duplicates_dropped"] += stats["duplicates_dropped"]
+        logger.debug(f"Packed context: {stats}")
     
-    def ask(self, question):
-        """Trả lời câu hỏi của người dùng"""
+    def context_stats(self):
+        """Số token ngữ cảnh đã tiết kiệm nhờ đóng gói ngữ cảnh"""
+        with self._context_lock:
+            return {"last": self.last_context_stats, **self.context_totals}
+    
+    
+    def refresh_cache_version(self, force=False):
+        """Follow the collection alias and drop cached answers if an ingest changed the collection.
+
+        Polled at most every CACHE_VERSION_CHECK_SECONDS.
+        """
+        if self.external_store:
+            return
+        now = time.monotonic()
+        with self._version_lock:
+            if not force and now - self._version_checked_at < CACHE_VERSION_CHECK_SECONDS:
+                return
+            self._version_checked_at = now
         try:
-            # Using invoke method with query key as expected by RetrievalQA
-            response = self.qa_chain.invoke({"query": question})
+            target = resolve_collection(self.alias)
+        except AliasResolutionError as e:
+            # Keep serving the current collection; the next poll tries again
+            logger.error(str(e))
+            target = self.collection_name
+        if target != self.collection_name:
+            self.switch_collection(target)
+        version = get_collection_version(self.collection_name, default=MISSING)
+        if version is MISSING:
+            # Unreadable is not a change: keep the last known version and its answers
+            return
+        self.answer_cache.check_version(version)
+    
+    def switch_collection(self, collection_name):
+        """Serve from another collection; requests already running finish on the previous one"""
+        # Never switch to a collection that is not there: PGVector would create it empty
+        if not collection_exists(collection_name):
+            logger.error(f"Collection {collection_name} does not exist, still serving {self.collection_name}")
+            return False
+        vectordb = get_vector_store(collection_name=collection_name, embedding_function=self.embeddings)
+        logger.info(f"Switching from collection {self.collection_name} to {collection_name}")
+        self.vectordb = vectordb
+        self.collection_name = collection_name
+        self.retriever = None
+        self.retriever = self.get_retriever()
+        return True
+    
+    def cache_stats(self):
+        """Số liệu hit/miss của các tầng cache"""
+        return {
+            "query_embeddings": self.embedding_cache.stats(),
+            **self.answer_cache.stats(),
+        }
+    
+    def collect_metrics(self):
+        """Refresh the cache gauges exported on /metrics"""
+        stats = self.cache_stats()
+        for name in ("query_embeddings", "exact", "semantic"):
+            CACHE_HIT_RATE.set(stats[name]["hit_rate"], cache=name)
+            CACHE_SIZE.set(stats[name]["size"], cache=name)
+    
+    def _lookup_cache(self, question, category=None):
+        """Return (key, vector, answer); answer is MISSING unless a cache tier hit"""
+        with trace_stage("cache_version"):
+            self.refresh_cache_version()
+        
+        # Tier 1: same question (and category) after normalization
+        key = self.answer_cache.make_key(question, category)
+        with trace_stage("cache_exact"):
+            answer = self.answer_cache.get_exact(key)
+        if answer is not MISSING:
+            return key, None, answer
+        
+        # Tier 2: near-duplicate question; the embedding is cached for the retriever
+        with trace_stage("embed_query"):
+            vector = self.embeddings.embed_query(question)
+        with trace_stage("cache_semantic"):
+            answer = self.answer_cache.get_semantic(vector, category)
+        if answer is not MISSING:
+            self.answer_cache.exact.set(key, answer)
+        return key, vector, answer
+    
+    def _generate_answer(self, question, category, key, vector, trace):
+        """Retrieval and LLM call for a question no cache tier answered"""
+        # A request that just finished may have cached it after our lookup
+        answer = self.answer_cache.get_exact(key)
+        if answer is not MISSING:
+            return answer
+        prompt = self.build_prompt(question, category)
+        with self.admission.slot() as waited:
+            trace.add_stage("llm_queue", waited)
+            with trace.stage("llm"):
+                response = call_with_retry(
+                    lambda: self.llm.invoke(prompt),
+                    on_retry=lambda delay: trace.add_stage("llm_backoff", delay),
+                )
+        answer = response.content if hasattr(response, "content") else str(response)
+        self._record_tokens(trace, prompt, answer, getattr(response, "usage_metadata", None))
+        self.answer_cache.set(key, vector, answer, category)
+        return answer
+    
+    def ask(self, question, category=None):
+        """Trả lời câu hỏi của người dùng, chỉ tìm trong danh mục đã chọn (nếu có)"""
+        trace = Trace("ask", category=category)
+        try:
+            with trace.activate():
+                key, vector, answer = self._lookup_cache(question, category)
+                if answer is not MISSING:
+                    trace.finish("cache_exact" if vector is None else "cache_semantic")
+                    return answer
+                
+                # Concurrent identical questions wait for the first one instead of calling the LLM again
+                start = time.perf_counter()
+                answer, shared = self.flights.do(
+                    key, lambda: self._generate_answer(question, category, key, vector, trace)
+                )
+                if shared:
+                    trace.add_stage("coalesced_wait", time.perf_counter() - start)
+            trace.finish("coalesced" if shared else "answered")
+            return answer
+        except OverloadedError as e:
+            logger.warning(f"Question refused by admission control (trace {trace.trace_id}): {str(e)}")
+            trace.finish("rejected", error=e)
+            return f"{OVERLOADED_MESSAGE} (mã truy vết: {trace.trace_id})"
+        except Exception as e:
+            logger.exception(f"Error answering question (trace {trace.trace_id})")
+            trace.finish("error", error=e)
+            return f"Gặp lỗi khi xử lý câu hỏi: {str(e)} (mã truy vết: {trace.trace_id})"
+    
+    @staticmethod
+    def _record_tokens(trace, prompt, answer, usage=None):
+        """Token counts reported by the LLM, or estimated from the text"""
+        if usage and usage.get("input_tokens"):
+            trace.set(prompt_tokens=usage["input_tokens"], completion_tokens=usage.get("output_tokens", 0), token_source="llm")
+        else:
+            trace.set(prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(answer), token_source="estimate")
+    
+    def ask_stream(self, question, category=None):
+        """Trả lời câu hỏi, trả về từng đoạn văn bản ngay khi LLM sinh ra"""
+        trace = Trace("ask_stream", category=category)
+        try:
+            # The trace is only made current around code that does not yield,
+            # since each chunk may be pulled from a different thread
+            with trace.activate():
+                key, vector, answer = self._lookup_cache(question, category)
+            if answer is not MISSING:
+                trace.finish("cache_exact" if vector is None else "cache_semantic")
+                yield answer
+                return
             
-            # Handle different return formats
-            if isinstance(response, dict) and "result" in response:
-                return response["result"]
-            elif isinstance(response, str):
-                return response
-            else:
-                return str(response)  # Fallback to string representation
+            # An identical question already streaming: send its whole answer once it is done
+            while True:
+                flight, leader = self.flights.begin(key)
+                if leader:
+                    break
+                start = time.perf_counter()
+                try:
+                    answer = self.flights.wait(flight)
+                except Abandoned:
+                    continue
+                trace.add_stage("coalesced_wait", time.perf_counter() - start)
+                trace.finish("coalesced")
+                yield answer
+                return
+            
+            try:
+                with trace.activate():
+                    prompt = self.build_prompt(question, category)
+                answer = yield from self._stream_answer(prompt, trace)
+            except GeneratorExit:
+                self.flights.finish(key, flight, error=Abandoned())
+                raise
+            except BaseException as e:
+                self.flights.finish(key, flight, error=e)
+                raise
+            # Only complete answers are cached
+            self.answer_cache.set(key, vector, answer, category)
+            self.flights.finish(key, flight, result=answer)
+            trace.finish("answered")
+        except GeneratorExit:
+            trace.finish("cancelled")
+            raise
+        except OverloadedError as e:
+            logger.warning(f"Question refused by admission control (trace {trace.trace_id}): {str(e)}")
+            trace.finish("rejected", error=e)
+            yield f"{OVERLOADED_MESSAGE} (mã truy vết: {trace.trace_id})"
         except Exception as e:
-            return f"Gặp lỗi khi xử lý câu hỏi: {str(e)}"
+            logger.exception(f"Error answering question (trace {trace.trace_id})")
+            trace.finish("error", error=e)
+            yield f"Gặp lỗi khi xử lý câu hỏi: {str(e)} (mã truy vết: {trace.trace_id})"
+
+    def _stream_answer(self, prompt, trace):
+        """Stream the LLM answer while holding an admission slot; returns the full text"""
+        def open_stream():
+            # Rate-limit errors surface on the first chunk, before anything was sent
+            stream = iter(self.llm.stream(prompt))
+            return stream, next(stream, None)
+        
+        with self.admission.slot() as waited:
+            trace.add_stage("llm_queue", waited)
+            parts = []
+            # Includes the time the consumer spends between chunks
+            start = time.perf_counter()
+            stream, first = call_with_retry(open_stream, on_retry=lambda delay: trace.add_stage("llm_backoff", delay))
+            chunks = itertools.chain([first], stream) if first is not None else stream
+            for chunk in chunks:
+                text = chunk.content if hasattr(chunk, "content") else str(chunk)
+                if text:
+                    if not parts:
+                        trace.add_stage("llm_first_token", time.perf_counter() - start)
+                    parts.append(text)
+                    yield text
+            trace.add_stage("llm", time.perf_counter() - start)
+        answer = "".join(parts)
+        self._record_tokens(trace, prompt, answer)
+        return answer
 
-# Singleton instance
-hr_assistant = HRAssistant()
+# Singleton instance, created on first use rather than at import time
+_hr_assistant = None
+_hr_assistant_lock = threading.Lock()
 
 def get_assistant():
-    return hr_assistant
+    """Trả về assistant dùng chung, khởi tạo ở lần gọi đầu tiên (an toàn đa luồng)"""
+    global _hr_assistant
+    if _hr_assistant is None:
+        with _hr_assistant_lock:
+            if _hr_assistant is None:
+                _hr_assistant = HRAssistant()
+                REGISTRY.add_collector(_hr_assistant.collect_metrics)
+    return _hr_assistant
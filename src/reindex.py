@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Blue/green rebuild of a collection without downtime.
+
+The documents are embedded into a new versioned collection
+(<alias>__v<timestamp>) while assistants keep serving the current one. The
+new collection is validated (row count against the ingest manifest, no
+large shrink compared to the live collection, a smoke query), then the alias
+is flipped in a single statement. Running assistants follow the alias on
+their next version poll (CACHE_VERSION_CHECK_SECONDS), without a restart.
+Versions beyond --keep are deleted; the previous one is kept for rollback
+and for requests still running on it.
+
+Usage:
+    python reindex.py                      # rebuild, validate, flip, clean up
+    python reindex.py --status             # alias target and stored versions
+    python reindex.py --rollback           # point the alias back at the previous version
+"""
+
+import sys
+import time
+import argparse
+
+from db_utils import (
+    init_database,
+    get_vector_store,
+    delete_collection,
+    collection_exists,
+    list_collections,
+    count_collection_rows,
+    resolve_collection,
+    set_collection_alias,
+    AliasResolutionError,
+)
+from embedding_models import get_embeddings
+from ingest import (
+    ingest_files,
+    load_manifest,
+    reset_manifest,
+    reset_checkpoint,
+    BATCH_SIZE,
+    QUEUE_DEPTH,
+    WRITER,
+    COLLECTION_NAME,
+    DATA_PATH,
+)
+
+# Question used to check that a rebuilt collection answers retrieval queries
+SMOKE_QUESTION = "Chính sách nghỉ phép của công ty là gì?"
+
+# Largest drop in row count, relative to the live collection, accepted without --allow-shrink
+MAX_SHRINK = 0.2
+
+# Versions kept at least: the live one and the one it replaced, which running
+# assistants keep querying until their next alias poll (CACHE_VERSION_CHECK_SECONDS)
+MIN_KEEP = 2
+
+def version_name(alias):
+    return f"{alias}__v{time.strftime('%Y%m%d%H%M%S')}"
+
+def list_versions(alias):
+    """Stored collections of an alias, oldest first; an unversioned collection named like the alias comes first"""
+    names = list_collections()
+    versions = sorted(name for name in names if name.startswith(f"{alias}__v"))
+    return ([alias] if alias in names else []) + versions
+
+def expected_rows(collection_name):
+    """Chunks the ingest manifest says were stored (near-duplicates are not)"""
+    manifest = load_manifest(collection_name)
+    return sum(
+        len(entry.get("chunk_ids", [])) - len(entry.get("duplicates", {}))
+        for entry in manifest["files"].values()
+    )
+
+def validate(collection_name, live_rows=None, max_shrink=MAX_SHRINK, question=SMOKE_QUESTION):
+    """Return a list of problems with a rebuilt collection (empty if it can go live)"""
+    problems = []
+    rows = count_collection_rows(collection_name)
+    expected = expected_rows(collection_name)
+    print(f"Rows: {rows} stored, {expected} expected from the manifest, {live_rows} in the live collection")
+    if not rows:
+        problems.append("the collection is empty")
+    elif rows != expected:
+        problems.append(f"{rows} rows stored but the manifest lists {expected}")
+    if rows and live_rows and rows < live_rows * (1 - max_shrink):
+        problems.append(f"{rows} rows is more than {max_shrink:.0%} below the live collection ({live_rows})")
+
+    start = time.perf_counter()
+    docs = get_vector_store(collection_name, embedding_function=get_embeddings()).similarity_search(question, k=3)
+    print(f"Smoke query: {len(docs)} chunks in {(time.perf_counter() - start) * 1000:.0f} ms")
+    if not docs:
+        problems.append("the smoke query returned no chunks")
+    return problems
+
+def drop_version(collection_name):
+    delete_collection(collection_name)
+    reset_manifest(collection_name)
+    reset_checkpoint(collection_name)
+    print(f"Deleted collection {collection_name}")
+
+def garbage_collect(alias, keep=MIN_KEEP, previous=None):
+    """Delete all but the live collection, the one it replaced and the keep most recent versions"""
+    keep = max(keep, MIN_KEEP)
+    target = resolve_collection(alias)
+    versions = list_versions(alias)
+    retained = set(versions[-keep:]) | {target} | ({previous} if previous else set())
+    for name in versions:
+        if name not in retained:
+            drop_version(name)
+    return sorted(retained)
+
+def reindex(alias=COLLECTION_NAME, data_path=DATA_PATH, keep=MIN_KEEP, max_shrink=MAX_SHRINK, question=SMOKE_QUESTION,
+            batch_size=BATCH_SIZE, queue_depth=QUEUE_DEPTH, writer=WRITER, keep_failed=False):
+    """Build, validate and switch to a new version of a collection; returns its name or None"""
+    init_database()
+    live = resolve_collection(alias)
+    live_rows = count_collection_rows(live) if collection_exists(live) else None
+    new = version_name(alias)
+    print(f"Building {new} (live: {live})")
+
+    start = time.perf_counter()
+    ingest_files(
+        collection_name=new,
+        data_path=data_path,
+        incremental=False,
+        batch_size=batch_size,
+        queue_depth=queue_depth,
+        writer=writer,
+    )
+    print(f"Built {new} in {time.perf_counter() - start:.1f}s")
+
+    problems = validate(new, live_rows, max_shrink, question)
+    if problems:
+        for problem in problems:
+            print(f"Validation failed: {problem}")
+        if not keep_failed:
+            drop_version(new)
+        print(f"Alias {alias} still points to {live}")
+        return None
+
+    previous = set_collection_alias(alias, new) or live
+    print(f"Alias {alias} -> {new} (was {previous})")
+    garbage_collect(alias, keep, previous=previous)
+    return new
+
+def rollback(alias=COLLECTION_NAME):
+    """Point the alias at the version before the live one"""
+    live = resolve_collection(alias)
+    versions = list_versions(alias)
+    position = versions.index(live) if live in versions else len(versions)
+    if position == 0:
+        print(f"No earlier version of {alias} to roll back to")
+        return None
+    set_collection_alias(alias, versions[position - 1])
+    print(f"Alias {alias} -> {versions[position - 1]} (was {live})")
+    return versions[position - 1]
+
+def print_status(alias=COLLECTION_NAME):
+    live = resolve_collection(alias)
+    print(f"Alias {alias} -> {live}")
+    for name in list_versions(alias):
+        marker = "*" if name == live else " "
+        print(f" {marker} {name}: {count_collection_rows(name)} rows")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild a collection into a new version and switch to it without downtime")
+    parser.add_argument("--alias", default=COLLECTION_NAME, help="Alias resolved by the assistant")
+    parser.add_argument("--keep", type=int, default=MIN_KEEP,
+                        help=f"Versions kept after the switch, the live one included (at least {MIN_KEEP})")
+    parser.add_argument("--allow-shrink", action="store_true", help="Accept a collection much smaller than the live one")
+    parser.add_argument("--smoke-question", default=SMOKE_QUESTION)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--queue-depth", type=int, default=QUEUE_DEPTH)
+    parser.add_argument("--writer", choices=["orm", "copy"], default=WRITER)
+    parser.add_argument("--keep-failed", action="store_true", help="Keep a collection that failed validation for inspection")
+    parser.add_argument("--status", action="store_true", help="Show the alias target and stored versions")
+    parser.add_argument("--rollback", action="store_true", help="Point the alias at the previous version")
+    args = parser.parse_args()
+    if args.keep < MIN_KEEP:
+        parser.error(f"--keep must be at least {MIN_KEEP}: assistants still query the replaced version until their next poll")
+
+    try:
+        if args.status:
+            print_status(args.alias)
+        elif args.rollback:
+            sys.exit(0 if rollback(args.alias) else 1)
+        else:
+            new = reindex(
+                alias=args.alias,
+                keep=args.keep,
+                max_shrink=1.0 if args.allow_shrink else MAX_SHRINK,
+                question=args.smoke_question,
+                batch_size=args.batch_size,
+                queue_depth=args.queue_depth,
+                writer=args.writer,
+                keep_failed=args.keep_failed,
+            )
+            sys.exit(0 if new else 1)
+    except AliasResolutionError as e:
+        sys.exit(str(e))
@@ -115,12 +115,60 @@ def create_pgvector_extension(dbname):
             print("Or install from source: https://github.com/pgvector/pgvector#installation")
             return False
 
+def create_vector_index(args):
+    """Create or rebuild the ANN index on the embedding table"""
+    # Imported lazily: db_utils pulls in LangChain, which plain setup does not need
+    from db_utils import migrate_storage_mode
+
+    report = migrate_storage_mode(
+        mode=args.storage,
+        drop_full_index=args.drop_full_index,
+        method=args.index_type,
+        m=args.hnsw_m,
+        ef_construction=args.hnsw_ef_construction,
+        lists=args.ivfflat_lists,
+        rebuild=args.rebuild_index,
+    )
+    info = report["index"]
+    print(f"Index: {info['definition']}")
+    print(f"Index size: {info['size_bytes'] / 2**20:.1f} MiB, build time: {info['build_seconds']:.1f}s")
+    print(f"Table size: {report['table_bytes'] / 2**20:.1f} MiB ({report['rows']} rows, full vectors kept)")
+    if args.drop_full_index and args.storage != 'vector':
+        print("Dropped the float32 index; set STORAGE_MODE so queries use the compact one")
+    return True
+
+def create_text_search_index():
+    """Create the full-text (GIN) index used by hybrid retrieval"""
+    from db_utils import create_text_search_index as build_index
+
+    if not build_index():
+        print("Failed to create the text search index")
+        return False
+    print("Text search index is ready")
+    return True
+
 def main():
     """Main function"""
     parser = argparse.ArgumentParser(description='Setup PostgreSQL with pgvector for HR Assistant')
     parser.add_argument('--dbname', default=os.getenv('POSTGRES_DBNAME', 'hr_assistant'), help='Database name')
+    parser.add_argument('--create-index', action='store_true', help='Create the ANN index on stored embeddings and exit')
+    parser.add_argument('--rebuild-index', action='store_true', help='Drop and rebuild the ANN index if it exists')
+    parser.add_argument('--index-type', choices=['hnsw', 'ivfflat'], default=os.getenv('VECTOR_INDEX_TYPE', 'hnsw'), help='ANN index type')
+    parser.add_argument('--hnsw-m', type=int, default=int(os.getenv('HNSW_M', '16')), help='HNSW: max connections per layer')
+    parser.add_argument('--hnsw-ef-construction', type=int, default=int(os.getenv('HNSW_EF_CONSTRUCTION', '64')), help='HNSW: candidate list size during build')
+    parser.add_argument('--storage', choices=['vector', 'halfvec', 'binary'], default=os.getenv('STORAGE_MODE', 'vector'), help='What the index stores: float32, float16 or binary-quantized vectors (expression indexes; the table keeps float32)')
+    parser.add_argument('--drop-full-index', action='store_true', help='With --storage halfvec/binary, drop the float32 index afterwards')
+    parser.add_argument('--ivfflat-lists', type=int, default=int(os.getenv('IVFFLAT_LISTS', '100')), help='IVFFlat: number of lists (about rows / 1000)')
+    parser.add_argument('--create-text-index', action='store_true', help='Create the full-text index for RETRIEVER=hybrid and exit')
     args = parser.parse_args()
     
+    if args.create_index or args.rebuild_index:
+        create_vector_index(args)
+        return
+    if args.create_text_index:
+        create_text_search_index()
+        return
+    
     current_user = getpass.getuser()
     
     # Check if PostgreSQL is installed
@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import logging
+import threading
+import contextlib
+import contextvars
+
+from dotenv import load_dotenv
+
+# Tải biến môi trường
+load_dotenv()
+
+# One JSON object per answered question is appended here
+TRACE_LOG_PATH = os.getenv(
+    "TRACE_LOG_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs", "trace.jsonl"),
+)
+TRACE_LOG_ENABLED = os.getenv("TRACE_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Histogram buckets (seconds) shared by the latency metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger(__name__)
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in items]
+
+class Gauge(Counter):
+    """Value that is set rather than accumulated (sizes, hit rates)"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, ([*series[0]], series[1], series[2])) for key, series in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels + ("le",), key + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Metrics of this process; collectors refresh gauges right before rendering"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        """Text exposition format served by GET /metrics"""
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.counter("hr_assistant_requests_total", "Questions handled, by outcome", ("outcome",))
+REQUEST_SECONDS = REGISTRY.histogram("hr_assistant_request_seconds", "End-to-end time per question", ("outcome",))
+STAGE_SECONDS = REGISTRY.histogram("hr_assistant_stage_seconds", "Time spent in each request stage", ("stage",))
+TOKENS = REGISTRY.counter("hr_assistant_llm_tokens_total", "Approximate LLM tokens", ("kind",))
+RETRIEVED_CHUNKS = REGISTRY.histogram(
+    "hr_assistant_retrieved_chunks", "Chunks returned by retrieval per question", buckets=(0, 1, 2, 3, 5, 8, 13, 21)
+)
+CACHE_HIT_RATE = REGISTRY.gauge("hr_assistant_cache_hit_rate", "Hit rate of each cache tier", ("cache",))
+CACHE_SIZE = REGISTRY.gauge("hr_assistant_cache_entries", "Entries held by each cache tier", ("cache",))
+POOL_CONNECTIONS = REGISTRY.gauge("hr_assistant_db_pool_connections", "Database pool connections by state", ("state",))
+POOL_WAIT_SECONDS = REGISTRY.histogram("hr_assistant_db_pool_wait_seconds", "Wait for a pooled database connection")
+LLM_QUEUE_SECONDS = REGISTRY.histogram("hr_assistant_llm_queue_seconds", "Wait for an LLM call slot")
+LLM_CALLS = REGISTRY.gauge("hr_assistant_llm_calls", "LLM calls running or waiting for a slot", ("state",))
+LLM_REJECTED = REGISTRY.counter("hr_assistant_llm_rejected_total", "LLM calls refused by admission control", ("reason",))
+LLM_RETRIES = REGISTRY.counter("hr_assistant_llm_retries_total", "LLM calls retried after a rate-limit error")
+COALESCED = REGISTRY.counter("hr_assistant_coalesced_total", "Questions answered by an identical in-flight request")
+
+# Trace of the request being handled by the current thread/task
+_current_trace = contextvars.ContextVar("hr_assistant_trace", default=None)
+# Last finished trace per thread, for the Streamlit debug panel
+_local = threading.local()
+
+_trace_logger = None
+_trace_logger_lock = threading.Lock()
+
+def _get_trace_logger():
+    """Logger writing bare JSON lines to TRACE_LOG_PATH, created on first use"""
+    global _trace_logger
+    if _trace_logger is None:
+        with _trace_logger_lock:
+            if _trace_logger is None:
+                os.makedirs(os.path.dirname(TRACE_LOG_PATH), exist_ok=True)
+                handler = logging.FileHandler(TRACE_LOG_PATH, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                trace_logger = logging.getLogger("hr_assistant.trace")
+                trace_logger.setLevel(logging.INFO)
+                trace_logger.addHandler(handler)
+                trace_logger.propagate = False
+                _trace_logger = trace_logger
+    return _trace_logger
+
+class Trace:
+    """Timings and attributes of one question, written as a JSON line when finished"""
+
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = attributes
+        self.stages = {}
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.record = None
+
+    def add_stage(self, stage, seconds):
+        """Add time to a stage; a stage entered several times accumulates"""
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000.0
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(stage, time.perf_counter() - start)
+
+    def set(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Make this the current trace, so stages recorded deeper in the call stack land here.
+
+        Must not span a yield: the context variable is reset in the same
+        context it was set in.
+        """
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    def finish(self, outcome, error=None):
+        """Record metrics, append the JSON line and remember it as this thread's last trace"""
+        if self.record is not None:
+            return self.record
+        elapsed = time.perf_counter() - self._start
+        with self._lock:
+            self.record = {
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+                "outcome": outcome,
+                "total_ms": elapsed * 1000.0,
+                "stages_ms": dict(self.stages),
+                **self.attributes,
+            }
+            if error is not None:
+                self.record["error"] = f"{type(error).__name__}: {error}"
+        REQUESTS.inc(outcome=outcome)
+        REQUEST_SECONDS.observe(elapsed, outcome=outcome)
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if self.record.get(kind):
+                TOKENS.inc(self.record[kind], kind=kind.split("_")[0])
+        if "retrieved_chunks" in self.record:
+            RETRIEVED_CHUNKS.observe(self.record["retrieved_chunks"])
+        _local.last_trace = self.record
+        if TRACE_LOG_ENABLED:
+            try:
+                _get_trace_logger().info(json.dumps(self.record, ensure_ascii=False, default=str))
+            except Exception as e:
+                logger.warning(f"Could not write trace: {str(e)}")
+        return self.record
+
+def current_trace():
+    return _current_trace.get()
+
+def record_stage(stage, seconds):
+    """Add time to a stage of the current trace, if any (used by lower layers such as db_utils)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+@contextlib.contextmanager
+def trace_stage(stage):
+    """Time a block as a stage of the current trace; a no-op outside a traced request"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.stage(stage):
+        yield
+
+def last_trace():
+    """Last finished trace of the calling thread (the Streamlit session's script thread)"""
+    return getattr(_local, "last_trace", None)
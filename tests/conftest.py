@@ -0,0 +1,55 @@
+import os
+import re
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+# The application modules live flat in src/ and import each other by name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# Behaviour tests run on the in-repo backends: memory-mapped vector store and stub LLM.
+# Set before any application module reads them at import.
+os.environ["VECTOR_STORE"] = "local"
+os.environ["LLM_BACKEND"] = "stub"
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+class HashEmbeddings(Embeddings):
+    """Bag of hashed words: texts sharing words are close, and no model is loaded"""
+
+    def __init__(self, dim=32):
+        self.dim = dim
+        self.documents_embedded = 0
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        self.documents_embedded += len(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+@pytest.fixture
+def embeddings():
+    return HashEmbeddings()
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch, embeddings):
+    """Data, manifest, checkpoint and vector store directories under tmp_path"""
+    import ingest
+    import local_store
+
+    data = tmp_path / "data"
+    data.mkdir()
+    monkeypatch.setattr(local_store, "LOCAL_STORE_PATH", str(tmp_path / "vectors"))
+    monkeypatch.setattr(ingest, "MANIFEST_DIR", str(tmp_path / "manifests"))
+    monkeypatch.setattr(ingest, "CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(ingest, "get_embeddings", lambda: embeddings)
+    return data
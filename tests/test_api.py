@@ -0,0 +1,81 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+import main
+from llm import StubChatModel
+from local_store import LocalVectorStore
+
+DOCUMENTS = [
+    ("Nhân viên được nghỉ phép 12 ngày mỗi năm.", "Quy định"),
+    ("Công ty đóng bảo hiểm sức khỏe cho nhân viên.", "Phúc lợi"),
+]
+
+@pytest.fixture
+def assistant(workspace, embeddings, monkeypatch):
+    """Assistant over a local collection, answering with the stub LLM without delays"""
+    texts = [text for text, _ in DOCUMENTS]
+    metadatas = [{"category": category} for _, category in DOCUMENTS]
+    LocalVectorStore("hr_documents", embedding_function=embeddings).add_texts(texts, metadatas=metadatas)
+    assistant = main.HRAssistant(embeddings=embeddings, llm=StubChatModel(latency=0.0, token_delay=0.0))
+    monkeypatch.setattr(main, "_hr_assistant", assistant)
+    monkeypatch.setattr(api, "_warmup", {"done": False, "error": None, "timings": {}})
+    return assistant
+
+@pytest.fixture
+def client(assistant):
+    with TestClient(api.app) as client:
+        yield client
+
+def test_ask_answers_from_the_retrieved_documents(client):
+    response = client.post("/ask", json={"question": "Nghỉ phép bao nhiêu ngày?"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["answer"].startswith("[stub]")
+    assert "phép" in body["answer"]
+    assert body["elapsed_ms"] >= 0
+
+def test_category_limits_the_documents(client):
+    response = client.post("/ask", json={"question": "Nghỉ phép bao nhiêu ngày?", "category": "Phúc lợi"})
+    assert response.status_code == 200
+    assert "bảo hiểm" in response.json()["answer"]
+    assert "phép" not in response.json()["answer"]
+
+def test_stream_returns_the_same_answer(client):
+    question = {"question": "Công ty có đóng bảo hiểm không?"}
+    streamed = client.post("/ask/stream", json=question)
+    assert streamed.status_code == 200
+    assert streamed.headers["content-type"].startswith("text/plain")
+    assert streamed.text == client.post("/ask", json=question).json()["answer"]
+
+def test_invalid_request_is_rejected(client):
+    assert client.post("/ask", json={"category": "Quy định"}).status_code == 422
+
+def test_timed_out_request_releases_its_slot_when_the_worker_returns(assistant, monkeypatch):
+    monkeypatch.setattr(api, "REQUEST_TIMEOUT", 0.05)
+    assistant.setup_qa_chain(StubChatModel(latency=0.3, token_delay=0.0))
+    with TestClient(api.app) as client:
+        response = client.post("/ask", json={"question": "Nghỉ phép bao nhiêu ngày?"})
+        assert response.status_code == 504
+        assert api._slots._value == api.MAX_CONCURRENCY - 1
+        time.sleep(0.5)
+        assert api._slots._value == api.MAX_CONCURRENCY
+
+def test_health_readiness_and_metrics(client):
+    health = client.get("/healthz")
+    assert health.status_code == 200
+    assert health.json()["ok"] is True
+
+    deadline = time.monotonic() + 5
+    while client.get("/readyz").status_code != 200 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    ready = client.get("/readyz")
+    assert ready.status_code == 200
+    assert "warmup_encode" in ready.json()["timings"]
+
+    client.post("/ask", json={"question": "Nghỉ phép bao nhiêu ngày?"})
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain")
@@ -0,0 +1,66 @@
+import time
+
+import numpy as np
+
+from cache import AnswerCache, CachedEmbeddings, SemanticCache, TTLCache, MISSING
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+def test_first_version_check_keeps_answers():
+    cache = AnswerCache()
+    assert cache.check_version("v1") is False
+    assert cache.invalidations == 0
+
+def test_version_change_clears_both_tiers():
+    cache = AnswerCache(semantic_threshold=0.9)
+    cache.check_version("v1")
+    key = cache.make_key("Nghỉ phép bao nhiêu ngày?")
+    cache.set(key, np.array([1.0, 0.0]), "12 ngày")
+    assert cache.get_exact(key) == "12 ngày"
+    assert cache.check_version("v1") is False
+    assert cache.check_version("v2") is True
+    assert cache.get_exact(key) is MISSING
+    assert cache.get_semantic(np.array([1.0, 0.0])) is MISSING
+
+def test_unversioned_collection_getting_a_version_clears_answers():
+    cache = AnswerCache()
+    cache.check_version(None)
+    key = cache.make_key("q")
+    cache.set(key, None, "stale")
+    assert cache.check_version("v1") is True
+    assert cache.get_exact(key) is MISSING
+
+def test_answers_are_scoped():
+    cache = AnswerCache(semantic_threshold=0.9)
+    vector = np.array([0.0, 1.0])
+    cache.set(cache.make_key("q", "leave"), vector, "leave answer", scope="leave")
+    assert cache.get_exact(cache.make_key("q", "pay")) is MISSING
+    assert cache.get_semantic(vector, scope="pay") is MISSING
+    assert cache.get_semantic(vector, scope="leave") == "leave answer"
+    # Normalization: case and whitespace do not matter
+    assert cache.get_exact(cache.make_key("  Q ", "leave")) == "leave answer"
+
+def test_query_embeddings_share_the_normalized_key():
+    class Counting:
+        calls = 0
+        def embed_query(self, text):
+            Counting.calls += 1
+            return [1.0, 0.0]
+    embeddings = CachedEmbeddings(Counting(), TTLCache(ttl=60))
+    embeddings.embed_query("Nghỉ phép bao nhiêu ngày?")
+    embeddings.embed_query("  nghỉ phép   bao nhiêu ngày ")
+    assert Counting.calls == 1
+
+def test_expired_semantic_entry_does_not_hide_a_live_one():
+    cache = SemanticCache(threshold=0.9, ttl=60)
+    cache.set(np.array([1.0, 0.0]), "expired")
+    cache.set(np.array([0.96, 0.28]), "live")
+    cache._expires[0] = time.monotonic() - 1
+    assert cache.get(np.array([1.0, 0.0])) == "live"
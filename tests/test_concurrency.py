@@ -0,0 +1,151 @@
+import time
+import threading
+
+import pytest
+
+from concurrency import AdmissionLimiter, SingleFlight, OverloadedError, Abandoned, call_with_retry, is_rate_limited
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return threads
+
+def test_limiter_bounds_calls_in_flight():
+    limiter = AdmissionLimiter(max_inflight=2, max_queue=10, timeout=5)
+    lock = threading.Lock()
+    running = []
+    peak = [0]
+
+    def call():
+        with limiter.slot():
+            with lock:
+                running.append(1)
+                peak[0] = max(peak[0], len(running))
+            time.sleep(0.02)
+            with lock:
+                running.pop()
+
+    run_threads(8, call)
+    assert peak[0] == 2
+    assert limiter.stats()["admitted"] == 8
+    assert limiter.stats()["running"] == 0
+
+def test_limiter_rejects_when_the_queue_is_full():
+    limiter = AdmissionLimiter(max_inflight=1, max_queue=0, timeout=5)
+    with limiter.slot():
+        with pytest.raises(OverloadedError):
+            with limiter.slot():
+                pass
+    assert limiter.stats()["rejected"] == 1
+    with limiter.slot():
+        pass
+
+def test_limiter_rejects_after_the_queue_timeout():
+    limiter = AdmissionLimiter(max_inflight=1, max_queue=5, timeout=0.05)
+    release = threading.Event()
+
+    def hold():
+        with limiter.slot():
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    while limiter.stats()["running"] == 0:
+        time.sleep(0.001)
+    with pytest.raises(OverloadedError):
+        with limiter.slot():
+            pass
+    release.set()
+    holder.join()
+    assert limiter.stats()["waiting"] == 0
+
+def test_single_flight_shares_one_call():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    leader = threading.Thread(target=lambda: results.append(flights.do("q", fn)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flights.do("q", fn))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    while flights.coalesced < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results) == [("answer", False)] + [("answer", True)] * 3
+    # The key is free again once the flight finished
+    assert flights.do("q", lambda: "again") == ("again", False)
+
+def test_single_flight_shares_errors():
+    flights = SingleFlight()
+    flight, leader = flights.begin("q")
+    follower, is_leader = flights.begin("q")
+    assert leader and not is_leader and follower is flight
+    flights.finish("q", flight, error=ValueError("boom"))
+    with pytest.raises(ValueError):
+        SingleFlight.wait(follower)
+
+def test_follower_retries_when_the_leader_abandons():
+    flights = SingleFlight()
+    flight, _ = flights.begin("q")
+    results = []
+    follower = threading.Thread(target=lambda: results.append(flights.do("q", lambda: "own")))
+    follower.start()
+    while flights.coalesced < 1:
+        time.sleep(0.001)
+    flights.finish("q", flight, error=Abandoned())
+    follower.join(5)
+    assert results == [("own", False)]
+
+class RateLimitError(Exception):
+    pass
+
+def test_call_with_retry_retries_rate_limits_only():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimitError("429 Too Many Requests")
+        return "ok"
+
+    delays = []
+    assert call_with_retry(flaky, retries=3, base_delay=0.0, on_retry=delays.append) == "ok"
+    assert len(attempts) == 3 and len(delays) == 2
+
+    def broken():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    attempts.clear()
+    with pytest.raises(ValueError):
+        call_with_retry(broken, retries=3, base_delay=0.0)
+    assert len(attempts) == 1
+
+def test_call_with_retry_gives_up_after_the_retries():
+    def limited():
+        raise RateLimitError("rate limit exceeded")
+
+    with pytest.raises(RateLimitError):
+        call_with_retry(limited, retries=2, base_delay=0.0)
+
+def test_is_rate_limited():
+    assert is_rate_limited(RateLimitError("slow down"))
+    assert is_rate_limited(RuntimeError("429 Resource has been exhausted"))
+    assert not is_rate_limited(RuntimeError("500 internal error"))
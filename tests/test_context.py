@@ -0,0 +1,50 @@
+from langchain_core.documents import Document
+
+from context import pack_context, estimate_tokens
+
+def docs(*texts):
+    return [Document(page_content=text) for text in texts]
+
+def test_overlapping_sentences_are_dropped():
+    context, stats = pack_context(
+        docs(
+            "Nhân viên được nghỉ phép 12 ngày mỗi năm. Phép năm được cộng dồn tối đa 5 ngày.",
+            "Phép năm được cộng dồn tối đa 5 ngày. Nghỉ ốm cần giấy xác nhận của bác sĩ.",
+        ),
+        "Phép năm được cộng dồn bao nhiêu ngày?",
+        token_budget=1000,
+    )
+    assert context.count("cộng dồn tối đa 5 ngày") == 1
+    assert stats["duplicates_dropped"] == 1
+    assert stats["sentences_kept"] == 3
+
+def test_budget_keeps_the_most_relevant_sentences_in_reading_order():
+    relevant = "Lương tháng mười ba được trả vào tháng một."
+    context, stats = pack_context(
+        docs(
+            "Văn phòng mở cửa từ tám giờ sáng. " + relevant,
+            "Bãi gửi xe nằm ở tầng hầm B2 của tòa nhà.",
+        ),
+        "Khi nào trả lương tháng mười ba?",
+        token_budget=estimate_tokens(relevant) + 2,
+    )
+    assert context == relevant
+    assert stats["packed_tokens"] <= estimate_tokens(relevant) + 2
+    assert stats["tokens_saved"] > 0
+
+def test_a_sentence_longer_than_the_budget_is_cut():
+    context, _ = pack_context(docs("Quy định " * 100), "quy định", token_budget=10)
+    assert 0 < estimate_tokens(context) <= 10
+
+def test_short_sentences_are_not_dropped_for_being_contained():
+    context, stats = pack_context(
+        docs("Nhân viên được nghỉ phép theo Điều 5 của quy chế.", "Điều 5\nPhép năm là 12 ngày."),
+        "Điều 5 quy định gì?",
+        token_budget=1000,
+    )
+    assert "Điều 5 Phép năm" in context
+    assert stats["duplicates_dropped"] == 0
+
+def test_tokens_saved_is_never_negative():
+    _, stats = pack_context(docs("Ngắn.", "Một đoạn dài hơn nhiều " * 20), "đoạn dài", token_budget=1000, baseline_k=1)
+    assert stats["tokens_saved"] == 0
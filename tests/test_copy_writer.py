@@ -0,0 +1,47 @@
+import io
+import json
+import re
+
+from db_utils import BulkVectorWriter, _CopyStream, _copy_escape
+
+# COPY text format escapes, as PostgreSQL reads them back
+_UNESCAPE = {"\\\\": "\\", "\\t": "\t", "\\n": "\n", "\\r": "\r"}
+
+def parse_copy_field(field):
+    if field == "\\N":
+        return None
+    return re.sub(r"\\[\\tnr]", lambda match: _UNESCAPE[match.group(0)], field)
+
+def copy_rows(texts, embeddings, metadatas, ids, read_size=7):
+    writer = BulkVectorWriter("docs")
+    writer._collection_id = "collection-uuid"
+    stream = io.BufferedReader(_CopyStream(writer._rows(texts, embeddings, metadatas, ids)), buffer_size=read_size)
+    data = b""
+    while True:
+        chunk = stream.read(read_size)
+        if not chunk:
+            break
+        data += chunk
+    lines = data.decode("utf-8").split("\n")
+    assert lines[-1] == ""
+    return [line.split("\t") for line in lines[:-1]]
+
+def test_special_characters_survive_the_round_trip():
+    text = "Điều 5:\tnghỉ phép\r\n12 ngày \\ năm \\N"
+    metadata = {"source": "C:\\hr\\quy định.txt", "category": "Quy\tđịnh"}
+    rows = copy_rows([text, "plain"], [[0.5, -1.0], [0.0, 2.0]], [metadata, {}], ["id\n1", "id-2"])
+
+    assert len(rows) == 2
+    assert all(len(row) == 6 for row in rows)
+    _, collection_id, embedding, document, cmetadata, custom_id = rows[0]
+    assert collection_id == "collection-uuid"
+    assert embedding == "[0.5,-1.0]"
+    assert parse_copy_field(document) == text
+    assert json.loads(parse_copy_field(cmetadata)) == metadata
+    assert parse_copy_field(custom_id) == "id\n1"
+    assert parse_copy_field(rows[1][3]) == "plain"
+
+def test_none_is_written_as_null():
+    assert _copy_escape(None) == "\\N"
+    # A literal backslash-N in text is escaped, so it is not read back as NULL
+    assert parse_copy_field(_copy_escape("\\N")) == "\\N"
@@ -0,0 +1,45 @@
+from collections import namedtuple
+
+from dedup import ChunkDeduplicator, MinHasher, encode_signature, decode_signature
+
+# Same fields as ingest.Chunk (ingest itself needs the embedding stack)
+Chunk = namedtuple("Chunk", ["id", "text", "metadata", "source", "index"])
+
+POLICY = (
+    "Nhân viên chính thức được nghỉ phép mười hai ngày mỗi năm, cộng thêm một ngày "
+    "cho mỗi năm năm làm việc, theo quy định của công ty và Bộ luật Lao động."
+)
+
+def chunk(chunk_id, text, category, source, index=0):
+    return Chunk(chunk_id, text, {"category": category}, source, index)
+
+def test_near_duplicates_are_skipped_and_origins_recorded():
+    deduplicator = ChunkDeduplicator()
+    kept = list(deduplicator.filter([
+        chunk("a", POLICY, "leave", "leave/2023.txt"),
+        chunk("b", POLICY.replace("Nhân viên", "nhân  viên"), "leave", "leave/2024.txt"),
+        chunk("c", "Lương được trả vào ngày năm hằng tháng qua chuyển khoản.", "leave", "leave/pay.txt"),
+    ]))
+    assert [c.id for c in kept] == ["a", "c"]
+    assert deduplicator.stats() == {"chunks": 3, "kept": 2, "duplicates": 1}
+    assert deduplicator.matches[0].kept_id == "a"
+    assert deduplicator.origins() == {"a": ["leave/2023.txt", "leave/2024.txt"]}
+
+def test_copies_in_other_categories_are_kept():
+    deduplicator = ChunkDeduplicator()
+    kept = list(deduplicator.filter([
+        chunk("a", POLICY, "leave", "leave/policy.txt"),
+        chunk("b", POLICY, "benefits", "benefits/policy.txt"),
+    ]))
+    assert [c.id for c in kept] == ["a", "b"]
+
+def test_seeded_chunks_are_matched_within_their_category():
+    hasher = MinHasher()
+    deduplicator = ChunkDeduplicator()
+    deduplicator.seed("stored", decode_signature(encode_signature(hasher.signature(POLICY))), "leave")
+    kept = list(deduplicator.filter([
+        chunk("new-leave", POLICY, "leave", "leave/copy.txt"),
+        chunk("new-benefits", POLICY, "benefits", "benefits/copy.txt"),
+    ]))
+    assert [c.id for c in kept] == ["new-benefits"]
+    assert deduplicator.matches[0].kept_id == "stored"
@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+import ingest
+from local_store import LocalVectorStore
+
+def write(data, name, text):
+    path = data / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return path
+
+def run(data, **kwargs):
+    kwargs.setdefault("batch_size", 1)
+    return ingest.ingest_files(collection_name="docs", data_path=str(data), dedup=False, extract_workers=1, **kwargs)
+
+def stored_texts():
+    store = LocalVectorStore("docs")
+    return sorted(doc.page_content for doc, _ in store.similarity_search_with_score_by_vector([1.0] * 32, k=100))
+
+@pytest.fixture
+def files(workspace):
+    write(workspace, "quy-dinh/nghi-phep.txt", "Nhân viên được nghỉ phép 12 ngày mỗi năm.")
+    write(workspace, "phuc-loi/bao-hiem.txt", "Công ty đóng bảo hiểm sức khỏe cho nhân viên.")
+    write(workspace, "onboarding/ngay-dau.txt", "Ngày đầu tiên nhân viên nhận thẻ và máy tính.")
+    return workspace
+
+def test_plan_reports_new_touched_modified_and_removed_files(files):
+    manifest = ingest.empty_manifest(dedup=False)
+    changed, removed, unchanged = ingest.plan_incremental(manifest, str(files), dedup=False)
+    assert len(changed) == 3 and removed == [] and unchanged == 0
+
+    run(files)
+    manifest = ingest.load_manifest("docs")
+    assert ingest.plan_incremental(manifest, str(files), dedup=False) == ([], [], 3)
+
+    # Same content with a new mtime is unchanged; new content and a deleted file are not
+    touched = files / "phuc-loi/bao-hiem.txt"
+    os.utime(touched, (1, 1))
+    write(files, "quy-dinh/nghi-phep.txt", "Nhân viên được nghỉ phép 14 ngày mỗi năm.")
+    os.remove(files / "onboarding/ngay-dau.txt")
+    changed, removed, unchanged = ingest.plan_incremental(manifest, str(files), dedup=False)
+    assert [rel_path for rel_path, _, _, _ in changed] == [os.path.join("quy-dinh", "nghi-phep.txt")]
+    assert removed == [os.path.join("onboarding", "ngay-dau.txt")]
+    assert unchanged == 1
+    assert manifest["files"][os.path.join("phuc-loi", "bao-hiem.txt")]["mtime"] == 1
+
+def test_incremental_ingest_replaces_the_chunks_of_changed_files(files, embeddings):
+    run(files)
+    write(files, "quy-dinh/nghi-phep.txt", "Nhân viên được nghỉ phép 14 ngày mỗi năm.")
+    os.remove(files / "onboarding/ngay-dau.txt")
+    embedded = embeddings.documents_embedded
+    run(files)
+    assert embeddings.documents_embedded - embedded == 1
+    assert stored_texts() == [
+        "Công ty đóng bảo hiểm sức khỏe cho nhân viên.",
+        "Nhân viên được nghỉ phép 14 ngày mỗi năm.",
+    ]
+
+def interrupted_run(data, monkeypatch):
+    open_batch_writer = ingest.open_batch_writer
+
+    def failing_writer(*args, **kwargs):
+        write_batch, close = open_batch_writer(*args, **kwargs)
+        calls = []
+
+        def write_or_fail(*batch):
+            calls.append(batch)
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+            write_batch(*batch)
+
+        return write_or_fail, close
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ingest, "open_batch_writer", failing_writer)
+        with pytest.raises(RuntimeError):
+            run(data)
+
+def test_interrupted_ingest_resumes_after_the_last_committed_batch(files, embeddings, monkeypatch):
+    interrupted_run(files, monkeypatch)
+    assert ingest.load_checkpoint("docs")["committed_batches"] == 1
+    # Nothing is recorded until the run completes
+    assert ingest.load_manifest("docs")["files"] == {}
+
+    embedded = embeddings.documents_embedded
+    run(files)
+    # The committed batch is not embedded again, and no chunk is stored twice
+    assert embeddings.documents_embedded - embedded == 2
+    assert len(stored_texts()) == 3
+    assert ingest.load_checkpoint("docs") is None
+    assert len(ingest.load_manifest("docs")["files"]) == 3
+
+def test_checkpoint_of_a_different_plan_is_discarded(files, embeddings, monkeypatch):
+    interrupted_run(files, monkeypatch)
+    # The file committed before the interruption changes before the next run
+    write(files, "onboarding/ngay-dau.txt", "Ngày đầu tiên nhân viên gặp quản lý trực tiếp.")
+    embedded = embeddings.documents_embedded
+    run(files)
+    assert embeddings.documents_embedded - embedded == 3
+    assert stored_texts() == [
+        "Công ty đóng bảo hiểm sức khỏe cho nhân viên.",
+        "Ngày đầu tiên nhân viên gặp quản lý trực tiếp.",
+        "Nhân viên được nghỉ phép 12 ngày mỗi năm.",
+    ]
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from local_store import LocalVectorStore, compact
+
+@pytest.fixture
+def vectors():
+    return np.eye(4, dtype=np.float32)
+
+@pytest.fixture
+def store(tmp_path, vectors):
+    store = LocalVectorStore("docs", path=str(tmp_path))
+    store.add_embeddings(
+        ["leave policy", "salary", "sick leave"],
+        vectors[:3],
+        [{"category": "leave"}, {"category": "pay"}, {"category": "leave"}],
+        ["a", "b", "c"],
+    )
+    return store
+
+def texts(results):
+    return [doc.page_content for doc, _ in results]
+
+def test_search_orders_by_cosine_distance(store, vectors):
+    results = store.similarity_search_with_score_by_vector(vectors[1] + 0.1 * vectors[0], k=2)
+    assert texts(results) == ["salary", "leave policy"]
+    assert results[0][1] < results[1][1]
+
+def test_filter_is_applied_before_top_k(store, vectors):
+    results = store.similarity_search_with_score_by_vector(vectors[1], k=2, filter={"category": "leave"})
+    assert sorted(texts(results)) == ["leave policy", "sick leave"]
+    assert store.similarity_search_with_score_by_vector(vectors[1], k=2, filter={"category": "none"}) == []
+
+def test_upsert_replaces_the_earlier_row(store, vectors):
+    store.add_embeddings(["leave policy v2"], vectors[:1], [{"category": "leave"}], ["a"])
+    assert len(store) == 3
+    assert texts(store.similarity_search_with_score_by_vector(vectors[0], k=1)) == ["leave policy v2"]
+    assert store.row_counts() == (4, 3)
+
+def test_delete_hides_rows(store, vectors):
+    store.delete(["b"])
+    assert len(store) == 2
+    assert "salary" not in texts(store.similarity_search_with_score_by_vector(vectors[1], k=3))
+
+def test_update_metadata_merges_keys(store, vectors):
+    assert store.update_metadata({"c": {"origins": ["x.txt", "y.txt"]}, "missing": {"origins": []}}) == 1
+    doc, _ = store.similarity_search_with_score_by_vector(vectors[2], k=1)[0]
+    assert doc.metadata == {"category": "leave", "origins": ["x.txt", "y.txt"]}
+
+def test_other_store_objects_see_writes(store, tmp_path, vectors):
+    reader = LocalVectorStore("docs", path=str(tmp_path))
+    assert len(reader) == 3
+    store.add_embeddings(["bonus"], vectors[3:], [{"category": "pay"}], ["d"])
+    assert texts(reader.similarity_search_with_score_by_vector(vectors[3], k=1, filter={"category": "pay"})) == ["bonus"]
+
+def test_compact_drops_dead_rows_and_keeps_readers_working(store, tmp_path, vectors):
+    reader = LocalVectorStore("docs", path=str(tmp_path))
+    assert len(reader) == 3
+    store.update_metadata({"a": {"origins": ["x.txt"]}})
+    store.delete(["b"])
+    assert store.row_counts() == (4, 2)
+
+    assert compact("docs", path=str(tmp_path)) == 2
+    assert store.row_counts() == (2, 2)
+    results = reader.similarity_search_with_score_by_vector(vectors[0], k=3)
+    assert texts(results) == ["leave policy", "sick leave"]
+    assert results[0][0].metadata["origins"] == ["x.txt"]
+
+    # Writes after a compaction still replace the right rows
+    store.add_embeddings(["sick leave v2"], vectors[2:3], [{"category": "leave"}], ["c"])
+    assert len(reader) == 2
+    assert texts(reader.similarity_search_with_score_by_vector(vectors[2], k=1)) == ["sick leave v2"]
+
+def test_compact_skips_collections_below_the_ratio(store, tmp_path):
+    store.delete(["b"])
+    assert compact("docs", path=str(tmp_path), min_ratio=0.5) == 0
+    assert store.row_counts() == (3, 2)
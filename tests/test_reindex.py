@@ -0,0 +1,74 @@
+import itertools
+import os
+
+import pytest
+
+import main
+import reindex
+from db_utils import AliasResolutionError, collection_exists, resolve_collection, set_collection_alias
+from llm import StubChatModel
+
+@pytest.fixture
+def files(workspace, embeddings, monkeypatch):
+    (workspace / "nghi-phep.txt").write_text("Nhân viên được nghỉ phép 12 ngày mỗi năm.", encoding="utf-8")
+    (workspace / "bao-hiem.txt").write_text("Công ty đóng bảo hiểm sức khỏe cho nhân viên.", encoding="utf-8")
+    monkeypatch.setattr(reindex, "get_embeddings", lambda: embeddings)
+    # Versions are named by the second; number them so several builds fit in one test
+    counter = itertools.count(1)
+    monkeypatch.setattr(reindex, "version_name", lambda alias: f"{alias}__v{next(counter):03d}")
+    return workspace
+
+def build(data, **kwargs):
+    return reindex.reindex("docs", data_path=str(data), **kwargs)
+
+def test_a_name_without_alias_resolves_to_itself(workspace):
+    assert resolve_collection("docs") == "docs"
+    assert set_collection_alias("docs", "docs__v001") is None
+    assert resolve_collection("docs") == "docs__v001"
+
+def test_unreadable_aliases_raise_instead_of_guessing(workspace):
+    import local_store
+
+    os.makedirs(local_store.LOCAL_STORE_PATH)
+    with open(os.path.join(local_store.LOCAL_STORE_PATH, local_store.ALIASES_FILE), "w") as f:
+        f.write("{not json")
+    with pytest.raises(AliasResolutionError):
+        resolve_collection("docs", attempts=1)
+
+def test_reindex_flips_the_alias_and_keeps_the_replaced_version(files):
+    assert build(files) == "docs__v001"
+    assert resolve_collection("docs") == "docs__v001"
+    assert build(files) == "docs__v002"
+    assert resolve_collection("docs") == "docs__v002"
+    assert reindex.list_versions("docs") == ["docs__v001", "docs__v002"]
+
+    build(files)
+    # Only the live version and the one it replaced are kept
+    assert reindex.list_versions("docs") == ["docs__v002", "docs__v003"]
+    assert not collection_exists("docs__v001")
+
+def test_failed_validation_leaves_the_alias_alone(files):
+    build(files)
+    for path in files.iterdir():
+        path.unlink()
+    assert build(files) is None
+    assert resolve_collection("docs") == "docs__v001"
+    assert reindex.list_versions("docs") == ["docs__v001"]
+
+def test_rollback_points_the_alias_at_the_previous_version(files):
+    build(files)
+    build(files)
+    assert reindex.rollback("docs") == "docs__v001"
+    assert resolve_collection("docs") == "docs__v001"
+    assert reindex.rollback("docs") is None
+    assert resolve_collection("docs") == "docs__v001"
+
+def test_assistant_follows_the_alias(files, embeddings):
+    build(files)
+    assistant = main.HRAssistant("docs", embeddings=embeddings, llm=StubChatModel(latency=0.0, token_delay=0.0))
+    assert assistant.collection_name == "docs__v001"
+    (files / "nghi-phep.txt").write_text("Nhân viên được nghỉ phép 14 ngày mỗi năm.", encoding="utf-8")
+    build(files)
+    assistant.refresh_cache_version(force=True)
+    assert assistant.collection_name == "docs__v002"
+    assert "14" in assistant.ask("Nghỉ phép bao nhiêu ngày?")